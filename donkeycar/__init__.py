@@ -1,6 +1,6 @@
 __version__ = '2.1.3'
 
-from .parts import *
+from . import parts
 from .vehicle import Vehicle
 from .memory import Memory
 from . import utils
@@ -17,8 +17,6 @@ import socket
 import shutil
 import argparse
 
-from .tub import TubManager
-
 PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 TEMPLATES_PATH = os.path.join(PACKAGE_PATH, 'templates')
 
@@ -206,14 +204,46 @@ class MakeMovie(BaseCommand):
         
         return image # returns a 8-bit RGB array
 
+class ConvertTub(BaseCommand):
+
+    def parse_args(self, args):
+        parser = argparse.ArgumentParser(prog='converttub')
+        parser.add_argument('--tub', help='The tub to convert')
+        parser.add_argument('--out', help='The folder of the converted tub')
+        parsed_args = parser.parse_args(args)
+        return parsed_args, parser
+
+    def run(self, args):
+        '''
+        Copy a tub to a new tub in the segment format.
+        '''
+        from donkeycar.parts.stores.tub import convert_tub
+
+        args, parser = self.parse_args(args)
+
+        if args.tub is None or args.out is None:
+            parser.print_help()
+            return
+
+        tub = convert_tub(args.tub, args.out)
+        print('converted', tub.get_num_records(), 'records to', tub.path)
+
+
+def tub_manager():
+    #the tub manager is a tornado app, only import it when it is run
+    from .tub import TubManager
+    return TubManager()
+
+
 def execute_from_command_line():
     
     commands = {
             'createcar': CreateCar,
             'findcar': FindCar,
             'calibrate': CalibrateCar,
-            'tub': TubManager,
+            'tub': tub_manager,
             'makemovie': MakeMovie,
+            'converttub': ConvertTub,
             #'calibratesteering': CalibrateSteering,
                 }
     
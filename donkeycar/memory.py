@@ -6,12 +6,35 @@ Created on Sun Jun 25 11:07:48 2017
 @author: wroscoe
 """
 
+import operator
+import threading
+import time
+from functools import partial
+
+
+MISSING = object()
+
+
 class Memory:
     """
     A convenience class to save key/value pairs.
+
+    Each channel also has a version, incremented whenever the channel is
+    given a different object, and the time of that change. A value updated
+    in place is the same object, touch() counts it as a change. Threads can
+    block until a channel has a new version with wait().
+
+    Channels derived from a camera frame can be stamped with the time the
+    frame was captured, their origin, to trace latency through the parts.
     """
     def __init__(self, *args, **kw):
         self.d = {}
+        self.versions = {}
+        self.times = {}
+        self.origins = {}
+        self.clock = time.time
+        self.cond = threading.Condition()
+        self.waiting = 0
     
     def __setitem__(self, key, value):
         if type(key) is not tuple:
@@ -20,7 +43,7 @@ class Memory:
             value=(value,)
         
         for i, k in enumerate(key):
-            self.d[k] = value[i]
+            self._store(k, value[i])
         
     def __getitem__(self, key):
         if type(key) is tuple:
@@ -29,22 +52,80 @@ class Memory:
             return self.d[key]
         
     def update(self, new_d):
-        self.d.update(new_d)
+        for k, v in new_d.items():
+            self._store(k, v)
         
     def put(self, keys, inputs):
         if len(keys) > 1:
             for i, key in enumerate(keys):
                 try:
-                    self.d[key] = inputs[i]
+                    self._store(key, inputs[i])
                 except IndexError as e:
                     error = str(e) + ' issue with keys: ' + str(key)
                     raise IndexError(error)
         
         else:
-            self.d[keys[0]] = inputs
+            self._store(keys[0], inputs)
+
+    def _store(self, key, value):
+        old = self.d.get(key, MISSING)
+        self.d[key] = value
+        if value is not old:
+            self.touch(key)
+
+    def touch(self, key):
+        """
+        Count the channel as changed, for a value that was updated in place.
+        """
+        self.versions[key] = self.versions.get(key, 0) + 1
+        self.times[key] = self.clock()
+        if self.waiting:
+            with self.cond:
+                self.cond.notify_all()
+
+    def version(self, key):
+        """
+        Number of times the channel has changed, 0 if it was never set.
+        """
+        return self.versions.get(key, 0)
+
+    def changed_at(self, key):
+        """
+        Time the channel last changed, None if it was never set.
+        """
+        return self.times.get(key)
+
+    def stamp(self, keys, origin):
+        """
+        Record the capture time of the data the channels were derived from.
+        """
+        for k in keys:
+            self.origins[k] = origin
+
+    def origin(self, keys):
+        """
+        Oldest capture time the channels were derived from, None if none
+        of them were stamped.
+        """
+        times = [self.origins[k] for k in keys if k in self.origins]
+        return min(times) if times else None
+
+    def wait(self, key, version=0, timeout=None):
+        """
+        Block until the channel has a version newer than `version` and
+        return its value and version. Threaded parts can use this to wait
+        for new data instead of polling. On timeout the current value and
+        version are returned.
+        """
+        with self.cond:
+            self.waiting += 1
+            try:
+                self.cond.wait_for(lambda: self.versions.get(key, 0) > version,
+                                   timeout)
+            finally:
+                self.waiting -= 1
+        return self.get([key])[0], self.version(key)
 
-            
-            
     def get(self, keys):
         result = [self.d.get(k) for k in keys]
         return result
@@ -56,4 +137,276 @@ class Memory:
         return self.d.values()
     
     def iteritems(self):
-        return self.d.iteritems()
\ No newline at end of file
+        return self.d.iteritems()
+
+    def reader(self, key):
+        """
+        Return a function that reads one channel. Used by the drive loop
+        to look up channels once instead of on every loop.
+        """
+        self.d.setdefault(key, None)
+        return partial(operator.itemgetter(key), self.d)
+
+    def getter(self, keys):
+        """
+        Return a function that reads a list of channels as a tuple.
+        """
+        for k in keys:
+            self.d.setdefault(k, None)
+        if not keys:
+            return tuple
+        if len(keys) == 1:
+            read = self.reader(keys[0])
+            return lambda: (read(),)
+        return partial(operator.itemgetter(*keys), self.d)
+
+    def setter(self, keys, in_place=False):
+        """
+        Return a function that saves a part's outputs to a list of channels,
+        with the same rules as put. With in_place every output counts as a
+        change, even the object the channel already holds.
+        """
+        d, touch = self.d, self.touch
+        keys = list(keys)
+        if len(keys) == 1:
+            key = keys[0]
+            def put(value):
+                if in_place or value is not d.get(key, MISSING):
+                    d[key] = value
+                    touch(key)
+            return put
+
+        def put(values):
+            if len(values) < len(keys):
+                raise IndexError('{} outputs for keys: {}'.format(len(values), keys))
+            for key, value in zip(keys, values):
+                if in_place or value is not d.get(key, MISSING):
+                    d[key] = value
+                    touch(key)
+        return put
+
+    def change_detector(self, keys):
+        """
+        Return a function that tells if any of the channels changed since
+        it last returned True, or since it was created.
+        """
+        for k in keys:
+            self.versions.setdefault(k, 0)
+        read = partial(operator.itemgetter(*keys), self.versions)
+        last = [read()]
+        def changed():
+            versions = read()
+            if versions == last[0]:
+                return False
+            last[0] = versions
+            return True
+        return changed
+
+
+class SlotMemory(Memory):
+    """
+    Memory with a preallocated slot for each declared channel.
+
+    Scalars are packed in one float64 array and arrays are copied into
+    fixed shape buffers, so getting an array returns a view of its buffer
+    instead of a copy.
+    The buffers are allocated in shared memory and are inherited by
+    processes forked after the memory was created.
+
+    Every write to an array channel copies the array into its buffer and
+    counts as a change, as the buffer can't tell if a part updated the
+    array it returns in place. So on_change on an array channel runs a
+    part every time the channel is written, use the frame's timestamp to
+    tell new frames instead.
+
+    SlotMemory is slower than Memory, scripts/benchmark_loop.py --slots
+    measures it at about one and a half times the overhead per part, and
+    it doesn't allocate less: Memory only stores references to the values
+    the parts return. Use it to share channels with forked processes.
+
+    Channels that weren't declared are kept in a dict like Memory does.
+
+    Parameters
+    ----------
+        channels : dict
+            Maps channel names to 'float', 'int' or 'boolean' for scalars,
+            or to a shape or (shape, dtype) pair for arrays.
+
+    For example:
+
+    >>> mem = SlotMemory({'cam/image_array': (120, 160, 3),
+    ...                   'user/angle': 'float'})
+    >>> V = Vehicle(mem=mem)
+    """
+    SCALAR_TYPES = {'float': float, 'int': int, 'boolean': bool}
+
+    def __init__(self, channels=None, *args, **kw):
+        super(SlotMemory, self).__init__(*args, **kw)
+        import numpy as np
+        from multiprocessing import RawArray
+
+        channels = channels or {}
+        scalars = [k for k, v in channels.items() if v in self.SCALAR_TYPES]
+        arrays = [k for k in channels if k not in scalars]
+
+        self.scalar_ix = {k: i for i, k in enumerate(scalars)}
+        self.scalar_cast = [self.SCALAR_TYPES[channels[k]] for k in scalars]
+        #ctypes arrays are faster than numpy to index one item at a time,
+        #the numpy views are there for whole array operations
+        self.scalar_raw = RawArray('d', max(1, len(scalars)))
+        self.scalar_set_raw = RawArray('b', max(1, len(scalars)))
+        self.scalars = np.frombuffer(self.scalar_raw)
+        self.scalar_set = np.frombuffer(self.scalar_set_raw, dtype=np.bool_)
+
+        self.arrays = {}
+        for k in arrays:
+            spec = channels[k]
+            if len(spec) == 2 and isinstance(spec[0], (tuple, list)):
+                shape, dtype = tuple(spec[0]), np.dtype(spec[1])
+            else:
+                shape, dtype = tuple(spec), np.dtype('uint8')
+            size = int(np.prod(shape)) * dtype.itemsize
+            buf = np.frombuffer(RawArray('b', size), dtype=dtype).reshape(shape)
+            self.arrays[k] = buf
+        self.array_set = set()
+        self._copyto = np.copyto
+        #last object put in each scalar slot, to tell when it changes
+        self.sources = {}
+
+    def _store(self, key, value):
+        ix = self.scalar_ix.get(key)
+        if ix is not None:
+            if value is self.sources.get(key, MISSING):
+                return
+            if value is None:
+                self.scalar_set_raw[ix] = 0
+            else:
+                self.scalar_raw[ix] = value
+                self.scalar_set_raw[ix] = 1
+            self.sources[key] = value
+        elif key in self.arrays:
+            if value is None:
+                self.array_set.discard(key)
+            else:
+                buf = self.arrays[key]
+                if value is not buf:
+                    self._copyto(buf, value, casting='unsafe')
+                self.array_set.add(key)
+        else:
+            return super(SlotMemory, self)._store(key, value)
+        #an array counts as changed even when it is the same object, the
+        #part may have updated it in place
+        self.touch(key)
+
+    def _get_one(self, key):
+        ix = self.scalar_ix.get(key)
+        if ix is not None:
+            if not self.scalar_set_raw[ix]:
+                return None
+            return self.scalar_cast[ix](self.scalar_raw[ix])
+
+        buf = self.arrays.get(key)
+        if buf is not None:
+            return buf if key in self.array_set else None
+
+        return self.d.get(key)
+
+    def __getitem__(self, key):
+        if type(key) is tuple:
+            return [self._get_one(k) for k in key]
+        return self._get_one(key)
+
+    def get(self, keys):
+        return [self._get_one(k) for k in keys]
+
+    def keys(self):
+        keys = [k for k, ix in self.scalar_ix.items() if self.scalar_set_raw[ix]]
+        keys += [k for k in self.arrays if k in self.array_set]
+        return keys + list(self.d.keys())
+
+    def values(self):
+        return [self._get_one(k) for k in self.keys()]
+
+    def items(self):
+        return [(k, self._get_one(k)) for k in self.keys()]
+
+    def reader(self, key):
+        ix = self.scalar_ix.get(key)
+        if ix is not None:
+            values, is_set = self.scalar_raw, self.scalar_set_raw
+            cast = self.scalar_cast[ix]
+            if cast is float:
+                return lambda: values[ix] if is_set[ix] else None
+            return lambda: cast(values[ix]) if is_set[ix] else None
+
+        buf = self.arrays.get(key)
+        if buf is not None:
+            array_set = self.array_set
+            return lambda: buf if key in array_set else None
+
+        return partial(self.d.get, key)
+
+    def writer(self, key, in_place=False):
+        """
+        Return a function that saves a value to one channel.
+        """
+        ix = self.scalar_ix.get(key)
+        if ix is not None:
+            values, is_set = self.scalar_raw, self.scalar_set_raw
+            sources, touch = self.sources, self.touch
+            def write(value):
+                if not in_place and value is sources.get(key, MISSING):
+                    return
+                if value is None:
+                    is_set[ix] = 0
+                else:
+                    values[ix] = value
+                    is_set[ix] = 1
+                sources[key] = value
+                touch(key)
+            return write
+
+        buf = self.arrays.get(key)
+        if buf is not None:
+            array_set, copyto, touch = self.array_set, self._copyto, self.touch
+            def write(value):
+                if value is None:
+                    array_set.discard(key)
+                else:
+                    if value is not buf:
+                        copyto(buf, value, casting='unsafe')
+                    array_set.add(key)
+                touch(key)
+            return write
+
+        if in_place:
+            d, touch = self.d, self.touch
+            def write(value):
+                d[key] = value
+                touch(key)
+            return write
+        return partial(self._store, key)
+
+    def getter(self, keys):
+        readers = [self.reader(k) for k in keys]
+        if not readers:
+            return tuple
+        if len(readers) == 1:
+            read = readers[0]
+            return lambda: (read(),)
+        if len(readers) == 2:
+            read_a, read_b = readers
+            return lambda: (read_a(), read_b())
+        return lambda: [read() for read in readers]
+
+    def setter(self, keys, in_place=False):
+        writers = [self.writer(k, in_place) for k in keys]
+        if len(writers) == 1:
+            return writers[0]
+
+        def put(values):
+            if len(values) < len(writers):
+                raise IndexError('{} outputs for keys: {}'.format(len(values), keys))
+            for write, value in zip(writers, values):
+                write(value)
+        return put
@@ -1,43 +1,98 @@
+'''
+Parts are loaded the first time they are used, so importing donkeycar
+doesn't import keras, tensorflow, opencv or tornado for a car, or a
+command, that doesn't need them.
+
+>>> import donkeycar as dk
+>>> cam = dk.parts.PiCamera()    # only now is the cameras module imported
+'''
 import sys
+import importlib
+import importlib.util
+from types import ModuleType
 
 if sys.version_info.major < 3:
     msg = 'Donkey Requires Python 3.4 or greater. You are using {}'.format(sys.version)
     raise ValueError(msg)
 
-from .actuators.actuators import PCA9685
-from .actuators.actuators import Maestro
-from .actuators.actuators import Teensy
-from .actuators.actuators import PWMSteering
-from .actuators.actuators import PWMThrottle
-from .actuators.actuators import MockController
 
-from .controllers.web import LocalWebController
-from .controllers.joystick import JoystickController
-from .controllers.pid import PIDController
+#the module each part is imported from, relative to this package
+PARTS = {
+    'PCA9685': '.actuators.actuators',
+    'Maestro': '.actuators.actuators',
+    'Teensy': '.actuators.actuators',
+    'PWMSteering': '.actuators.actuators',
+    'PWMThrottle': '.actuators.actuators',
+    'MockController': '.actuators.actuators',
+
+    'LocalWebController': '.controllers.web',
+    'JoystickController': '.controllers.joystick',
+    'PIDController': '.controllers.pid',
+
+    'PiCamera': '.sensors.cameras',
+    'Webcam': '.sensors.cameras',
+    'MockCamera': '.sensors.cameras',
+    'ImageListCamera': '.sensors.cameras',
+
+    'RPLidar': '.sensors.lidar',
+    'RotaryEncoder': '.sensors.rotary_encoder',
+    'AStarSpeed': '.sensors.astar_speed',
+    'TeensyRCin': '.sensors.teensy_rcin',
+
+    'Undistort': '.cv.cv',
+
+    'KerasCategorical': '.ml.keras',
+    'KerasLinear': '.ml.keras',
+    'AsyncPilot': '.ml.async_pilot',
+    'TFLitePilot': '.ml.tflite',
+    'NumpyPilot': '.ml.numpy_model',
+
+    'OriginalWriter': '.stores.original',
+
+    'Tub': '.stores.tub',
+    'TubReader': '.stores.tub',
+    'TubWriter': '.stores.tub',
+    'TubHandler': '.stores.tub',
+    'TubImageStacker': '.stores.tub',
+    'TubChain': '.stores.tub',
+
+    'Lambda': '.transforms',
+
+    'SquareBoxCamera': '.simulations',
+    'MovingSquareTelemetry': '.simulations',
+}
 
-from .sensors.cameras import PiCamera
-from .sensors.cameras import Webcam
-from .sensors.cameras import MockCamera
-from .sensors.cameras import ImageListCamera
+__all__ = sorted(PARTS)
 
-from .sensors.lidar import RPLidar
-from .sensors.rotary_encoder import RotaryEncoder
-from .sensors.astar_speed import AStarSpeed
-from .sensors.teensy_rcin import TeensyRCin
 
-from .ml.keras import KerasCategorical
-from .ml.keras import KerasLinear
+class LazyParts(ModuleType):
+    '''
+    The parts package, importing the module of a part the first time the
+    part is looked up. Subpackages such as actuators are imported the same
+    way.
+    '''
 
-from .stores.original import OriginalWriter
+    def __getattr__(self, name):
+        if name in PARTS:
+            module = importlib.import_module(PARTS[name], __name__)
+            value = getattr(module, name)
+        elif not name.startswith('_') and \
+                importlib.util.find_spec('{}.{}'.format(__name__, name)) is not None:
+            value = importlib.import_module('.' + name, __name__)
+        else:
+            raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+        #later lookups find it without coming here
+        setattr(self, name, value)
+        return value
 
-from .stores.tub import Tub
-from .stores.tub import TubReader
-from .stores.tub import TubWriter
-from .stores.tub import TubHandler
-from .stores.tub import TubImageStacker
-from .stores.tub import TubChain
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(PARTS))
 
-from .transforms import Lambda
 
-from .simulations import SquareBoxCamera
-from .simulations import MovingSquareTelemetry
+try:
+    sys.modules[__name__].__class__ = LazyParts
+except TypeError:
+    #python 3.4 can't change the class of a module, replace it instead
+    _parts = LazyParts(__name__, __doc__)
+    _parts.__dict__.update(sys.modules[__name__].__dict__)
+    sys.modules[__name__] = _parts
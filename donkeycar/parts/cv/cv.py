@@ -1,6 +1,8 @@
 import cv2
 import numpy as np
 
+from donkeycar.tools import fisheye_undistort
+
 class ImgGreyscale():
 
     def run(self, img_arr):
@@ -52,6 +54,53 @@ class ImgCrop:
         
 
 
+class Undistort:
+    """
+    Undistort images from a fisheye camera. The undistortion maps are
+    computed for the first image of each resolution and reused after.
+
+    The calibration is read from a profile saved by
+    tools/fisheye_calibrate.py, or given as dim, k and d. It defaults to
+    the one in use in tools/fisheye_undistort.py.
+
+    crop keeps a (top, bottom) range of rows and size resizes the result to
+    (width, height). Both are done by the same remap as the undistortion,
+    which then only computes the pixels that are kept.
+    """
+    def __init__(self, balance=0.0, dim=None, k=None, d=None, crop=None, size=None,
+                 profile=None):
+        if profile is not None:
+            dim, k, d = fisheye_undistort.load_profile(profile, activate=False)
+        self.balance = balance
+        self.dim = dim
+        self.k = k
+        self.d = d
+        self.crop = tuple(crop) if crop is not None else None
+        self.size = tuple(size) if size is not None else None
+
+    def settings(self):
+        """
+        The balance, calibration and region of the undistortion as plain
+        lists and numbers, to tell if images were preprocessed the same
+        way, as ImageCache does.
+        """
+        dim, k, d = fisheye_undistort.calibration(self.dim, self.k, self.d)
+        return {'balance': self.balance,
+                'dim': [int(v) for v in dim],
+                'k': np.asarray(k, dtype=np.float64).tolist(),
+                'd': np.asarray(d, dtype=np.float64).tolist(),
+                'crop': list(self.crop) if self.crop is not None else None,
+                'size': list(self.size) if self.size is not None else None}
+
+    def run(self, img_arr):
+        if img_arr is None:
+            return None
+        return fisheye_undistort.undistort(img_arr, self.balance,
+                                           self.dim, self.k, self.d,
+                                           self.crop, self.size)
+
+
+
 class ImgFIFO:
     """
     Stack N previous images into a single N channel image, after converting each to grayscale.
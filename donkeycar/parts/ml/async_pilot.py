@@ -0,0 +1,124 @@
+'''
+
+async_pilot.py
+
+Run a pilot in its own thread so a slow inference doesn't hold up the
+drive loop.
+
+'''
+
+import threading
+import time
+
+import numpy as np
+
+
+class AsyncPilot:
+    '''
+    Threaded part wrapping a pilot, such as KerasCategorical.
+
+    run_threaded hands the newest camera frame to the inference thread and
+    returns at once with the last result, so the drive loop keeps its rate
+    whatever inference takes. Frames that arrive while the pilot is busy
+    replace each other and only the latest is inferred on, the others are
+    counted in dropped.
+
+    A frame is new when its timestamp, cam/timestamp, differs from the last
+    one. Memory such as SlotMemory hands out the same buffer for every
+    frame, so the object can't tell. Frames are copied when they are
+    handed over, the camera may overwrite its buffer while the pilot
+    infers. Without a timestamp every call is taken as a new frame.
+
+    The outputs are the pilot's angle and throttle followed by the capture
+    time of the frame they were inferred from, which is also kept in
+    frame_time for the vehicle's latency tracing. They are None until the
+    first frame is inferred on.
+
+    >>> V.add(AsyncPilot(kl), inputs=['cam/image_array', 'cam/timestamp'],
+    ...       outputs=['pilot/angle', 'pilot/throttle', 'pilot/timestamp'],
+    ...       threaded=True, run_condition='run_pilot')
+    '''
+
+    def __init__(self, pilot, timeout=0.1):
+        self.pilot = pilot
+        self.timeout = timeout
+        self.frame_time = None
+        self.outputs = (None, None)
+        self.pending = None
+        self.last_time = None
+        self.inferred = 0
+        self.dropped = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.on = True
+
+    def load(self, model_path):
+        self.pilot.load(model_path)
+
+    def submit(self, img_arr, timestamp=None):
+        '''
+        Queue a frame for inference, replacing a frame still waiting.
+        '''
+        if img_arr is None:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        elif timestamp == self.last_time:
+            return
+        if isinstance(img_arr, np.ndarray):
+            img_arr = img_arr.copy()
+        with self.lock:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = (img_arr, timestamp)
+            self.last_time = timestamp
+        self.ready.set()
+
+    def infer(self):
+        '''
+        Infer on the pending frame, if any. Return True when it did.
+        '''
+        with self.lock:
+            pending, self.pending = self.pending, None
+            self.ready.clear()
+        if pending is None:
+            return False
+        img_arr, timestamp = pending
+        try:
+            outputs = self.pilot.run(img_arr)
+        except Exception as e:
+            #keep driving on the last result rather than stop the thread
+            self.errors += 1
+            print('pilot failed on a frame: {}'.format(e))
+            return True
+        with self.lock:
+            self.outputs = tuple(outputs)
+            self.frame_time = timestamp
+            self.inferred += 1
+        return True
+
+    def result(self):
+        with self.lock:
+            return self.outputs + (self.frame_time,)
+
+    def update(self):
+        while self.on:
+            self.ready.wait(self.timeout)
+            self.infer()
+
+    def run_threaded(self, img_arr, timestamp=None):
+        self.submit(img_arr, timestamp)
+        return self.result()
+
+    def run(self, img_arr, timestamp=None):
+        '''
+        Infer in the calling thread, for when the part isn't threaded.
+        '''
+        self.submit(img_arr, timestamp)
+        self.infer()
+        return self.result()
+
+    def shutdown(self):
+        self.on = False
+        self.ready.set()
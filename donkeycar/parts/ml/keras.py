@@ -18,24 +18,56 @@ from PIL import Image
 import keras
 from ... import utils
 from donkeycar.config import load_config
-from donkeycar.tools.fisheye_undistort import undistort
+from donkeycar.parts.ml.pilot import Pilot
 
 
 import donkeycar as dk
 from donkeycar import utils
 
-class KerasPilot():
+class KerasPilot(Pilot):
+    '''
+    Base class of the keras pilots.
 
-    def __init__(self):
+    By default the model runs through a backend function built once from
+    its inputs and outputs instead of model.predict, which sets up a
+    batching loop and callbacks on every call. Set compiled=False to go
+    through model.predict.
+    '''
+
+    def __init__(self, compiled=True):
+        super(KerasPilot, self).__init__()
         cfg = load_config()
         mask_path = os.path.join(cfg.CAR_PATH, 'mask.png')
         self.mask = None
         if os.path.isfile(mask_path):
             self.mask = np.array(Image.open(mask_path))
+        self.compiled = compiled
+        self.predict_fn = None
 
     def load(self, model_path):
         self.model = keras.models.load_model(model_path)
-    
+        self.predict_fn = None
+
+    def compile_predict(self):
+        '''
+        Build the function run calls to infer, once the model is set.
+        '''
+        from keras import backend as K
+        #0 as the learning phase turns dropout off, like predict does
+        fn = K.function(self.model.inputs + [K.learning_phase()],
+                        self.model.outputs)
+        self.predict_fn = lambda batch: fn([batch, 0])
+        return self.predict_fn
+
+    def predict(self, batch):
+        '''
+        Return the outputs of the model for a batch of frames.
+        '''
+        if not self.compiled:
+            return self.model.predict(batch)
+        if self.predict_fn is None:
+            self.compile_predict()
+        return self.predict_fn(batch)
     
     def train(self, train_gen, val_gen, 
               saved_model_path, epochs=100, steps=100, train_split=0.8):
@@ -80,14 +112,11 @@ class KerasCategorical(KerasPilot):
         else:
             self.model = default_categorical()
         
-    def run(self, img_arr):
-        img_arr = undistort(img_arr, balance=0.55)[9:79,:,:]
-
-        img_arr = img_arr.reshape((1,) + img_arr.shape)
-        angle_binned, throttle = self.model.predict(img_arr)
-        #angle_certainty = max(angle_binned[0])
-        angle_unbinned = utils.linear_unbin(angle_binned)
-        return angle_unbinned, throttle[0][0]
+    def interpret(self, outputs, i):
+        angle_binned, throttle = outputs
+        #angle_certainty = max(angle_binned[i])
+        angle_unbinned = utils.linear_unbin(angle_binned[i])
+        return angle_unbinned, throttle[i][0]
     
     
     
@@ -98,13 +127,10 @@ class KerasLinear(KerasPilot):
             self.model = model
         else:
             self.model = default_linear()
-    def run(self, img_arr):
-        img_arr = undistort(img_arr, balance=0.55)[9:79,:,:]
 
-        img_arr = img_arr.reshape((1,) + img_arr.shape)
-        angle, throttle = self.model.predict(img_arr)
-        #angle_certainty = max(angle_binned[0])
-        return angle[0][0], throttle[0][0]
+    def interpret(self, outputs, i):
+        angle, throttle = outputs
+        return angle[i][0], throttle[i][0]
 
 
 
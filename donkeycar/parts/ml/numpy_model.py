@@ -0,0 +1,278 @@
+'''
+
+numpy_model.py
+
+Run the convolutional pilots trained with keras using only numpy, so a car
+can drive without loading keras and tensorflow. Convolutions are unrolled
+into one matrix product per layer (im2col) that numpy hands to BLAS.
+
+Supports the layers the default models are made of: Conv2D, Dense,
+MaxPooling2D, Flatten, Dropout and Activation, channels last. Models saved
+by keras 1, with Convolution2D layers, are read too.
+
+'''
+
+import json
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from donkeycar.parts.ml.pilot import Pilot
+
+
+def softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'softmax': softmax,
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'tanh': np.tanh,
+}
+
+
+def activation(name):
+    try:
+        return ACTIVATIONS[name]
+    except KeyError:
+        raise ValueError('Unsupported activation {}'.format(name))
+
+
+def pad_same(x, kh, kw, sh, sw, value=0):
+    '''
+    Pad the rows and columns of a NHWC batch the way 'same' padding does.
+    '''
+    n, h, w, c = x.shape
+    pad_h = max((-(-h // sh) - 1) * sh + kh - h, 0)
+    pad_w = max((-(-w // sw) - 1) * sw + kw - w, 0)
+    if not pad_h and not pad_w:
+        return x
+    return np.pad(x, ((0, 0), (pad_h // 2, pad_h - pad_h // 2),
+                      (pad_w // 2, pad_w - pad_w // 2), (0, 0)),
+                  mode='constant', constant_values=value)
+
+
+def windows(x, kh, kw, sh, sw):
+    '''
+    A (n, out_h, out_w, kh, kw, c) view of every window of a NHWC batch.
+    '''
+    n, h, w, c = x.shape
+    oh = (h - kh) // sh + 1
+    ow = (w - kw) // sw + 1
+    s = x.strides
+    return as_strided(x, shape=(n, oh, ow, kh, kw, c),
+                      strides=(s[0], s[1] * sh, s[2] * sw, s[1], s[2], s[3]),
+                      writeable=False)
+
+
+def conv2d(x, kernel, bias, strides=(1, 1), padding='valid'):
+    '''
+    Convolve a NHWC batch with a (kh, kw, c, filters) kernel.
+    '''
+    kh, kw, c, filters = kernel.shape
+    sh, sw = strides
+    if padding == 'same':
+        x = pad_same(x, kh, kw, sh, sw)
+    cols = windows(x, kh, kw, sh, sw)
+    n, oh, ow = cols.shape[:3]
+    #the reshape copies the windows into one row each, the im2col matrix
+    out = np.dot(cols.reshape(n * oh * ow, kh * kw * c), kernel.reshape(kh * kw * c, filters))
+    if bias is not None:
+        out += bias
+    return out.reshape(n, oh, ow, filters)
+
+
+def max_pool2d(x, pool_size=(2, 2), strides=None, padding='valid'):
+    kh, kw = pool_size
+    sh, sw = strides or pool_size
+    if padding == 'same':
+        x = pad_same(x, kh, kw, sh, sw, value=-np.inf)
+    return windows(x, kh, kw, sh, sw).max(axis=(3, 4))
+
+
+def conv2d_layer(config, weights):
+    if config.get('data_format', 'channels_last') != 'channels_last':
+        raise ValueError('Only channels_last convolutions are supported')
+    kernel = np.ascontiguousarray(weights[0], dtype=np.float32)
+    bias = weights[1].astype(np.float32) if config.get('use_bias', True) else None
+    strides = tuple(config.get('strides', (1, 1)))
+    padding = config.get('padding', 'valid')
+    act = activation(config.get('activation', 'linear'))
+    return lambda x: act(conv2d(x, kernel, bias, strides, padding))
+
+
+def dense_layer(config, weights):
+    kernel = np.ascontiguousarray(weights[0], dtype=np.float32)
+    bias = weights[1].astype(np.float32) if config.get('use_bias', True) else None
+    act = activation(config.get('activation', 'linear'))
+    def dense(x):
+        out = np.dot(x, kernel)
+        if bias is not None:
+            out += bias
+        return act(out)
+    return dense
+
+
+def max_pooling2d_layer(config, weights):
+    pool_size = tuple(config.get('pool_size', (2, 2)))
+    strides = config.get('strides')
+    strides = tuple(strides) if strides else None
+    padding = config.get('padding', 'valid')
+    return lambda x: max_pool2d(x, pool_size, strides, padding)
+
+
+def activation_layer(config, weights):
+    act = activation(config['activation'])
+    #relu works in place, leave the input to the layer as it was
+    return lambda x: act(x.copy())
+
+
+def identity_layer(config, weights):
+    return lambda x: x
+
+
+def flatten_layer(config, weights):
+    return lambda x: x.reshape(len(x), -1)
+
+
+#keras 1 names of the layer settings that keras 2 renamed
+KERAS1_NAMES = {
+    'subsample': 'strides',
+    'border_mode': 'padding',
+    'bias': 'use_bias',
+}
+
+
+def keras2_config(config):
+    '''
+    The config of a layer with the settings keras 1 saves under their
+    keras 2 names.
+    '''
+    if 'dim_ordering' in config:
+        if config['dim_ordering'] == 'th':
+            raise ValueError('Layer {} is channels first, only channels_last '
+                             'is supported'.format(config.get('name')))
+        config = dict(config)
+        config['data_format'] = 'channels_last'
+        del config['dim_ordering']
+    if any(old in config for old in KERAS1_NAMES):
+        config = {KERAS1_NAMES.get(k, k): v for k, v in config.items()}
+    return config
+
+
+LAYERS = {
+    'InputLayer': identity_layer,
+    'Conv2D': conv2d_layer,
+    'Convolution2D': conv2d_layer,
+    'Dense': dense_layer,
+    'MaxPooling2D': max_pooling2d_layer,
+    'Flatten': flatten_layer,
+    'Dropout': identity_layer,
+    'Activation': activation_layer,
+}
+
+
+class NumpyModel():
+    '''
+    A keras model rebuilt from its config and weights, with a predict like
+    keras returning the list of outputs for a batch.
+
+    Parameters
+    ----------
+        config : dict
+            The model config keras saves, of a Model or a Sequential.
+        weights : dict
+            The list of weight arrays of each layer, by layer name.
+    '''
+
+    def __init__(self, config, weights):
+        self.layers = []
+        if config['class_name'] == 'Sequential':
+            layers = config['config']
+            if isinstance(layers, dict):
+                layers = layers['layers']
+            previous = None
+            for layer in layers:
+                self.add(layer, weights, [previous] if previous else [])
+                previous = layer['config']['name']
+            self.input_names = [layers[0]['config']['name']]
+            self.output_names = [previous]
+        elif config['class_name'] in ('Model', 'Functional'):
+            config = config['config']
+            for layer in config['layers']:
+                nodes = layer.get('inbound_nodes') or [[]]
+                if len(nodes) > 1:
+                    raise ValueError('Shared layer {} is not supported'.format(layer['name']))
+                self.add(layer, weights, [inbound[0] for inbound in nodes[0]])
+            self.input_names = [l[0] for l in config['input_layers']]
+            self.output_names = [l[0] for l in config['output_layers']]
+        else:
+            raise ValueError('Unsupported model {}'.format(config['class_name']))
+
+    def add(self, layer, weights, inputs):
+        cls = layer['class_name']
+        if cls not in LAYERS:
+            raise ValueError('Unsupported layer {}'.format(cls))
+        if len(inputs) > 1:
+            raise ValueError('Layer {} has more than one input'.format(layer['config']['name']))
+        name = layer['config']['name']
+        fn = LAYERS[cls](keras2_config(layer['config']), weights.get(name, []))
+        self.layers.append((name, fn, inputs[0] if inputs else None))
+
+    def predict(self, batch):
+        if isinstance(batch, (list, tuple)):
+            batch = batch[0]
+        values = {}
+        for name, fn, inbound in self.layers:
+            if inbound is None:
+                values[name] = fn(np.asarray(batch, dtype=np.float32))
+            else:
+                values[name] = fn(values[inbound])
+        return [values[name] for name in self.output_names]
+
+
+def decode(s):
+    return s.decode('utf-8') if isinstance(s, bytes) else s
+
+
+def load_h5(path):
+    '''
+    Load a model saved by keras' model.save, with h5py instead of keras.
+    '''
+    import h5py
+
+    with h5py.File(path, 'r') as f:
+        config = f.attrs.get('model_config')
+        if config is None:
+            raise ValueError('{} holds weights only, save the model with model.save'.format(path))
+        config = json.loads(decode(config))
+        group = f['model_weights'] if 'model_weights' in f else f
+        weights = {}
+        for name in group.attrs['layer_names']:
+            layer = group[decode(name)]
+            weights[decode(name)] = [np.asarray(layer[decode(w)])
+                                     for w in layer.attrs['weight_names']]
+    return NumpyModel(config, weights)
+
+
+class NumpyPilot(Pilot):
+    '''
+    Drive with a keras model run by NumpyModel instead of keras. Used like
+    the keras pilots: run takes one or more frames and returns the angle
+    and throttle of each.
+    '''
+
+    def __init__(self, model_path=None):
+        super(NumpyPilot, self).__init__()
+        self.model = None
+        if model_path:
+            self.load(model_path)
+
+    def load(self, model_path):
+        self.model = load_h5(model_path)
+
+    def predict(self, batch):
+        return self.model.predict(batch)
@@ -0,0 +1,78 @@
+'''
+
+pilot.py
+
+What the pilots share whatever runs their model: the preprocessing of
+the camera frames, the same as the records of a tub get for training,
+and reading the angle and throttle out of the model outputs. Doesn't
+import keras, so a car driving with TensorFlow Lite or numpy doesn't
+load it.
+
+'''
+
+import numpy as np
+
+from donkeycar import utils
+from donkeycar.parts.cv.cv import Undistort
+
+
+def preprocessor():
+    '''
+    Return the part that undistorts and crops a camera frame to the input
+    of the pilots. Tub applies the same to the images it loads.
+    '''
+    return Undistort(balance=0.55, crop=(9, 79))
+
+
+def interpret(outputs, i):
+    '''
+    Return the angle and throttle of frame i of a batch, from a categorical
+    or a linear model.
+    '''
+    angle, throttle = outputs
+    if angle.shape[-1] > 1:
+        return utils.linear_unbin(angle[i]), throttle[i][0]
+    return angle[i][0], throttle[i][0]
+
+
+class Pilot():
+    '''
+    Base class of the pilots. Subclasses implement predict, returning the
+    outputs of their model for a batch of preprocessed frames.
+
+    run takes one or more frames, from several cameras for instance, and
+    infers on all of them in a single call of the model, returning the
+    outputs of each frame one after the other.
+    '''
+
+    def __init__(self):
+        self.undistort = preprocessor()
+
+    def predict(self, batch):
+        '''
+        Return the outputs of the model for a batch of frames.
+        '''
+        raise NotImplementedError
+
+    def interpret(self, outputs, i):
+        '''
+        Return the angle and throttle of frame i of a batch.
+        '''
+        return interpret(outputs, i)
+
+    def run_batch(self, img_arrs):
+        '''
+        Return an output tuple per frame, all inferred in one call.
+        '''
+        batch = np.stack([self.undistort.run(img) for img in img_arrs])
+        outputs = self.predict(batch)
+        return [self.interpret(outputs, i) for i in range(len(batch))]
+
+    def run(self, *img_arrs):
+        results = self.run_batch(img_arrs)
+        if len(results) == 1:
+            return results[0]
+        return tuple(val for result in results for val in result)
+
+    def shutdown(self):
+        pass
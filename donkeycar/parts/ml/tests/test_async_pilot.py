@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+import unittest
+
+import numpy as np
+
+from ..async_pilot import AsyncPilot
+from ...transforms import Lambda
+from ....vehicle import Vehicle
+
+
+class SlowPilot:
+    def __init__(self, delay):
+        self.delay = delay
+        self.frames = []
+
+    def run(self, img_arr):
+        time.sleep(self.delay)
+        self.frames.append(img_arr)
+        return img_arr * 0.1, 0.5
+
+
+class TestAsyncPilot(unittest.TestCase):
+
+    def test_run(self):
+        pilot = AsyncPilot(SlowPilot(0))
+        assert pilot.run(None) == (None, None, None)
+        assert pilot.run(1, 100.0) == (0.1, 0.5, 100.0)
+        assert pilot.frame_time == 100.0
+
+    def test_latest_frame_wins(self):
+        pilot = AsyncPilot(SlowPilot(0))
+        pilot.submit(1, 1.0)
+        pilot.submit(2, 2.0)
+        pilot.submit(3, 3.0)
+        assert pilot.infer()
+        assert not pilot.infer()
+        assert pilot.pilot.frames == [3]
+        assert pilot.dropped == 2
+        assert pilot.result() == (3 * 0.1, 0.5, 3.0)
+
+    def test_same_frame_inferred_once(self):
+        pilot = AsyncPilot(SlowPilot(0))
+        frame = np.ones(3)
+        pilot.submit(frame, 1.0)
+        pilot.infer()
+        pilot.submit(frame, 1.0)
+        assert not pilot.infer()
+
+    def test_reused_buffer(self):
+        #SlotMemory passes the same buffer, rewritten for each frame
+        pilot = AsyncPilot(SlowPilot(0))
+        buf = np.zeros(3)
+        for i in range(1, 4):
+            buf[:] = i
+            pilot.submit(buf, float(i))
+            #the camera writes its next frame before inference
+            buf[:] = -1
+            assert pilot.infer()
+        assert [f[0] for f in pilot.pilot.frames] == [1, 2, 3]
+
+    def test_no_timestamp(self):
+        pilot = AsyncPilot(SlowPilot(0))
+        frame = np.ones(3)
+        pilot.run(frame)
+        pilot.run(frame)
+        assert pilot.inferred == 2
+
+    def test_errors_keep_last_result(self):
+        pilot = AsyncPilot(SlowPilot(0))
+        pilot.run(1, 1.0)
+        assert pilot.run('bad', 2.0) == (0.1, 0.5, 1.0)
+        assert pilot.errors == 1
+
+    def test_threaded(self):
+        pilot = AsyncPilot(SlowPilot(0.05))
+        t = threading.Thread(target=pilot.update)
+        t.start()
+        try:
+            for i in range(1, 11):
+                pilot.run_threaded(i, float(i))
+                time.sleep(0.01)
+            deadline = time.time() + 2
+            while pilot.frame_time != 10.0 and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            pilot.shutdown()
+            t.join()
+        assert pilot.frame_time == 10.0
+        assert pilot.inferred < 10
+        assert pilot.inferred + pilot.dropped == 10
+
+    def test_keeps_loop_cadence(self):
+        v = Vehicle()
+        v.mem.put(['count'], 0)
+        v.add(Lambda(lambda x: x + 1), inputs=['count'], outputs=['count'])
+        v.add(AsyncPilot(SlowPilot(0.2)),
+              inputs=['count', 'count'],
+              outputs=['pilot/angle', 'pilot/throttle', 'pilot/timestamp'],
+              threaded=True)
+        v.start(rate_hz=50, max_loop_count=10)
+        busy = v.profile()['AsyncPilot']
+        assert busy['count'] == 10
+        assert v.loop_stats()['ticks'] == 10
+        assert busy['max'] < 0.05
+
+    def test_slot_memory_frames(self):
+        from ....memory import SlotMemory
+        v = Vehicle(mem=SlotMemory({'cam/image_array': (3,),
+                                    'cam/timestamp': 'float'}))
+        ticks = iter(range(1, 21))
+        def camera():
+            i = next(ticks)
+            return np.full(3, i, dtype=np.uint8), float(i)
+        v.add(Lambda(camera), outputs=['cam/image_array', 'cam/timestamp'])
+        pilot = AsyncPilot(SlowPilot(0))
+        v.add(pilot, inputs=['cam/image_array', 'cam/timestamp'],
+              outputs=['pilot/angle', 'pilot/throttle', 'pilot/timestamp'])
+        v.start(rate_hz=200, max_loop_count=20)
+        assert pilot.inferred == 20
+        assert [int(f[0]) for f in pilot.pilot.frames] == list(range(1, 21))
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import pytest
+import numpy as np
 from ..keras import KerasPilot, KerasCategorical, default_categorical
 # content of ./test_smtpsimple.py
 
@@ -23,4 +24,23 @@ def test_categorical_with_model():
 
 
 
-    
\ No newline at end of file
+    
+
+
+def test_compiled_matches_predict():
+    kc = KerasCategorical(default_categorical())
+    batch = np.random.randint(0, 255, size=(3, 70, 160, 3)).astype(np.uint8)
+    compiled = kc.predict(batch)
+    kc.compiled = False
+    predicted = kc.predict(batch)
+    for a, b in zip(compiled, predicted):
+        np.testing.assert_allclose(a, b, rtol=1e-5)
+
+def test_run_several_frames():
+    kc = KerasCategorical(default_categorical())
+    img = np.random.randint(0, 255, size=(120, 160, 3)).astype(np.uint8)
+    angle, throttle = kc.run(img)
+    outputs = kc.run(img, img)
+    assert len(outputs) == 4
+    assert outputs[0] == outputs[2] == angle
+    assert np.isclose(outputs[1], throttle) and np.isclose(outputs[3], throttle)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from ..numpy_model import conv2d, max_pool2d, NumpyModel, load_h5
+
+
+def naive_conv2d(x, kernel, bias, strides, padding):
+    kh, kw, c, filters = kernel.shape
+    sh, sw = strides
+    n, h, w, _ = x.shape
+    if padding == 'same':
+        oh, ow = -(-h // sh), -(-w // sw)
+        pad_h = max((oh - 1) * sh + kh - h, 0)
+        pad_w = max((ow - 1) * sw + kw - w, 0)
+        x = np.pad(x, ((0, 0), (pad_h // 2, pad_h - pad_h // 2),
+                       (pad_w // 2, pad_w - pad_w // 2), (0, 0)), mode='constant')
+    else:
+        oh, ow = (h - kh) // sh + 1, (w - kw) // sw + 1
+    out = np.zeros((n, oh, ow, filters))
+    for b in range(n):
+        for i in range(oh):
+            for j in range(ow):
+                window = x[b, i * sh:i * sh + kh, j * sw:j * sw + kw, :]
+                for f in range(filters):
+                    out[b, i, j, f] = (window * kernel[..., f]).sum() + bias[f]
+    return out
+
+
+def random_model():
+    '''
+    The shape of default_categorical at a smaller scale, with its config
+    and weights as keras saves them.
+    '''
+    rng = np.random.RandomState(0)
+    def conv(name, inbound, filters, channels, k, s):
+        weights = [rng.randn(k, k, channels, filters).astype(np.float32) * 0.2,
+                   rng.randn(filters).astype(np.float32) * 0.1]
+        layer = {'class_name': 'Conv2D', 'name': name,
+                 'config': {'name': name, 'filters': filters,
+                            'kernel_size': [k, k], 'strides': [s, s],
+                            'padding': 'valid', 'activation': 'relu',
+                            'use_bias': True, 'data_format': 'channels_last'},
+                 'inbound_nodes': [[[inbound, 0, 0, {}]]]}
+        return layer, weights
+    def dense(name, inbound, units, inputs, act):
+        weights = [rng.randn(inputs, units).astype(np.float32) * 0.2,
+                   rng.randn(units).astype(np.float32) * 0.1]
+        layer = {'class_name': 'Dense', 'name': name,
+                 'config': {'name': name, 'units': units, 'activation': act,
+                            'use_bias': True},
+                 'inbound_nodes': [[[inbound, 0, 0, {}]]]}
+        return layer, weights
+    def simple(cls, name, inbound, **config):
+        config['name'] = name
+        return {'class_name': cls, 'name': name, 'config': config,
+                'inbound_nodes': [[[inbound, 0, 0, {}]]]}
+
+    layers = [{'class_name': 'InputLayer', 'name': 'img_in',
+               'config': {'name': 'img_in', 'batch_input_shape': [None, 14, 20, 3]},
+               'inbound_nodes': []}]
+    weights = {}
+    for layer, w in [conv('conv2d_1', 'img_in', 4, 3, 3, 2),
+                     conv('conv2d_2', 'conv2d_1', 6, 4, 3, 1)]:
+        layers.append(layer)
+        weights[layer['name']] = w
+    layers.append(simple('Flatten', 'flattened', 'conv2d_2'))
+    for layer, w in [dense('dense_1', 'flattened', 10, 4 * 7 * 6, 'relu')]:
+        layers.append(layer)
+        weights[layer['name']] = w
+    layers.append(simple('Dropout', 'dropout_1', 'dense_1', rate=0.1))
+    for layer, w in [dense('angle_out', 'dropout_1', 15, 10, 'softmax'),
+                     dense('throttle_out', 'dropout_1', 1, 10, 'relu')]:
+        layers.append(layer)
+        weights[layer['name']] = w
+    config = {'class_name': 'Model',
+              'config': {'name': 'model_1', 'layers': layers,
+                         'input_layers': [['img_in', 0, 0]],
+                         'output_layers': [['angle_out', 0, 0],
+                                           ['throttle_out', 0, 0]]}}
+    return config, weights
+
+
+@pytest.mark.parametrize('strides,padding', [((1, 1), 'valid'), ((2, 2), 'valid'),
+                                             ((2, 1), 'same'), ((1, 1), 'same')])
+def test_conv2d_matches_naive(strides, padding):
+    rng = np.random.RandomState(1)
+    x = rng.randn(2, 9, 11, 3).astype(np.float32)
+    kernel = rng.randn(3, 5, 3, 4).astype(np.float32)
+    bias = rng.randn(4).astype(np.float32)
+    out = conv2d(x, kernel, bias, strides, padding)
+    expected = naive_conv2d(x, kernel, bias, strides, padding)
+    assert out.shape == expected.shape
+    np.testing.assert_allclose(out, expected, rtol=1e-4, atol=1e-4)
+
+def test_max_pool2d():
+    x = np.arange(2 * 4 * 6 * 3, dtype=np.float32).reshape(2, 4, 6, 3)
+    out = max_pool2d(x)
+    assert out.shape == (2, 2, 3, 3)
+    np.testing.assert_array_equal(out, x[:, 1::2, 1::2, :])
+    assert max_pool2d(x[:, :3], padding='same').shape == (2, 2, 3, 3)
+
+def test_model_matches_layers():
+    config, weights = random_model()
+    model = NumpyModel(config, weights)
+    x = np.random.RandomState(2).randint(0, 255, size=(3, 14, 20, 3)).astype(np.uint8)
+
+    h = x.astype(np.float32)
+    for name in ['conv2d_1', 'conv2d_2']:
+        w = weights[name]
+        stride = 2 if name == 'conv2d_1' else 1
+        h = np.maximum(naive_conv2d(h, w[0], w[1], (stride, stride), 'valid'), 0)
+    h = np.maximum(np.dot(h.reshape(3, -1), weights['dense_1'][0]) + weights['dense_1'][1], 0)
+    logits = np.dot(h, weights['angle_out'][0]) + weights['angle_out'][1]
+    angle = np.exp(logits - logits.max(axis=1, keepdims=True))
+    angle /= angle.sum(axis=1, keepdims=True)
+    throttle = np.maximum(np.dot(h, weights['throttle_out'][0]) + weights['throttle_out'][1], 0)
+
+    outputs = model.predict(x)
+    assert [o.shape for o in outputs] == [(3, 15), (3, 1)]
+    np.testing.assert_allclose(outputs[0], angle, rtol=1e-3, atol=1e-5)
+    np.testing.assert_allclose(outputs[1], throttle, rtol=1e-3, atol=1e-3)
+
+def test_keras1_conv():
+    rng = np.random.RandomState(3)
+    kernel = rng.randn(3, 3, 3, 4).astype(np.float32)
+    bias = rng.randn(4).astype(np.float32)
+    layer = {'class_name': 'Convolution2D',
+             'config': {'name': 'conv', 'nb_filter': 4, 'nb_row': 3, 'nb_col': 3,
+                        'subsample': [2, 2], 'border_mode': 'same',
+                        'dim_ordering': 'tf', 'activation': 'linear', 'bias': True,
+                        'batch_input_shape': [None, 9, 11, 3]}}
+    model = NumpyModel({'class_name': 'Sequential', 'config': [layer]},
+                       {'conv': [kernel, bias]})
+    x = rng.randn(2, 9, 11, 3).astype(np.float32)
+    expected = naive_conv2d(x, kernel, bias, (2, 2), 'same')
+    np.testing.assert_allclose(model.predict(x)[0], expected, rtol=1e-4, atol=1e-4)
+
+    layer['config']['dim_ordering'] = 'th'
+    with pytest.raises(ValueError):
+        NumpyModel({'class_name': 'Sequential', 'config': [layer]},
+                   {'conv': [kernel, bias]})
+
+def test_unsupported_layer():
+    config, weights = random_model()
+    config['config']['layers'][1]['class_name'] = 'LSTM'
+    with pytest.raises(ValueError):
+        NumpyModel(config, weights)
+
+@pytest.mark.parametrize('name', ['default_categorical', 'default_linear'])
+def test_matches_keras(tmpdir, name):
+    pytest.importorskip('h5py')
+    pytest.importorskip('keras.layers')
+    from .. import keras as pilots
+    model = getattr(pilots, name)()
+    path = str(tmpdir.join('model.h5'))
+    model.save(path)
+
+    shape = model.inputs[0].shape.as_list()[1:]
+    x = np.random.randint(0, 255, size=[4] + shape).astype(np.uint8)
+    expected = model.predict(x)
+    outputs = load_h5(path).predict(x)
+    for out, exp in zip(outputs, expected):
+        np.testing.assert_allclose(out, exp, rtol=1e-4, atol=1e-4)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from ..pilot import interpret, preprocessor, Pilot
+
+
+class MeanPilot(Pilot):
+    '''
+    Steers by the mean of each frame, linear outputs like KerasLinear.
+    '''
+    def predict(self, batch):
+        self.batch = batch
+        means = batch.reshape(len(batch), -1).mean(axis=1, keepdims=True)
+        return [means, means / 2]
+
+
+def test_interpret_categorical():
+    angle = np.zeros((2, 15))
+    angle[0, 0] = 1
+    angle[1, 14] = 1
+    throttle = np.array([[0.2], [0.4]])
+    assert interpret([angle, throttle], 0) == (-1, 0.2)
+    assert interpret([angle, throttle], 1) == (1, 0.4)
+
+def test_interpret_linear():
+    outputs = [np.array([[0.5], [-0.5]]), np.array([[0.2], [0.4]])]
+    assert interpret(outputs, 1) == (-0.5, 0.4)
+
+def test_run_preprocesses():
+    pilot = MeanPilot()
+    img = np.random.RandomState(0).randint(0, 255, size=(120, 160, 3)).astype(np.uint8)
+    angle, throttle = pilot.run(img)
+    expected = preprocessor().run(img)
+    assert np.array_equal(pilot.batch[0], expected)
+    assert angle == expected.mean() and throttle == angle / 2
+
+def test_run_several_frames():
+    pilot = MeanPilot()
+    frames = [np.full((120, 160, 3), v, dtype=np.uint8) for v in (10, 200)]
+    results = pilot.run_batch(frames)
+    assert len(pilot.batch) == 2
+    assert pilot.run(*frames) == results[0] + results[1]
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from ..tflite import export_tflite, output_details, spread_records, TFLitePilot
+
+
+def test_spread_records(tmpdir):
+    from ...stores.tub import TubWriter
+    paths = [str(tmpdir.join('tub_1')), str(tmpdir.join('tub_2'))]
+    for path in paths:
+        tub = TubWriter(path, inputs=['n'], types=['int'])
+        for i in range(10):
+            tub.run(i)
+        tub.shutdown()
+    spread = spread_records(paths, 4)
+    assert [tub.get_record(ix)['n'] for tub, ix in spread] == [0, 5, 0, 5]
+    assert len(spread_records(paths, 50)) == 20
+    with pytest.raises(ValueError):
+        spread_records([], 4)
+
+class FakeInterpreter:
+    def __init__(self, names, signature=None):
+        self.details = [{'name': name, 'index': i} for i, name in enumerate(names)]
+        self.signature = signature
+
+    def get_output_details(self):
+        return self.details
+
+    def get_signature_runner(self):
+        if self.signature is None:
+            raise ValueError('no signature')
+        runner = FakeInterpreter([])
+        runner.get_output_details = lambda: self.signature
+        return runner
+
+def test_outputs_by_signature():
+    interpreter = FakeInterpreter(['Identity', 'Identity_1'],
+                                  {'throttle_out': 't', 'angle_out': 'a'})
+    assert output_details(interpreter) == ['a', 't']
+
+def test_outputs_by_tensor_name():
+    interpreter = FakeInterpreter(['model/throttle_out/BiasAdd', 'model/angle_out/BiasAdd'])
+    assert [d['index'] for d in output_details(interpreter)] == [1, 0]
+
+def test_outputs_unknown():
+    #two linear outputs of the same size can't be told apart
+    with pytest.raises(ValueError):
+        output_details(FakeInterpreter(['Identity', 'Identity_1']))
+
+def test_export_needs_representative(tmpdir):
+    pytest.importorskip('tensorflow')
+    with pytest.raises(ValueError):
+        export_tflite('model.h5', str(tmpdir.join('model.tflite')), 'int8')
+
+@pytest.mark.parametrize('quantize', ['int8', 'float16'])
+def test_export_and_run(tmpdir, quantize):
+    pytest.importorskip('tensorflow')
+    from ..keras import default_categorical
+    model = default_categorical()
+    model_path = str(tmpdir.join('model.h5'))
+    model.save(model_path)
+    images = [np.random.randint(0, 255, size=(70, 160, 3)) for _ in range(10)]
+    out_path = export_tflite(model_path, str(tmpdir.join('model.tflite')),
+                             quantize, images)
+
+    pilot = TFLitePilot(out_path)
+    batch = np.array(images[:2], dtype=np.float32)
+    expected = model.predict(batch)
+    outputs = pilot.predict(batch)
+    assert outputs[0].shape == (2, 15)
+    assert np.abs(outputs[0] - expected[0]).max() < 0.1
+    assert np.abs(outputs[1] - expected[1]).max() < 0.1
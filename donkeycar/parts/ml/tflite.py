@@ -0,0 +1,153 @@
+'''
+
+tflite.py
+
+Export trained keras pilots to quantized TensorFlow Lite models, and a
+pilot that drives with them. A quantized model runs several times faster
+than keras on a Pi CPU and only needs the tflite_runtime package.
+
+'''
+
+import numpy as np
+
+from donkeycar.parts.ml.pilot import Pilot
+
+
+QUANTIZATIONS = ('int8', 'float16', 'none')
+
+
+OUTPUTS = ('angle_out', 'throttle_out')
+
+
+def spread_records(tub_paths, count):
+    '''
+    Return the (tub, index) of up to count records spread evenly over the
+    records of the tubs, so only those need to be read.
+    '''
+    from donkeycar.parts.stores.tub import Tub
+
+    records = []
+    for path in tub_paths:
+        tub = Tub(path)
+        records += [(tub, ix) for ix in tub.get_index(shuffled=False)]
+    if not records:
+        raise ValueError('No records in {}'.format(tub_paths))
+    step = max(1, len(records) // count)
+    return records[::step][:count]
+
+
+def representative_images(tub_paths, count=200, key='cam/image_array'):
+    '''
+    Return up to count images spread evenly over the records of the tubs,
+    preprocessed the way they are for training, to calibrate the ranges of
+    an int8 model.
+    '''
+    return [tub.get_record(ix)[key] for tub, ix in spread_records(tub_paths, count)]
+
+
+def export_tflite(model_path, out_path, quantize='int8', representative=None):
+    '''
+    Convert the keras model saved at model_path to a TensorFlow Lite model
+    at out_path.
+
+    'int8' quantizes the weights and activations, their ranges measured on
+    the representative images, and keeps float inputs and outputs so the
+    model is used like the keras one. 'float16' halves the size of the
+    weights only, 'none' converts as is.
+    '''
+    import tensorflow as tf
+
+    if quantize not in QUANTIZATIONS:
+        raise ValueError('quantize must be one of {}'.format(QUANTIZATIONS))
+    if quantize == 'int8' and not representative:
+        raise ValueError('int8 quantization needs representative images')
+
+    if hasattr(tf.lite.TFLiteConverter, 'from_keras_model'):
+        model = tf.keras.models.load_model(model_path, compile=False)
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    else:
+        converter = tf.lite.TFLiteConverter.from_keras_model_file(model_path)
+
+    if quantize == 'int8':
+        def dataset():
+            for img in representative:
+                yield [np.asarray(img, dtype=np.float32)[None]]
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = dataset
+    elif quantize == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+
+    flatbuffer = converter.convert()
+    with open(out_path, 'wb') as f:
+        f.write(flatbuffer)
+    return out_path
+
+
+def load_interpreter(model_path, num_threads=None):
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    if num_threads:
+        return Interpreter(model_path=model_path, num_threads=num_threads)
+    return Interpreter(model_path=model_path)
+
+
+def output_details(interpreter):
+    '''
+    Details of the output tensors in the order of the keras model outputs,
+    angle then throttle, found by the names of the output layers in the
+    model's signature or else in the names of the tensors.
+    '''
+    try:
+        named = interpreter.get_signature_runner().get_output_details()
+    except (AttributeError, ValueError):
+        named = {}
+    if all(name in named for name in OUTPUTS):
+        return [named[name] for name in OUTPUTS]
+    details = interpreter.get_output_details()
+    found = []
+    for name in OUTPUTS:
+        matches = [d for d in details if name in d['name']]
+        if len(matches) != 1:
+            raise ValueError('Can\'t find the {} output of the model in {}'.format(
+                name, [d['name'] for d in details]))
+        found += matches
+    return found
+
+
+class TFLitePilot(Pilot):
+    '''
+    Drive with a model exported by export_tflite. Used like the keras
+    pilots: run takes one or more frames and returns the angle and
+    throttle of each.
+    '''
+
+    def __init__(self, model_path=None, num_threads=None):
+        super(TFLitePilot, self).__init__()
+        self.num_threads = num_threads
+        self.interpreter = None
+        if model_path:
+            self.load(model_path)
+
+    def load(self, model_path):
+        self.interpreter = load_interpreter(model_path, self.num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.outputs = output_details(self.interpreter)
+        self.batch_size = self.input['shape'][0]
+
+    def predict(self, batch):
+        '''
+        Return the outputs of the model for a batch of frames.
+        '''
+        batch = np.asarray(batch, dtype=self.input['dtype'])
+        if len(batch) != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input['index'], batch.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(batch)
+        self.interpreter.set_tensor(self.input['index'], batch)
+        self.interpreter.invoke()
+        return [self.interpreter.get_tensor(d['index']) for d in self.outputs]
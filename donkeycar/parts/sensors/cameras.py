@@ -5,8 +5,27 @@ from PIL import Image
 import glob
 
 class BaseCamera:
+    '''
+    Cameras keep the time the current frame was captured in frame_time so
+    the vehicle can trace how old a frame is when parts act on it.
+
+    Threaded cameras publish each frame together with its capture time,
+    and run_threaded sets frame_time to the time of the frame it returns,
+    so a frame arriving while the drive loop reads them can't mix the two.
+    '''
+    frame = None
+    frame_time = None
+    captured = None
+
+    def publish(self, frame, frame_time):
+        '''
+        Make a frame the current one, from the update thread.
+        '''
+        self.captured = (frame, frame_time)
 
     def run_threaded(self):
+        if self.captured is not None:
+            self.frame, self.frame_time = self.captured
         return self.frame
 
 class PiCamera(BaseCamera):
@@ -35,7 +54,7 @@ class PiCamera(BaseCamera):
         for f in self.stream:
             # grab the frame from the stream and clear the stream in
             # preparation for the next frame
-            self.frame = f.array
+            self.publish(f.array, time.time())
             self.rawCapture.truncate(0)
 
             # if the thread indicator variable is set, stop the thread
@@ -84,9 +103,11 @@ class Webcam(BaseCamera):
             if self.cam.query_image():
                 # snapshot = self.cam.get_image()
                 # self.frame = list(pygame.image.tostring(snapshot, "RGB", False))
+                frame_time = time.time()
                 snapshot = self.cam.get_image()
                 snapshot1 = pygame.transform.scale(snapshot, self.resolution)
-                self.frame = pygame.surfarray.pixels3d(pygame.transform.rotate(pygame.transform.flip(snapshot1, True, False), 90))
+                frame = pygame.surfarray.pixels3d(pygame.transform.rotate(pygame.transform.flip(snapshot1, True, False), 90))
+                self.publish(frame, frame_time)
 
             stop = datetime.now()
             s = 1 / self.framerate - (stop - start).total_seconds()
@@ -95,9 +116,6 @@ class Webcam(BaseCamera):
 
         self.cam.stop()
 
-    def run_threaded(self):
-        return self.frame
-
     def shutdown(self):
         # indicate that the thread should be stopped
         self.on = False
@@ -113,6 +131,7 @@ class MockCamera(BaseCamera):
             self.frame = image
         else:
             self.frame = Image.new('RGB', resolution)
+        self.frame_time = time.time()
 
     def update(self):
         pass
@@ -152,6 +171,7 @@ class ImageListCamera(BaseCamera):
     def run_threaded(self):        
         if self.num_images > 0:
             self.i_frame = (self.i_frame + 1) % self.num_images
+            self.frame_time = time.time()
             self.frame = Image.open(self.image_filenames[self.i_frame]) 
 
         return np.asarray(self.frame)
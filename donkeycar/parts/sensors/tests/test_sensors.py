@@ -1,6 +1,7 @@
 import unittest
 
 import donkeycar as dk
+from ..cameras import BaseCamera
 
 class TestBaseCamera(unittest.TestCase):
 
@@ -8,6 +9,21 @@ class TestBaseCamera(unittest.TestCase):
         self.camera = dk.sensors.BaseCamera()
         
 
+class TestFrameTime(unittest.TestCase):
+
+    def test_frame_and_time_together(self):
+        camera = BaseCamera()
+        camera.publish('frame 1', 1.0)
+        frame = camera.run_threaded()
+        #a new frame arriving before the vehicle reads frame_time
+        camera.publish('frame 2', 2.0)
+        assert (frame, camera.frame_time) == ('frame 1', 1.0)
+        assert (camera.run_threaded(), camera.frame_time) == ('frame 2', 2.0)
+
+    def test_not_published(self):
+        camera = BaseCamera()
+        assert camera.run_threaded() is None
+        assert camera.frame_time is None
 
 
 if __name__ == '__main__':
@@ -80,7 +80,128 @@ WEIGHTED_AUGMENTATIONS = [
         (brightness, 5)
         ]
 
+POPULATION = [val for val, cnt in WEIGHTED_AUGMENTATIONS for i in range(cnt)]
+
 def augment(data):
-    population = [val for val, cnt in WEIGHTED_AUGMENTATIONS for i in range(cnt)]
-    aug = random.choice(population)
+    aug = random.choice(POPULATION)
     return aug(data)
+
+
+# Augmentations of whole NHWC uint8 batches. Each takes a batch of images,
+# their angles and a numpy RandomState and returns new images and angles,
+# changing them like the record augmentations above.
+
+def identical_batch(images, angles, rng):
+    return images, angles
+
+
+def reflection_batch(images, angles, rng):
+    images = images[:, :, ::-1]
+    angles = np.where(angles > 0,
+                      np.maximum(angles / -0.775862, -1),
+                      angles * -0.775862)
+    return images, angles
+
+
+def brightness_batch(images, angles, rng):
+    # Scaling V in HSV scales R, G and B alike, as long as V stays <= 255.
+    random_bright = (.3 + rng.uniform(size=(len(images), 1, 1))).astype(np.float32)
+    value = np.maximum(np.maximum(images[..., 0], images[..., 1]), images[..., 2])
+    scale = np.float32(255.) / np.maximum(value, 1).astype(np.float32)
+    np.minimum(scale, random_bright, out=scale)
+    #repeat the scale of each pixel over its channels, a broadcast over the
+    #short channel axis is much slower
+    image = np.stack([scale] * images.shape[3], axis=-1)
+    image *= images
+    return image.astype(np.uint8), angles
+
+
+def white_unbalance_batch(images, angles, rng):
+    n, h, w, c = images.shape
+    low = rng.uniform(size=(n, 1, c)) * 0.25
+    high = rng.uniform(size=(n, 1, c)) * 0.25 + 0.75
+    exposure = rng.uniform(size=(n, 1, 1)) * 0.3 + 1.0
+    # Make exposure ocasionally brighter, then adjust white balance. Rows
+    # of pixels are scaled by the channel factors tiled along the row.
+    rows = images.reshape(n, h, w * c)
+    image = np.multiply(rows, (exposure / 255.).astype(np.float32))
+    np.minimum(image, np.float32(1.0), out=image)
+    image *= np.tile((high - low) * 255, (1, 1, w)).astype(np.float32)
+    image += np.tile(low * 255, (1, 1, w)).astype(np.float32)
+    return image.astype(np.uint8).reshape(images.shape), angles
+
+
+def random_rects_batch(images, angles, rng, max_rects=32, max_size=20):
+    # Draw random rectangles over the images so we don't overfit to one feature.
+    n, h, w = images.shape[:3]
+    count = rng.randint(0, max_rects + 1, size=(n, 1))
+    rs = rng.rand(n, max_rects, 4)
+    rc = np.clip(rng.randn(n, max_rects, 3) * 0.3, -1.0, 1.0) * 127 + 127
+
+    #the rectangles drawn, ordered by image and then by drawing order
+    img, rect = np.nonzero(np.arange(max_rects) < count)
+    rs = rs[img, rect]
+    colors = rc[img, rect].astype(np.uint8)
+    x0 = (rs[:, 0] * 1.4 - 0.2) * w
+    y0 = (rs[:, 1] * 1.4 - 0.2) * h
+    x1 = x0 + rs[:, 2] * max_size
+    y1 = y0 + rs[:, 3] * max_size
+
+    #mask of each rectangle in a window of the largest rectangle's size
+    offsets = np.arange(max_size + 1)
+    xs = np.ceil(x0)[:, None] + offsets
+    ys = np.ceil(y0)[:, None] + offsets
+    in_x = (xs <= x1[:, None]) & (xs >= 0) & (xs < w)
+    in_y = (ys <= y1[:, None]) & (ys >= 0) & (ys < h)
+    r, a, b = np.nonzero(in_y[:, :, None] & in_x[:, None, :])
+
+    #pixels are painted in drawing order, the last rectangle wins
+    images = images.copy()
+    images[img[r], ys[r, a].astype(np.intp), xs[r, b].astype(np.intp)] = colors[r]
+    return images, angles
+
+
+WEIGHTED_BATCH_AUGMENTATIONS = [
+        (identical_batch, 10),
+        (white_unbalance_batch, 20),
+        (reflection_batch, 10),
+        (random_rects_batch, 20),
+        (brightness_batch, 5)
+        ]
+
+
+class BatchAugmenter:
+    '''
+    Augments a batch of images and angles by drawing one augmentation per
+    image with the given weights, then running each augmentation once on
+    all the images that drew it.
+    '''
+    def __init__(self, weighted=WEIGHTED_BATCH_AUGMENTATIONS, seed=None):
+        self.augmentations = [aug for aug, cnt in weighted]
+        weights = np.array([cnt for aug, cnt in weighted], dtype=np.float64)
+        self.probabilities = weights / weights.sum()
+        self.rng = np.random.RandomState(seed)
+
+    def __call__(self, images, angles):
+        images = np.array(images, dtype=np.uint8)
+        angles = np.array(angles, dtype=np.float64)
+        choices = self.rng.choice(len(self.augmentations), size=len(images),
+                                  p=self.probabilities)
+        for i, aug in enumerate(self.augmentations):
+            if aug is identical_batch:
+                continue
+            picked = np.nonzero(choices == i)[0]
+            if len(picked):
+                images[picked], angles[picked] = aug(images[picked], angles[picked], self.rng)
+        return images, angles
+
+    def augment_records(self, records, image_key='cam/image_array',
+                        angle_key='user/angle'):
+        '''
+        Augment the images and angles of a list of records in place.
+        '''
+        images, angles = self([r[image_key] for r in records],
+                              [r[angle_key] for r in records])
+        for r, img, angle in zip(records, images, angles):
+            r[image_key] = img
+            r[angle_key] = float(angle)
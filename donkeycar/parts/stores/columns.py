@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+columns.py
+
+Scalar values of a tub kept column by column, one file per input, so
+statistics over a whole tub are numpy operations over memory mapped
+arrays instead of reading every record.
+"""
+import os
+import shutil
+import threading
+
+import numpy as np
+
+
+COLUMNS_DIR = 'columns'
+
+COLUMN_DTYPES = {
+    'float': '<f8',
+    'int': '<i8',
+    'boolean': '?',
+}
+
+
+def column_file_name(key):
+    return key.replace('/', '-') + '.bin'
+
+
+class ColumnStore:
+    """
+    Appends the scalar inputs of each record to a file per input, next to
+    a file with the index of each record.
+
+    A None value is saved as NaN in a float column and as 0, False or ''
+    in other columns.
+
+    Parameters
+    ----------
+        path : str
+            Folder of the tub.
+        inputs, types : list
+            The tub's inputs and their types, only str, int, float and
+            boolean inputs get a column.
+        str_width : int
+            Bytes kept of 'str' values.
+    """
+    def __init__(self, path, inputs, types, str_width=32):
+        self.path = os.path.join(path, COLUMNS_DIR)
+        self.dtypes = {}
+        for key, typ in zip(inputs, types):
+            if typ in COLUMN_DTYPES:
+                self.dtypes[key] = np.dtype(COLUMN_DTYPES[typ])
+            elif typ == 'str':
+                self.dtypes[key] = np.dtype('S{}'.format(str_width))
+        self.lock = threading.Lock()
+        self._files = {}
+
+    def key_path(self, key):
+        return os.path.join(self.path, column_file_name(key))
+
+    @property
+    def ix_path(self):
+        return os.path.join(self.path, 'ix.bin')
+
+    def exists(self):
+        return os.path.exists(self.ix_path)
+
+    def empty_value(self, key):
+        return np.nan if self.dtypes[key].kind == 'f' else 0
+
+    def pack(self, ix, data):
+        packed = {'ix': np.array([ix], dtype='<i8').tobytes()}
+        for key, dtype in self.dtypes.items():
+            val = data.get(key)
+            if val is None:
+                val = b'' if dtype.kind == 'S' else self.empty_value(key)
+            elif dtype.kind == 'S':
+                val = str(val).encode('utf-8')
+            packed[key] = np.array([val], dtype=dtype).tobytes()
+        return packed
+
+    def append(self, ix, data):
+        packed = self.pack(ix, data)
+        with self.lock:
+            if not self._files:
+                self.open_for_append()
+            #the index column goes last, a row counts once it is written
+            for key in self.dtypes:
+                self._files[key].write(packed[key])
+                self._files[key].flush()
+            self._files['ix'].write(packed['ix'])
+            self._files['ix'].flush()
+
+    def open_for_append(self):
+        os.makedirs(self.path, exist_ok=True)
+        rows = 0
+        if os.path.exists(self.ix_path):
+            rows = os.path.getsize(self.ix_path) // 8
+        self._files['ix'] = open(self.ix_path, 'ab')
+        for key, dtype in self.dtypes.items():
+            f = open(self.key_path(key), 'ab')
+            #drop values of a row whose index was never written
+            f.truncate(rows * dtype.itemsize)
+            self._files[key] = f
+
+    def rebuild(self, records):
+        """
+        Write the columns again from (ix, record) pairs.
+        """
+        self.close()
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        for ix, data in records:
+            self.append(ix, data)
+        self.close()
+        os.makedirs(self.path, exist_ok=True)
+        open(self.ix_path, 'ab').close()
+
+    def close(self):
+        with self.lock:
+            for f in self._files.values():
+                f.close()
+            self._files = {}
+
+    def read(self, path, dtype, rows):
+        if rows == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(rows,))
+
+    def ixs(self):
+        """
+        The index of the record saved in each row, memory mapped.
+        """
+        with self.lock:
+            for f in self._files.values():
+                f.flush()
+        rows = os.path.getsize(self.ix_path) // 8
+        return self.read(self.ix_path, np.dtype('<i8'), rows)
+
+    def rows_of(self, index):
+        """
+        Return the row holding the last values written of every record in
+        index.
+        """
+        ixs = np.asarray(self.ixs())
+        #the last row of a record wins, so look it up from the end
+        rev = ixs[::-1]
+        order = np.argsort(rev, kind='mergesort')
+        sorted_ixs = rev[order]
+        index = np.asarray(index, dtype='<i8')
+        pos = np.searchsorted(sorted_ixs, index, side='left')
+        found = pos < len(sorted_ixs)
+        found[found] = sorted_ixs[pos[found]] == index[found]
+        if not found.all():
+            missing = index[~found][:5].tolist()
+            raise KeyError('records {} have no column values'.format(missing))
+        return len(ixs) - 1 - order[pos]
+
+    def covers(self, index):
+        try:
+            self.rows_of(index)
+        except KeyError:
+            return False
+        return True
+
+    def column(self, key, index):
+        """
+        Return the values of key for the records in index, in that order.
+        """
+        if key not in self.dtypes:
+            raise KeyError('{} is not a str, int, float or boolean input'.format(key))
+        rows = self.rows_of(index)
+        count = len(self.ixs())
+        values = np.asarray(self.read(self.key_path(key), self.dtypes[key], count))[rows]
+        if values.dtype.kind == 'S':
+            values = np.char.decode(values, 'utf-8')
+        return values
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+image_cache.py
+
+Images of tubs decoded, undistorted and cropped once, and saved in a
+single array file that training memory maps instead of decoding every
+JPEG again each epoch.
+"""
+import os
+import json
+
+import numpy as np
+
+
+def normpath(path):
+    return os.path.abspath(os.path.expanduser(path))
+
+
+def describe(tubs, key):
+    """
+    What the images of a cache of the tubs depend on: the tubs, their
+    number of records and when their index last changed, and how the
+    images were preprocessed.
+    """
+    return {'key': key,
+            'tubs': [normpath(tub.path) for tub in tubs],
+            'counts': [len(tub.get_index(shuffled=False)) for tub in tubs],
+            'mtimes': [os.path.getmtime(tub.index.path) for tub in tubs],
+            'preprocessing': tubs[0].undistort.settings() if tubs else None}
+
+
+class ImageCache:
+    """
+    A folder holding images.npy, the preprocessed uint8 images of a set of
+    tubs, records.npy, the (tub number, record index) of each image, and
+    meta.json with the input that was cached and what the images depend
+    on, see describe. open rebuilds a cache that no longer matches its
+    tubs, after records were added or deleted or the camera calibration
+    changed for instance.
+
+    >>> cache = ImageCache.open('~/mycar/cache', tubs)
+    >>> img = cache.get(tubs[0].path, 12)
+    """
+    def __init__(self, path):
+        self.path = normpath(path)
+        with open(os.path.join(self.path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        self.key = self.meta['key']
+        self.tubs = self.meta['tubs']
+        self.images = np.load(os.path.join(self.path, 'images.npy'), mmap_mode='r')
+        records = np.load(os.path.join(self.path, 'records.npy'))
+        self.rows = {}
+        for row, (tub_no, ix) in enumerate(records.tolist()):
+            self.rows[(self.tubs[tub_no], ix)] = row
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, tub_path, ix):
+        """
+        Return a read only view of the image of a record, None if the
+        record isn't in the cache.
+        """
+        row = self.rows.get((normpath(tub_path), ix))
+        if row is None:
+            return None
+        return self.images[row]
+
+    def matches(self, tubs, key='cam/image_array'):
+        """
+        True if the cache holds the images of these tubs as they are now.
+        """
+        return all(self.meta.get(k) == v for k, v in describe(tubs, key).items())
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(os.path.join(normpath(path), 'meta.json'))
+
+    @classmethod
+    def open(cls, path, tubs, key='cam/image_array'):
+        """
+        Return the cache at path if it matches the tubs, else build it
+        again.
+        """
+        if cls.exists(path):
+            cache = cls(path)
+            if cache.matches(tubs, key):
+                return cache
+            print('Image cache {} is out of date, rebuilding it'.format(path))
+        return cls.build(path, tubs, key)
+
+    @classmethod
+    def build(cls, path, tubs, key='cam/image_array'):
+        """
+        Preprocess the images saved under key in every record of the tubs,
+        given as Tubs or paths, the way Tub.get_record does and save them
+        in a new cache at path.
+        """
+        from .tub import Tub
+
+        path = normpath(path)
+        os.makedirs(path, exist_ok=True)
+        tubs = [tub if isinstance(tub, Tub) else Tub(tub) for tub in tubs]
+        indexes = [tub.get_index(shuffled=False) for tub in tubs]
+        count = sum(len(index) for index in indexes)
+        records = np.zeros((count, 2), dtype=np.int64)
+
+        images = None
+        row = 0
+        for tub_no, (tub, index) in enumerate(zip(tubs, indexes)):
+            for ix in index:
+                img = tub.get_record(ix)[key]
+                if images is None:
+                    images = np.lib.format.open_memmap(
+                        os.path.join(path, 'images.npy.tmp'), mode='w+',
+                        dtype=np.uint8, shape=(count,) + img.shape)
+                images[row] = img
+                records[row] = (tub_no, ix)
+                row += 1
+            print('cached {} images of {}'.format(len(index), tub.path))
+
+        if images is None:
+            raise ValueError('No records to cache in {}'.format([tub.path for tub in tubs]))
+        images.flush()
+        del images
+        os.replace(os.path.join(path, 'images.npy.tmp'),
+                   os.path.join(path, 'images.npy'))
+        np.save(os.path.join(path, 'records.npy'), records)
+        meta = describe(tubs, key)
+        meta['count'] = count
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        return cls(path)
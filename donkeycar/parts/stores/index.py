@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+index.py
+
+The record index of a tub, kept in the file index.bin of the tub so the
+records don't have to be found by listing the tub's folder.
+
+Every record written appends a fixed width row with its index, the time
+it was written, where it was written and its flags. Loading the index is
+a single read of that file.
+"""
+import os
+import threading
+
+import numpy as np
+
+
+INDEX_FILE = 'index.bin'
+
+#flags of a row
+DELETED = 1
+
+ROW_DTYPE = np.dtype([
+    ('ix', '<i8'),
+    ('time', '<f8'),
+    ('segment', '<u4'),
+    ('offset', '<u8'),
+    ('flags', 'u1'),
+])
+
+
+class RecordIndex:
+    """
+    Maps the index of every record of a tub to the time it was written and
+    the segment and byte offset where it is saved. A record written again
+    under the same index replaces the earlier row.
+
+    Parameters
+    ----------
+        path : str
+            Path of the index file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.deleted = set()
+        self.rows = 0
+        self._file = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def is_stale(self, paths):
+        """
+        True if one of the paths was changed after the index, for example
+        when records were deleted without going through the tub.
+        """
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return True
+        return any(os.path.getmtime(p) > mtime for p in paths
+                   if p and os.path.exists(p))
+
+    def load(self):
+        rows = np.fromfile(self.path, dtype=ROW_DTYPE)
+        self.set_rows(rows)
+
+    def set_rows(self, rows):
+        with self.lock:
+            self.entries = dict(zip(rows['ix'].tolist(),
+                                    zip(range(len(rows)),
+                                        rows['time'].tolist(),
+                                        rows['segment'].tolist(),
+                                        rows['offset'].tolist())))
+            #only the last row of a record counts
+            flagged = rows['ix'][rows['flags'] & DELETED != 0].tolist()
+            self.deleted = {ix for ix in flagged
+                            if rows['flags'][self.entries[ix][0]] & DELETED}
+            self.rows = len(rows)
+
+    def rebuild(self, rows):
+        """
+        Replace the index with the given rows, a sequence of
+        (ix, time, segment, offset, flags) tuples.
+        """
+        rows = np.array(list(rows), dtype=ROW_DTYPE)
+        self.close()
+        tmp_path = self.path + '.tmp'
+        rows.tofile(tmp_path)
+        os.replace(tmp_path, self.path)
+        #the rename changed the folder, keep the index newer than it
+        os.utime(self.path)
+        self.set_rows(rows)
+
+    def append(self, ix, timestamp, segment=0, offset=0):
+        row = np.array([(ix, timestamp, segment, offset, 0)], dtype=ROW_DTYPE)
+        with self.lock:
+            if self._file is None:
+                self._file = open(self.path, 'ab')
+            self._file.write(row.tobytes())
+            self._file.flush()
+            self.entries[ix] = (self.rows, timestamp, segment, offset)
+            self.deleted.discard(ix)
+            self.rows += 1
+
+    def delete(self, ix):
+        """
+        Set the deleted flag in the row of a record.
+        """
+        with self.lock:
+            row = self.entries[ix][0]
+            if self._file is not None:
+                self._file.flush()
+            with open(self.path, 'r+b') as f:
+                f.seek(row * ROW_DTYPE.itemsize + ROW_DTYPE.fields['flags'][1])
+                f.write(bytes([DELETED]))
+            self.deleted.add(ix)
+
+    def close(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def ids(self):
+        deleted = self.deleted
+        return sorted(ix for ix in self.entries if ix not in deleted)
+
+    def count(self):
+        return len(self.entries) - len(self.deleted)
+
+    def last_ix(self):
+        deleted = self.deleted
+        return max(ix for ix in self.entries if ix not in deleted)
+
+    def __contains__(self, ix):
+        return ix in self.entries and ix not in self.deleted
+
+    def timestamp(self, ix):
+        return self.entries[ix][1]
+
+    def position(self, ix):
+        """
+        Return the segment and byte offset of a record.
+        """
+        _, _, segment, offset = self.entries[ix]
+        return segment, offset
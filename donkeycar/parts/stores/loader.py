@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+loader.py
+
+Load training batches from tubs in worker processes, so decoding,
+undistorting and augmenting records doesn't hold up training.
+"""
+import multiprocessing as mp
+import queue
+import random
+import traceback
+
+import numpy as np
+
+
+def load_record(tubs, record, record_transform, augmented):
+    tub_no, ix = record
+    data = tubs[tub_no].get_record(ix, augmented)
+    if record_transform:
+        data = record_transform(data)
+    return data
+
+
+def batch_seed(seed, batch):
+    return (seed * 1000003 + batch) % (2 ** 32)
+
+
+def load_batch(tubs, records, record_transform, augmented, augmenter, seed):
+    if augmenter is None:
+        return [load_record(tubs, r, record_transform, augmented) for r in records]
+    #augment the batch as a whole first, the record transform may bin angles
+    batch = [load_record(tubs, r, None, augmented) for r in records]
+    augmenter.rng.seed(seed)
+    augmenter.augment_records(batch)
+    if record_transform:
+        batch = [record_transform(data) for data in batch]
+    return batch
+
+
+def load_batches(tubs, keys, buffers, shapes, dtypes, record_transform,
+                 augmented, augmenter, tasks, done):
+    """
+    Main function of a worker process. Loads the records of each batch it
+    is given into a slot of the shared buffers until it receives None.
+    """
+    #don't share open files with the parent or the other workers
+    for tub in tubs:
+        tub.shutdown()
+
+    arrays = {k: np.frombuffer(buffers[k], dtype=dtypes[k]).reshape((-1,) + shapes[k])
+              for k in keys}
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        batch, slot, records, seed = task
+        random.seed(seed)
+        np.random.seed(seed)
+        try:
+            batch_data = load_batch(tubs, records, record_transform, augmented,
+                                    augmenter, seed)
+            for i, data in enumerate(batch_data):
+                for k in keys:
+                    arrays[k][slot, i] = data[k]
+            done.put((batch, None))
+        except Exception as e:
+            done.put((batch, '{}\n{}'.format(e, traceback.format_exc())))
+
+
+class BatchLoader:
+    """
+    Generator of (X, Y) batches like Tub.train_gen, with the records loaded
+    by a pool of worker processes.
+
+    Batches are assigned to the workers in turn, each worker fills the
+    batch in a slot of a preallocated shared memory buffer and up to
+    `prefetch` batches are loaded ahead of the one being trained on. Every
+    epoch goes through all records once, in an order drawn from the seed
+    and the epoch number, and each batch seeds the random augmentations
+    the same way, so a run can be repeated. The last batch of an epoch
+    holds the records left over and may be smaller than batch_size.
+
+    Workers are forked, so record_transform may be any function.
+
+    Parameters
+    ----------
+        tubs : list
+            The tubs to load records from.
+        records : list
+            (tub number, record index) pairs.
+        X_keys, Y_keys : list
+            Inputs returned as the X and Y of each batch.
+        workers : int
+            Number of worker processes.
+        prefetch : int
+            Number of batches loaded ahead.
+        seed : int
+            Seed of the record order and augmentations.
+        shuffle : boolean
+            Draw a new record order every epoch, else keep the given order.
+        augmenter : BatchAugmenter
+            Augments each batch before the record transform, seeded by the
+            batch like the rest of its augmentations.
+    """
+    def __init__(self, tubs, records, X_keys, Y_keys, batch_size=128,
+                 record_transform=None, augmented=False, workers=2,
+                 prefetch=4, seed=0, shuffle=True, timeout=60, augmenter=None):
+        self.tubs = tubs
+        self.records = list(records)
+        self.X_keys = X_keys
+        self.Y_keys = Y_keys
+        self.keys = list(X_keys) + list(Y_keys)
+        self.batch_size = batch_size
+        self.seed = seed
+        self.shuffle = shuffle
+        self.prefetch = max(1, prefetch)
+        self.timeout = timeout
+        self.augmenter = augmenter
+        if not self.records:
+            raise ValueError('No records to load batches from')
+        self.batches_per_epoch = -(-len(self.records) // batch_size)
+
+        #one record tells the shape of the buffers
+        sample = load_record(tubs, self.records[0], record_transform, False)
+        self.shapes = {}
+        self.dtypes = {}
+        self.buffers = {}
+        for k in self.keys:
+            arr = np.asarray(sample[k])
+            self.shapes[k] = (batch_size,) + arr.shape
+            self.dtypes[k] = arr.dtype
+            size = int(np.prod(self.shapes[k])) * arr.dtype.itemsize
+            self.buffers[k] = mp.RawArray('b', size * self.prefetch)
+        self.arrays = {k: np.frombuffer(self.buffers[k], dtype=self.dtypes[k])
+                       .reshape((self.prefetch,) + self.shapes[k])
+                       for k in self.keys}
+
+        ctx = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() \
+            else mp.get_context()
+        self.done = ctx.Queue()
+        self.tasks = []
+        self.processes = []
+        for _ in range(max(1, workers)):
+            tasks = ctx.Queue()
+            p = ctx.Process(target=load_batches,
+                            args=(tubs, self.keys, self.buffers, self.shapes,
+                                  self.dtypes, record_transform, augmented,
+                                  augmenter, tasks, self.done))
+            p.daemon = True
+            p.start()
+            self.tasks.append(tasks)
+            self.processes.append(p)
+
+        #number of records of the batch in each slot
+        self.sizes = [0] * self.prefetch
+        self.orders = {}
+        self.submitted = 0
+        self.next_batch = 0
+        self.finished = {}
+        for _ in range(self.prefetch):
+            self.submit()
+
+    def epoch_order(self, epoch):
+        order = self.orders.get(epoch)
+        if order is None:
+            if self.shuffle:
+                rng = np.random.RandomState(batch_seed(self.seed, epoch))
+                order = rng.permutation(len(self.records))
+            else:
+                order = np.arange(len(self.records))
+            #only the current epoch and the one being prefetched are kept
+            self.orders = {e: o for e, o in self.orders.items() if e >= epoch - 1}
+            self.orders[epoch] = order
+        return order
+
+    def batch_records(self, batch):
+        epoch, n = divmod(batch, self.batches_per_epoch)
+        order = self.epoch_order(epoch)
+        start = n * self.batch_size
+        return [self.records[i] for i in order[start:start + self.batch_size]]
+
+    def submit(self):
+        batch = self.submitted
+        records = self.batch_records(batch)
+        self.sizes[batch % self.prefetch] = len(records)
+        task = (batch, batch % self.prefetch, records,
+                batch_seed(self.seed + 1, batch))
+        self.tasks[batch % len(self.tasks)].put(task)
+        self.submitted += 1
+
+    def wait(self, batch):
+        while batch not in self.finished:
+            try:
+                done, error = self.done.get(timeout=self.timeout)
+            except queue.Empty:
+                if not all(p.is_alive() for p in self.processes):
+                    raise RuntimeError('A batch loader process died.')
+                continue
+            if error is not None:
+                raise RuntimeError('Could not load batch {}: {}'.format(done, error))
+            self.finished[done] = True
+        del self.finished[batch]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        batch = self.next_batch
+        self.wait(batch)
+        slot = batch % self.prefetch
+        size = self.sizes[slot]
+        #copy out, the slot is filled again as soon as the next batch is asked for
+        X = [np.array(self.arrays[k][slot, :size]) for k in self.X_keys]
+        Y = [np.array(self.arrays[k][slot, :size]) for k in self.Y_keys]
+        self.next_batch += 1
+        self.submit()
+        return X, Y
+
+    def close(self):
+        for tasks in self.tasks:
+            tasks.put(None)
+        for p in self.processes:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        self.processes = []
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+record_cache.py
+
+Decoded tub records kept in memory up to a byte budget, so training on
+tubs larger than memory only decodes the records that don't fit.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def record_size(record):
+    """
+    Bytes taken by the values of a record, roughly.
+    """
+    size = sys.getsizeof(record)
+    for val in record.values():
+        if isinstance(val, np.ndarray):
+            size += val.nbytes
+        else:
+            size += sys.getsizeof(val)
+    return size
+
+
+class RecordCache:
+    """
+    A least recently used cache of records, safe to share between the
+    threads of the train and validation generators.
+
+    Cached arrays are made read only, and get returns a copy of the record
+    dict, so augmentations and record transforms can replace values
+    without changing the cache.
+
+    Parameters
+    ----------
+        max_bytes : int
+            Budget of the cache, the least recently used records are
+            dropped to stay under it.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.records = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.records.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.records.move_to_end(key)
+            self.hits += 1
+        return dict(entry[0])
+
+    def put(self, key, record):
+        """
+        Cache a record and return a copy of it as get would.
+        """
+        record = dict(record)
+        for name, val in record.items():
+            if isinstance(val, np.ndarray):
+                #a view, like a cropped image, would keep its whole base alive
+                if val.base is not None:
+                    val = record[name] = val.copy()
+                val.setflags(write=False)
+        size = record_size(record)
+        if size > self.max_bytes:
+            return dict(record)
+        with self.lock:
+            old = self.records.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            while self.records and self.bytes + size > self.max_bytes:
+                _, (_, evicted) = self.records.popitem(last=False)
+                self.bytes -= evicted
+            self.records[key] = (record, size)
+            self.bytes += size
+        return dict(record)
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {'records': len(self.records), 'bytes': self.bytes,
+                'hits': self.hits, 'misses': self.misses}
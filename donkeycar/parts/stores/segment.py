@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+segment.py
+
+Append-only storage for tub records.
+
+Records are packed into fixed width rows in segment files,
+records_<n>.seg, using the types in the tub's meta.json. Images are
+appended as JPEG bytes to a companion blob file, images_<n>.blob, and the
+row keeps their offset and length. An hour of driving is then a handful
+of large files instead of a JSON file and a JPEG per frame.
+"""
+import os
+import time
+import threading
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+
+SEGMENT_FORMAT = 'segment'
+RECORDS_PER_SEGMENT = 10000
+STR_WIDTH = 32
+
+#flags of a row
+DELETED = 1
+
+SCALAR_DTYPES = {
+    'float': '<f8',
+    'int': '<i8',
+    'boolean': '?',
+}
+
+IMAGE_TYPES = ('image', 'image_array')
+
+
+def record_dtype(inputs, types, str_width=STR_WIDTH):
+    """
+    Numpy dtype of a row holding a record of the given inputs and types.
+    A bit of the mask is set for every input that isn't None.
+    """
+    fields = [('ix', '<i8'), ('time', '<f8'), ('flags', 'u1'), ('mask', '<u8')]
+    for key, typ in zip(inputs, types):
+        if typ in SCALAR_DTYPES:
+            fields.append((key, SCALAR_DTYPES[typ]))
+        elif typ == 'str':
+            fields.append((key, 'S{}'.format(str_width)))
+        elif typ in IMAGE_TYPES:
+            fields.append((key + '#offset', '<u8'))
+            fields.append((key + '#length', '<u4'))
+        else:
+            msg = 'Tub does not know what to do with this type {}'.format(typ)
+            raise TypeError(msg)
+    return np.dtype(fields)
+
+
+def encode_image(val, typ):
+    """
+    JPEG bytes of an image or an image array.
+    """
+    if typ == 'image_array':
+        val = Image.fromarray(np.uint8(val))
+    f = BytesIO()
+    val.save(f, format='jpeg')
+    return f.getvalue()
+
+
+class SegmentStore:
+    """
+    Reads and appends the records of a tub in the segment format.
+
+    Parameters
+    ----------
+        path : str
+            Folder of the tub.
+        inputs, types : list
+            The tub's inputs and their types.
+        str_width : int
+            Bytes reserved for 'str' values, longer values are cut.
+        records_per_segment : int
+            Rows written to a segment before starting a new one.
+    """
+    def __init__(self, path, inputs, types, str_width=STR_WIDTH,
+                 records_per_segment=RECORDS_PER_SEGMENT):
+        self.path = path
+        self.inputs = list(inputs)
+        self.types = list(types)
+        self.str_width = str_width
+        self.records_per_segment = records_per_segment
+        self.dtype = record_dtype(self.inputs, self.types, str_width)
+        self.lock = threading.Lock()
+        self._record_file = None
+        self._blob_file = None
+        self._readers = {}
+        self.count_rows()
+
+    def meta(self):
+        return {'str_width': self.str_width,
+                'records_per_segment': self.records_per_segment,
+                'record_size': self.dtype.itemsize}
+
+    def segment_path(self, n):
+        return os.path.join(self.path, 'records_{}.seg'.format(n))
+
+    def blob_path(self, n):
+        return os.path.join(self.path, 'images_{}.blob'.format(n))
+
+    def segment_count(self):
+        n = 0
+        while os.path.exists(self.segment_path(n)):
+            n += 1
+        return n
+
+    def segment_rows(self, n):
+        """
+        All rows of segment n as a read only memory mapped array.
+        """
+        path = self.segment_path(n)
+        rows = os.path.getsize(path) // self.dtype.itemsize
+        if rows == 0:
+            return np.zeros(0, dtype=self.dtype)
+        return np.memmap(path, dtype=self.dtype, mode='r', shape=(rows,))
+
+    def count_rows(self):
+        self.segments = self.segment_count()
+        self.rows_in_last = 0
+        if self.segments:
+            size = os.path.getsize(self.segment_path(self.segments - 1))
+            self.rows_in_last = size // self.dtype.itemsize
+
+    def scan(self):
+        """
+        Read the header columns of every segment and return a
+        (ix, time, segment, offset, flags) tuple per row, to rebuild the
+        record index from.
+        """
+        size = self.dtype.itemsize
+        for n in range(self.segment_count()):
+            rows = self.segment_rows(n)
+            columns = [rows[k].tolist() for k in ('ix', 'time', 'flags')]
+            for row, (ix, t, flags) in enumerate(zip(*columns)):
+                yield ix, t, n, row * size, flags
+            del rows
+
+    def last_segment(self):
+        if not self.segments:
+            return None
+        return self.segment_path(self.segments - 1)
+
+    def open_for_append(self):
+        if self._record_file is not None and self.rows_in_last < self.records_per_segment:
+            return
+        self.close_writers()
+        if self.segments == 0 or self.rows_in_last >= self.records_per_segment:
+            self.segments += 1
+            self.rows_in_last = 0
+        n = self.segments - 1
+        self._record_file = open(self.segment_path(n), 'ab')
+        self._blob_file = open(self.blob_path(n), 'ab')
+
+    def close_writers(self):
+        for f in (self._record_file, self._blob_file):
+            if f is not None:
+                f.close()
+        self._record_file = None
+        self._blob_file = None
+
+    def close(self):
+        with self.lock:
+            self.close_writers()
+            for f in self._readers.values():
+                f.close()
+            self._readers = {}
+
+    def append(self, ix, data, timestamp=None, encoded=False):
+        """
+        Append a record and return the segment and byte offset of its row.
+        Images are JPEG encoded unless encoded is True, in which case they
+        are already JPEG bytes.
+        """
+        images = {}
+        for key, typ in zip(self.inputs, self.types):
+            if typ in IMAGE_TYPES and data.get(key) is not None:
+                val = data[key]
+                images[key] = val if encoded else encode_image(val, typ)
+
+        row = np.zeros(1, dtype=self.dtype)
+        row['ix'] = ix
+        row['time'] = time.time() if timestamp is None else timestamp
+        mask = 0
+        for i, (key, typ) in enumerate(zip(self.inputs, self.types)):
+            val = data.get(key)
+            if val is None or typ in IMAGE_TYPES:
+                continue
+            mask |= 1 << i
+            if typ == 'str':
+                val = str(val).encode('utf-8')[:self.str_width]
+            row[key] = val
+
+        with self.lock:
+            self.open_for_append()
+            offset = self._blob_file.tell()
+            for i, (key, typ) in enumerate(zip(self.inputs, self.types)):
+                if key in images:
+                    blob = images[key]
+                    self._blob_file.write(blob)
+                    row[key + '#offset'] = offset
+                    row[key + '#length'] = len(blob)
+                    offset += len(blob)
+                    mask |= 1 << i
+            row['mask'] = mask
+            #the images have to be on disk before the row that points to them
+            self._blob_file.flush()
+            self._record_file.write(row.tobytes())
+            self._record_file.flush()
+
+            position = (self.segments - 1, self.rows_in_last * self.dtype.itemsize)
+            self.rows_in_last += 1
+        return position
+
+    def read_row(self, n, offset):
+        size = self.dtype.itemsize
+        with self.lock:
+            if self._record_file is not None:
+                self._record_file.flush()
+            f = self.reader(self.segment_path(n))
+            f.seek(offset)
+            buf = f.read(size)
+        return np.frombuffer(buf, dtype=self.dtype)[0]
+
+    def reader(self, path):
+        f = self._readers.get(path)
+        if f is None:
+            f = open(path, 'rb')
+            self._readers[path] = f
+        return f
+
+    def read_blob(self, n, offset, length):
+        with self.lock:
+            if self._blob_file is not None:
+                self._blob_file.flush()
+            f = self.reader(self.blob_path(n))
+            f.seek(offset)
+            return f.read(length)
+
+    def read(self, n, offset):
+        """
+        Return the record at a byte offset of segment n as a dict, with
+        images as JPEG bytes.
+        """
+        row = self.read_row(n, offset)
+        mask = int(row['mask'])
+        data = {}
+        for i, (key, typ) in enumerate(zip(self.inputs, self.types)):
+            if not mask & (1 << i):
+                data[key] = None
+            elif typ in IMAGE_TYPES:
+                data[key] = self.read_blob(n, int(row[key + '#offset']),
+                                           int(row[key + '#length']))
+            elif typ == 'str':
+                data[key] = row[key].decode('utf-8')
+            else:
+                data[key] = row[key].item()
+        return data
+
+    def delete(self, n, offset):
+        """
+        Flag the record at a byte offset of segment n as deleted. The row
+        stays in its segment.
+        """
+        flags_offset = offset + self.dtype.fields['flags'][1]
+        with self.lock:
+            if self._record_file is not None:
+                self._record_file.flush()
+            with open(self.segment_path(n), 'r+b') as f:
+                f.seek(flags_offset)
+                flags = f.read(1)[0]
+                f.seek(flags_offset)
+                f.write(bytes([flags | DELETED]))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+
+from .. import augmentation as aug
+
+
+class TestBatchAugmentation(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.images = rng.randint(0, 256, size=(8, 70, 160, 3)).astype(np.uint8)
+        self.angles = np.linspace(-1, 1, 8)
+
+    def test_reflection_matches_record_augmentation(self):
+        images, angles = aug.reflection_batch(self.images, self.angles, np.random)
+        for i in range(8):
+            data = aug.reflection({'cam/image_array': self.images[i],
+                                   'user/angle': self.angles[i]})
+            assert np.array_equal(images[i], data['cam/image_array'])
+            assert np.isclose(angles[i], data['user/angle'])
+
+    def test_brightness_keeps_hue(self):
+        images, _ = aug.brightness_batch(self.images, self.angles, np.random.RandomState(1))
+        assert images.dtype == np.uint8
+        assert images.shape == self.images.shape
+        #the brightest channel of a pixel stays the brightest
+        before = self.images.astype(int)
+        after = images.astype(int)
+        brightest = before.argmax(axis=3)[..., None]
+        assert (np.take_along_axis(after, brightest, 3) >= after - 1).all()
+
+    def test_white_unbalance(self):
+        images, _ = aug.white_unbalance_batch(self.images, self.angles, np.random.RandomState(1))
+        assert images.dtype == np.uint8
+        assert images.shape == self.images.shape
+        assert not np.array_equal(images, self.images)
+
+    def test_random_rects(self):
+        black = np.zeros((4, 70, 160, 3), dtype=np.uint8)
+        images, _ = aug.random_rects_batch(black, self.angles[:4], np.random.RandomState(2))
+        assert images.any()
+        assert not black.any()
+
+    def test_augmenter(self):
+        images, angles = aug.BatchAugmenter(seed=4)(self.images, self.angles)
+        again, _ = aug.BatchAugmenter(seed=4)(self.images, self.angles)
+        assert np.array_equal(images, again)
+        assert images.shape == self.images.shape
+
+    def test_weights(self):
+        augmenter = aug.BatchAugmenter([(aug.identical_batch, 1), (aug.reflection_batch, 0)])
+        images, angles = augmenter(self.images, self.angles)
+        assert np.array_equal(images, self.images)
+        assert np.array_equal(angles, self.angles)
+
+    def test_augment_records(self):
+        augmenter = aug.BatchAugmenter([(aug.reflection_batch, 1)])
+        records = [{'cam/image_array': img, 'user/angle': angle, 'n': i}
+                   for i, (img, angle) in enumerate(zip(self.images, self.angles))]
+        augmenter.augment_records(records)
+        images, angles = aug.reflection_batch(self.images, self.angles, None)
+        for i, r in enumerate(records):
+            assert np.array_equal(r['cam/image_array'], images[i])
+            assert np.isclose(r['user/angle'], angles[i])
+            assert r['n'] == i
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..tub import Tub, TubWriter, TubChain
+from ..image_cache import ImageCache
+
+
+class TestImageCache(unittest.TestCase):
+    def setUp(self):
+        self.tempfolder = tempfile.TemporaryDirectory()
+        self.tub_path = os.path.join(self.tempfolder.name, 'tub')
+        self.cache_path = os.path.join(self.tempfolder.name, 'cache')
+        tub = TubWriter(self.tub_path, inputs=['cam/image_array', 'user/angle'],
+                        types=['image_array', 'float'])
+        for i in range(4):
+            frame = np.full((120, 160, 3), i * 40, dtype=np.uint8)
+            tub.run(frame, i * 0.25)
+        tub.shutdown()
+
+    def tearDown(self):
+        self.tempfolder.cleanup()
+
+    def test_build(self):
+        cache = ImageCache.build(self.cache_path, [self.tub_path])
+        assert len(cache) == 4
+        tub = Tub(self.tub_path)
+        img = cache.get(self.tub_path, 2)
+        assert img.shape == (70, 160, 3)
+        assert np.array_equal(img, tub.get_record(2)['cam/image_array'])
+        assert cache.get(self.tub_path, 10) is None
+
+    def test_tub_chain(self):
+        chain = TubChain([self.tub_path], ['cam/image_array'], ['user/angle'],
+                         batch_size=2, train_split=0.5, image_cache=self.cache_path)
+        assert ImageCache.exists(self.cache_path)
+        tub = chain.tub_dataset_splits[0][0]
+        assert tub.image_cache is chain.image_cache
+        X, Y = next(chain.train_gen())
+        assert X[0].shape == (2, 70, 160, 3)
+
+    def test_reused(self):
+        ImageCache.build(self.cache_path, [self.tub_path])
+        built = os.path.getmtime(os.path.join(self.cache_path, 'images.npy'))
+        cache = ImageCache.open(self.cache_path, [Tub(self.tub_path)])
+        assert len(cache) == 4
+        assert os.path.getmtime(os.path.join(self.cache_path, 'images.npy')) == built
+
+    def test_rebuilt_after_new_records(self):
+        ImageCache.build(self.cache_path, [self.tub_path])
+        tub = Tub(self.tub_path)
+        tub.put_record({'cam/image_array': np.zeros((120, 160, 3), dtype=np.uint8),
+                        'user/angle': 1.0})
+        tub.shutdown()
+        tub = Tub(self.tub_path)
+        assert not ImageCache(self.cache_path).matches([tub])
+        assert len(ImageCache.open(self.cache_path, [tub])) == 5
+
+    def test_rebuilt_after_deleted_records(self):
+        ImageCache.build(self.cache_path, [self.tub_path])
+        tub = Tub(self.tub_path)
+        tub.remove_record(1)
+        assert len(ImageCache.open(self.cache_path, [tub])) == 3
+
+    def test_rebuilt_for_other_preprocessing(self):
+        from ...cv.cv import Undistort
+        ImageCache.build(self.cache_path, [self.tub_path])
+        tub = Tub(self.tub_path)
+        tub.undistort = Undistort(balance=0.55, crop=(10, 80))
+        assert not ImageCache(self.cache_path).matches([tub])
+        tub.undistort = Undistort(balance=0.55, crop=(9, 79), k=np.eye(3))
+        assert not ImageCache(self.cache_path).matches([tub])
+
+    def test_rebuilt_for_other_tubs(self):
+        ImageCache.build(self.cache_path, [self.tub_path])
+        other = os.path.join(self.tempfolder.name, 'other')
+        writer = TubWriter(other, inputs=['cam/image_array'], types=['image_array'])
+        writer.run(np.zeros((120, 160, 3), dtype=np.uint8))
+        writer.shutdown()
+        tubs = [Tub(self.tub_path), Tub(other)]
+        assert not ImageCache(self.cache_path).matches(tubs)
+        assert len(ImageCache.open(self.cache_path, tubs)) == 5
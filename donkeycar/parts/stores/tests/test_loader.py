@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..tub import Tub, TubWriter, TubChain
+from ..loader import BatchLoader
+
+
+class NoisyAngles:
+    '''
+    Stands in for a BatchAugmenter on records without images.
+    '''
+    def __init__(self):
+        self.rng = np.random.RandomState()
+
+    def augment_records(self, records):
+        for r in records:
+            r['user/angle'] += 10 + self.rng.rand()
+
+
+class TestBatchLoader(unittest.TestCase):
+    def setUp(self):
+        self.tempfolder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempfolder.name, 'tub')
+        tub = TubWriter(self.path, inputs=['n', 'user/angle'], types=['int', 'float'])
+        for i in range(20):
+            tub.run(i, i * 0.1)
+        tub.shutdown()
+        self.tub = Tub(self.path)
+        self.records = [(0, ix) for ix in range(20)]
+
+    def tearDown(self):
+        self.tempfolder.cleanup()
+
+    def make(self, **kwargs):
+        return BatchLoader([self.tub], self.records, ['n'], ['user/angle'],
+                           batch_size=4, workers=2, prefetch=3, **kwargs)
+
+    def epoch(self, loader):
+        return [n for _ in range(5) for n in next(loader)[0][0].tolist()]
+
+    def test_each_epoch_covers_all_records(self):
+        loader = self.make()
+        first, second = self.epoch(loader), self.epoch(loader)
+        loader.close()
+        assert sorted(first) == list(range(20))
+        assert sorted(second) == list(range(20))
+        assert first != second
+
+    def test_deterministic(self):
+        a, b = self.make(seed=3), self.make(seed=3)
+        assert self.epoch(a) == self.epoch(b)
+        a.close()
+        b.close()
+
+    def test_batch_values(self):
+        loader = self.make(shuffle=False)
+        X, Y = next(loader)
+        loader.close()
+        assert X[0].tolist() == [0, 1, 2, 3]
+        assert np.allclose(Y[0], [0.0, 0.1, 0.2, 0.3])
+
+    def test_short_last_batch(self):
+        loader = BatchLoader([self.tub], self.records, ['n'], ['user/angle'],
+                             batch_size=6, workers=2, prefetch=3, shuffle=False)
+        batches = [next(loader) for _ in range(6)]
+        loader.close()
+        assert [len(X[0]) for X, Y in batches] == [6, 6, 6, 2, 6, 6]
+        assert batches[3][0][0].tolist() == [18, 19]
+        assert len(batches[3][1][0]) == 2
+        assert batches[4][0][0].tolist() == [0, 1, 2, 3, 4, 5]
+
+    def test_split_smaller_than_batch(self):
+        loader = BatchLoader([self.tub], self.records[:3], ['n'], ['user/angle'],
+                             batch_size=128, workers=1, prefetch=2, shuffle=False)
+        sizes = [len(next(loader)[0][0]) for _ in range(3)]
+        loader.close()
+        assert sizes == [3, 3, 3]
+        with self.assertRaises(ValueError):
+            BatchLoader([self.tub], [], ['n'], ['user/angle'])
+
+    def test_augmenter(self):
+        double = lambda r: dict(r, **{'user/angle': r['user/angle'] * 2})
+        a = self.make(seed=3, augmenter=NoisyAngles(), record_transform=double)
+        b = self.make(seed=3, augmenter=NoisyAngles(), record_transform=double)
+        first = next(a)[1][0]
+        a.close()
+        same = next(b)[1][0]
+        b.close()
+        #augmented before the transform, the same way for the same seed
+        assert (first >= 20).all()
+        assert np.allclose(first, same)
+
+    def test_worker_error(self):
+        def bad(record):
+            if record['n'] == 5:
+                raise ValueError('bad record')
+            return record
+        loader = self.make(shuffle=False, record_transform=bad)
+        next(loader)
+        with self.assertRaises(RuntimeError):
+            next(loader)
+        loader.close()
+
+    def test_tub_chain(self):
+        chain = TubChain([self.path], ['n'], ['user/angle'], batch_size=4,
+                         train_split=0.8, workers=1)
+        train, val = chain.train_val_gen()
+        X, Y = next(train)
+        assert X[0].shape == (4,)
+        assert isinstance(val, BatchLoader)
+        train.close()
+        val.close()
+
+    def test_tub_chain_augment(self):
+        chain = TubChain([self.path], ['n'], ['user/angle'], batch_size=4,
+                         train_split=0.8, workers=1, augment=True)
+        train, val = chain.train_val_gen()
+        assert train.augmenter is chain.augmenter
+        assert val.augmenter is None
+        train.close()
+        val.close()
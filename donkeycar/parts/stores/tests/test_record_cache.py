@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..tub import TubWriter, TubChain
+from ..record_cache import RecordCache, record_size
+
+
+class TestRecordCache(unittest.TestCase):
+    def record(self, i):
+        return {'img': np.full((10, 10), i, dtype=np.uint8), 'n': i}
+
+    def test_evicts_least_recently_used(self):
+        size = record_size(self.record(0))
+        cache = RecordCache(size * 3)
+        for i in range(3):
+            cache.put(i, self.record(i))
+        cache.get(0)
+        cache.put(3, self.record(3))
+        assert cache.get(1) is None
+        assert cache.get(0)['n'] == 0
+        assert len(cache) == 3
+        assert cache.bytes <= cache.max_bytes
+
+    def test_records_are_copies(self):
+        cache = RecordCache(10 ** 6)
+        record = cache.put('a', self.record(1))
+        record['n'] = 5
+        assert cache.get('a')['n'] == 1
+        with self.assertRaises(ValueError):
+            cache.get('a')['img'][0, 0] = 3
+
+    def test_too_large(self):
+        cache = RecordCache(10)
+        assert cache.put('a', self.record(1))['n'] == 1
+        assert len(cache) == 0
+
+
+class TestCachedTubChain(unittest.TestCase):
+    def setUp(self):
+        self.tempfolder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempfolder.name, 'tub')
+        tub = TubWriter(self.path, inputs=['n', 'user/angle'], types=['int', 'float'])
+        for i in range(20):
+            tub.run(i, i * 0.1)
+        tub.shutdown()
+
+    def tearDown(self):
+        self.tempfolder.cleanup()
+
+    def test_shared_cache_and_reshuffle(self):
+        chain = TubChain([self.path], ['n'], ['user/angle'], batch_size=4,
+                         train_split=0.8, cache=True)
+        train, val = chain.train_val_gen()
+        first = [n for _ in range(4) for n in next(train)[0][0].tolist()]
+        second = [n for _ in range(4) for n in next(train)[0][0].tolist()]
+        assert sorted(first) == sorted(second)
+        assert len(set(first)) == 16
+        next(val)
+        assert len(chain.record_cache) == 20
+        assert chain.record_cache.hits >= 16
+
+    def test_split_smaller_than_batch(self):
+        chain = TubChain([self.path], ['n'], ['user/angle'], batch_size=6,
+                         train_split=0.8, cache=True)
+        train, val = chain.train_val_gen()
+        #16 training records, the last batch of an epoch has the 4 left
+        assert [len(next(train)[0][0]) for _ in range(4)] == [6, 6, 4, 6]
+        #4 validation records, fewer than a batch
+        assert len(next(val)[0][0]) == 4
+        assert len(next(val)[0][0]) == 4
+
+    def test_empty_split(self):
+        chain = TubChain([self.path], ['n'], ['user/angle'], batch_size=8,
+                         train_split=1.0, cache=True)
+        with self.assertRaises(ValueError):
+            chain.train_val_gen()
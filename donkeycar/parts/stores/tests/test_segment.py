@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from ..tub import Tub, TubWriter, convert_tub
+
+
+class TestSegmentTub(unittest.TestCase):
+    def setUp(self):
+        self.tempfolder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempfolder.name, 'tub')
+        self.inputs = ['cam/image_array', 'user/angle', 'user/mode', 'n']
+        self.types = ['image_array', 'float', 'str', 'int']
+        self.frame = np.zeros((120, 160, 3), dtype=np.uint8)
+
+    def tearDown(self):
+        self.tempfolder.cleanup()
+
+    def write(self, count, **kwargs):
+        tub = TubWriter(self.path, inputs=self.inputs, types=self.types,
+                        format='segment', **kwargs)
+        for i in range(count):
+            tub.run(self.frame, i * 0.1, 'user', i)
+        tub.shutdown()
+        return tub
+
+    def test_round_trip(self):
+        self.write(5)
+        tub = Tub(self.path)
+        assert tub.format == 'segment'
+        assert tub.get_num_records() == 5
+        assert tub.get_index(shuffled=False) == [0, 1, 2, 3, 4]
+        assert tub.current_ix == 5
+        record = tub.get_json_record(3)
+        assert record['user/angle'] == 3 * 0.1
+        assert record['user/mode'] == 'user'
+        assert record['n'] == 3
+        img = np.array(Image.open(BytesIO(record['cam/image_array'])))
+        assert img.shape == (120, 160, 3)
+        assert not any(f.endswith('.json') and f != 'meta.json'
+                       for f in os.listdir(self.path))
+
+    def test_none_values(self):
+        tub = TubWriter(self.path, inputs=self.inputs, types=self.types,
+                        format='segment')
+        tub.run(None, None, 'user', 1)
+        assert tub.get_json_record(0) == {'cam/image_array': None,
+                                          'user/angle': None,
+                                          'user/mode': 'user', 'n': 1}
+
+    def test_segments_roll_over(self):
+        self.write(7, records_per_segment=3)
+        assert os.path.exists(os.path.join(self.path, 'records_2.seg'))
+        tub = Tub(self.path)
+        assert tub.get_num_records() == 7
+        assert tub.get_json_record(6)['n'] == 6
+
+    def test_remove_record(self):
+        self.write(4)
+        Tub(self.path).remove_record(1)
+        tub = Tub(self.path)
+        assert tub.get_index(shuffled=False) == [0, 2, 3]
+        assert tub.get_num_records() == 3
+
+    def test_async_writer(self):
+        tub = self.write(20, asynchronous=True)
+        assert tub.written == 20
+        assert sorted(Tub(self.path).get_index()) == list(range(20))
+
+    def test_convert(self):
+        src = TubWriter(os.path.join(self.tempfolder.name, 'json'),
+                        inputs=self.inputs, types=self.types)
+        for i in range(3):
+            src.run(self.frame, i * 0.1, 'user', i)
+        jpg = os.path.join(src.path, src.get_json_record(2)['cam/image_array'])
+        with open(jpg, 'rb') as f:
+            jpg_bytes = f.read()
+
+        convert_tub(src.path, self.path)
+        tub = Tub(self.path)
+        assert tub.get_num_records() == 3
+        record = tub.get_json_record(2)
+        assert record['cam/image_array'] == jpg_bytes
+        assert record['user/angle'] == 0.2
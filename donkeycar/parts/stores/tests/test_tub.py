@@ -2,7 +2,8 @@
 import tempfile
 import unittest
 from ..tub import TubWriter
-import os 
+import os
+import time
 
 
 class TestMovingSquareTelemetry(unittest.TestCase):
@@ -17,4 +18,113 @@ class TestMovingSquareTelemetry(unittest.TestCase):
         
     def test_tub_path(self):
         tub = TubWriter(self.path, inputs=self.inputs, types=self.types)
-        tub.run('will', 323, 'asdfasdf')
\ No newline at end of file
+        tub.run('will', 323, 'asdfasdf')
+
+class TestAsyncTubWriter(unittest.TestCase):
+    def setUp(self):
+        self.tempfolder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempfolder.name, 'new')
+
+    def tearDown(self):
+        self.tempfolder.cleanup()
+
+    def test_writes_all_records(self):
+        import numpy as np
+        tub = TubWriter(self.path, inputs=['cam/image_array', 'angle'],
+                        types=['image_array', 'float'], asynchronous=True)
+        frame = np.zeros((120, 160, 3), dtype=np.uint8)
+        for i in range(10):
+            tub.run(frame, i * 0.1)
+        tub.shutdown()
+        assert tub.written + tub.dropped == 10
+        assert tub.get_num_records() == tub.written
+        assert tub.dropped == 0
+        assert tub.get_json_record(9)['angle'] == 0.9
+
+    def test_drops_when_full(self):
+        tub = TubWriter(self.path, inputs=['angle'], types=['float'],
+                        asynchronous=True, queue_size=1, workers=0)
+        tub.run(0.1)
+        tub.run(0.2)
+        assert tub.dropped == 1
+        assert tub.current_ix == 1
+
+class TestRecordIndex(unittest.TestCase):
+    def setUp(self):
+        self.tempfolder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempfolder.name, 'new')
+        tub = TubWriter(self.path, inputs=['angle'], types=['float'])
+        for i in range(5):
+            tub.run(i * 0.1)
+        tub.shutdown()
+
+    def tearDown(self):
+        self.tempfolder.cleanup()
+
+    def test_loads_index(self):
+        from ..tub import Tub
+        assert os.path.exists(os.path.join(self.path, 'index.bin'))
+        tub = Tub(self.path)
+        assert tub.get_index(shuffled=False) == [0, 1, 2, 3, 4]
+        assert tub.get_num_records() == 5
+        assert tub.current_ix == 5
+
+    def test_remove_record(self):
+        from ..tub import Tub
+        Tub(self.path).remove_record(2)
+        tub = Tub(self.path)
+        assert tub.get_index(shuffled=False) == [0, 1, 3, 4]
+        assert tub.get_last_ix() == 4
+
+    def test_rebuilds_stale_index(self):
+        from ..tub import Tub
+        tub = Tub(self.path)
+        #records deleted without the tub, like the tub web page does
+        os.unlink(tub.get_json_record_path(4))
+        os.utime(self.path, (time.time() + 1, time.time() + 1))
+        tub = Tub(self.path)
+        assert tub.get_index(shuffled=False) == [0, 1, 2, 3]
+        assert Tub(self.path).get_num_records() == 4
+
+    def test_rebuilds_missing_index(self):
+        from ..tub import Tub
+        os.unlink(os.path.join(self.path, 'index.bin'))
+        assert Tub(self.path).get_num_records() == 5
+
+class TestColumns(unittest.TestCase):
+    def setUp(self):
+        self.tempfolder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempfolder.name, 'new')
+        tub = TubWriter(self.path, inputs=['user/angle', 'user/mode'],
+                        types=['float', 'str'])
+        for i in range(5):
+            tub.run(i * 0.5, 'user' if i % 2 else 'local')
+        tub.run(None, 'user')
+        tub.shutdown()
+
+    def tearDown(self):
+        self.tempfolder.cleanup()
+
+    def test_column(self):
+        import numpy as np
+        from ..tub import Tub
+        tub = Tub(self.path)
+        angles = tub.column('user/angle')
+        assert angles[:5].tolist() == [0.0, 0.5, 1.0, 1.5, 2.0]
+        assert np.isnan(angles[5])
+        modes = tub.column('user/mode')
+        assert (modes == 'user').sum() == 3
+        assert tub.column('user/angle', index=[3, 1]).tolist() == [1.5, 0.5]
+
+    def test_rebuilds_columns(self):
+        import shutil
+        from ..tub import Tub
+        shutil.rmtree(os.path.join(self.path, 'columns'))
+        Tub(self.path).remove_record(0)
+        assert Tub(self.path).column('user/angle')[:2].tolist() == [0.5, 1.0]
+
+    def test_rewritten_record(self):
+        from ..tub import Tub
+        tub = Tub(self.path)
+        tub.write_record(2, {'user/angle': -1.0, 'user/mode': 'user'})
+        assert tub.column('user/angle', index=[2]).tolist() == [-1.0]
@@ -11,14 +11,23 @@ import time
 import json
 import datetime
 import random
-from donkeycar.tools.fisheye_undistort import undistort
+import queue
+import threading
+from donkeycar.parts.ml.pilot import preprocessor
 import itertools
+from io import BytesIO
 
 from PIL import Image
 
 import numpy as np
 from ... import utils
-from .augmentation import augment
+from .augmentation import augment, BatchAugmenter
+from .segment import SegmentStore, SEGMENT_FORMAT
+from .index import RecordIndex, INDEX_FILE
+from .columns import ColumnStore
+from .image_cache import ImageCache
+from .loader import BatchLoader
+from .record_cache import RecordCache
 
 
 class Tub(object):
@@ -35,9 +44,16 @@ class Tub(object):
     >>> types = ['float', 'image']
     >>> t=Tub(path=path, inputs=inputs, types=types)
 
+    New tubs store each record as a json file and each image as a file of
+    its own. With format='segment' records are appended to a few large
+    segment files instead, see segment.py. Existing tubs are read in the
+    format saved in their meta.json.
+
+    Either way the tub keeps an index of its records in index.bin, which is
+    rebuilt from the records when it is missing or out of date.
     """
 
-    def __init__(self, path, inputs=None, types=None):
+    def __init__(self, path, inputs=None, types=None, format='json', **segment_kwargs):
 
         self.path = os.path.expanduser(path)
         self.meta_path = os.path.join(self.path, 'meta.json')
@@ -47,33 +63,117 @@ class Tub(object):
             self.mask = np.array(Image.open(mask_path))
 
         exists = os.path.exists(self.path)
+        self.index = RecordIndex(os.path.join(self.path, INDEX_FILE))
 
         if exists:
             #load log and meta
             print("Tub does exist")
             with open(self.meta_path, 'r') as f:
                 self.meta = json.load(f)
-            self.current_ix = self.get_last_ix() + 1
+            self.store = self.open_store()
+            self.load_index()
+            self.current_ix = self.get_last_ix() + 1 if self.index.count() else 0
 
         elif not exists and inputs:
             print('tub does NOT exist')
             #create log and save meta
             os.makedirs(self.path)
             self.meta = {'inputs': inputs, 'types': types}
+            if format == SEGMENT_FORMAT:
+                self.meta['format'] = format
+                self.meta.update(segment_kwargs)
+            self.store = self.open_store()
+            if self.store is not None:
+                self.meta.update(self.store.meta())
             with open(self.meta_path, 'w') as f:
                 json.dump(self.meta, f)
             self.current_ix = 0
         else:
             raise AttributeError('The path doesnt exist and you pass meta info.')
 
+        self.columns = ColumnStore(self.path, self.meta['inputs'], self.meta['types'],
+                                   str_width=self.meta.get('str_width', 32))
+        self.columns_checked = not exists
+        self.image_cache = None
+        self.record_cache = None
+        self.undistort = preprocessor()
         self.start_time = time.time()
 
+    def open_store(self):
+        """
+        Return the SegmentStore of a segment tub, None for a json tub.
+        """
+        if self.meta.get('format') != SEGMENT_FORMAT:
+            return None
+        kwargs = {k: self.meta[k] for k in ('str_width', 'records_per_segment')
+                  if k in self.meta}
+        return SegmentStore(self.path, self.meta['inputs'], self.meta['types'], **kwargs)
+
+    @property
+    def format(self):
+        return self.meta.get('format', 'json')
+
+    def load_index(self):
+        """
+        Load the record index, or rebuild it from the records if it is
+        missing or the records were changed after it was written.
+        """
+        if self.store is not None:
+            watched = [self.store.last_segment()]
+        else:
+            #deleting a record file changes the folder
+            watched = [self.path]
+
+        if self.index.exists() and not self.index.is_stale(watched):
+            self.index.load()
+        else:
+            print('Indexing tub', self.path)
+            self.index.rebuild(self.scan_records())
+
+    def scan_records(self):
+        """
+        Find the records saved in the tub, as index rows.
+        """
+        if self.store is not None:
+            return self.store.scan()
+
+        rows = []
+        for ix in self.scan_index():
+            path = self.get_json_record_path(ix)
+            rows.append((ix, os.path.getmtime(path), 0, 0, 0))
+        return rows
 
     def get_last_ix(self):
-        index = self.get_index()
-        return max(index)
+        return self.index.last_ix()
+
+    def column(self, key, index=None):
+        """
+        Return a numpy array with the values of a str, int, float or
+        boolean input for the records in index, or for all records in the
+        order of get_index(shuffled=False). The values come from the tub's
+        columns, see columns.py, without reading the records.
+
+        >>> angles = tub.column('user/angle')
+        >>> counts, edges = np.histogram(angles, 50)
+        """
+        if index is None:
+            index = self.get_index(shuffled=False)
+        if not self.columns_checked:
+            #tubs written before the columns existed
+            if not self.columns.exists() or not self.columns.covers(self.get_index(shuffled=False)):
+                print('Building columns of tub', self.path)
+                self.columns.rebuild((ix, self.get_json_record(ix))
+                                     for ix in self.get_index(shuffled=False))
+            self.columns_checked = True
+        return self.columns.column(key, index)
 
     def get_index(self, shuffled=True):
+        nums = self.index.ids()
+        if shuffled:
+            random.shuffle(nums)
+        return nums
+
+    def scan_index(self):
         files = next(os.walk(self.path))[2]
         record_files = [f for f in files if f[:6]=='record']
         
@@ -86,13 +186,7 @@ class Tub(object):
             return num
 
         nums = [get_file_ix(f) for f in record_files]
-        
-        if shuffled:
-            random.shuffle(nums)
-        else:
-            nums = sorted(nums)
-            
-        return nums 
+        return sorted(nums)
 
 
     @property
@@ -107,8 +201,10 @@ class Tub(object):
         input_types = dict(zip(self.inputs, self.types))
         return input_types.get(key)
 
-    def write_json_record(self, json_data):
-        path = self.get_json_record_path(self.current_ix)
+    def write_json_record(self, json_data, ix=None):
+        if ix is None:
+            ix = self.current_ix
+        path = self.get_json_record_path(ix)
         try:
             with open(path, 'w') as fp:
                 json.dump(json_data, fp)
@@ -120,14 +216,21 @@ class Tub(object):
             raise
 
     def get_num_records(self):
-        import glob
-        files = glob.glob(os.path.join(self.path, 'record_*.json'))
-        return len(files)
+        return self.index.count()
 
     def get_json_record_path(self, ix):
         return os.path.join(self.path, 'record_'+str(ix)+'.json')
 
     def get_json_record(self, ix):
+        """
+        Return the record as saved. Images are file names in a json tub
+        and JPEG bytes in a segment tub.
+        """
+        if self.store is not None:
+            if ix not in self.index:
+                raise IndexError('No record {} in tub {}'.format(ix, self.path))
+            return self.store.read(*self.index.position(ix))
+
         path = self.get_json_record_path(ix)
         try:
             with open(path, 'r') as fp:
@@ -165,8 +268,12 @@ class Tub(object):
         '''
         remove data associate with a record
         '''
-        record = self.get_json_record_path(ix)
-        os.unlink(record)
+        if self.store is not None:
+            self.store.delete(*self.index.position(ix))
+        else:
+            record = self.get_json_record_path(ix)
+            os.unlink(record)
+        self.index.delete(ix)
 
     def put_record(self, data):
         """
@@ -174,6 +281,20 @@ class Tub(object):
         return a record with references to the saved values that can
         be saved in a csv.
         """
+        self.write_record(self.current_ix, data)
+        self.current_ix += 1
+
+    def write_record(self, ix, data):
+        """
+        Save a record under the given index.
+        """
+        timestamp = time.time()
+        if self.store is not None:
+            position = self.store.append(ix, data, timestamp=timestamp)
+            self.index.append(ix, timestamp, *position)
+            self.columns.append(ix, data)
+            return
+
         json_data = {}
         
         for key, val in data.items():
@@ -182,14 +303,14 @@ class Tub(object):
             if typ in ['str', 'float', 'int', 'boolean']:
                 json_data[key] = val
 
-            elif typ is 'image':
-                path = self.make_file_path(key)
-                val.save(path)
-                json_data[key]=path
+            elif typ == 'image':
+                name = self.make_file_name(key, ix=ix)
+                val.save(os.path.join(self.path, name))
+                json_data[key]=name
 
             elif typ == 'image_array':
                 img = Image.fromarray(np.uint8(val))
-                name = self.make_file_name(key, ext='.jpg')
+                name = self.make_file_name(key, ext='.jpg', ix=ix)
                 img.save(os.path.join(self.path, name))
                 json_data[key]=name
 
@@ -197,11 +318,28 @@ class Tub(object):
                 msg = 'Tub does not know what to do with this type {}'.format(typ)
                 raise TypeError(msg)
 
-        self.write_json_record(json_data)
-        self.current_ix += 1
+        self.write_json_record(json_data, ix)
+        self.index.append(ix, timestamp)
+        self.columns.append(ix, data)
 
     def get_record(self, ix, augmented=False):
+        data = None
+        if self.record_cache is not None:
+            data = self.record_cache.get((self.path, ix))
+        if data is None:
+            data = self.read_record(ix)
+            if self.record_cache is not None:
+                data = self.record_cache.put((self.path, ix), data)
+
+        if augmented:
+            data = augment(data)
+
+        return data
 
+    def read_record(self, ix):
+        """
+        Load a record and its images from the tub.
+        """
         json_data = self.get_json_record(ix)
         data={}
         for key, val in json_data.items():
@@ -209,21 +347,34 @@ class Tub(object):
 
             #load objects that were saved as separate files
             if typ == 'image':
-                val = Image.open(os.path.join(self.path, val))
+                val = self.load_image(val)
             elif typ == 'image_array':
-                img = Image.open(os.path.join(self.path, val))
-                val = np.array(img)
-                val = undistort(val, balance=0.55)[9:79,:,:]
+                cached = None
+                if self.image_cache is not None and key == self.image_cache.key:
+                    cached = self.image_cache.get(self.path, ix)
+                if cached is not None:
+                    val = cached
+                else:
+                    img = self.load_image(val)
+                    val = np.array(img)
+                    val = self.undistort.run(val)
 
             data[key] = val
 
-        if augmented:
-            data = augment(data)
-
         return data
 
-    def make_file_name(self, key, ext='.png'):
-        name = '_'.join([str(self.current_ix), key, ext])
+    def load_image(self, val):
+        """
+        Open an image saved as a file of the tub or as JPEG bytes.
+        """
+        if isinstance(val, bytes):
+            return Image.open(BytesIO(val))
+        return Image.open(os.path.join(self.path, val))
+
+    def make_file_name(self, key, ext='.png', ix=None):
+        if ix is None:
+            ix = self.current_ix
+        name = '_'.join([str(ix), key, ext])
         name = name = name.replace('/', '-')
         return name
 
@@ -233,7 +384,10 @@ class Tub(object):
         shutil.rmtree(self.path)
 
     def shutdown(self):
-        pass
+        self.index.close()
+        self.columns.close()
+        if self.store is not None:
+            self.store.close()
 
 
     def record_gen(self, index=None, record_transform=None, augmented=False):
@@ -275,9 +429,65 @@ class Tub(object):
             yield X, Y
 
 
+def convert_tub(src_path, dst_path, **segment_kwargs):
+    """
+    Copy a json tub to a new tub in the segment format. Saved images are
+    copied as they are, without decoding and encoding them again, and each
+    record keeps the time its json file was written.
+    """
+    src = Tub(src_path)
+    dst = Tub(dst_path, inputs=src.inputs, types=src.types,
+              format=SEGMENT_FORMAT, **segment_kwargs)
+    if src.store is not None:
+        raise ValueError('{} is already a segment tub'.format(src.path))
+
+    for ix in src.get_index(shuffled=False):
+        json_data = src.get_json_record(ix)
+        data = {}
+        for key, val in json_data.items():
+            if src.get_input_type(key) in ['image', 'image_array']:
+                with open(os.path.join(src.path, val), 'rb') as f:
+                    val = f.read()
+            data[key] = val
+        timestamp = src.index.timestamp(ix)
+        position = dst.store.append(ix, data, timestamp=timestamp, encoded=True)
+        dst.index.append(ix, timestamp, *position)
+        dst.columns.append(ix, data)
+
+    dst.current_ix = dst.get_last_ix() + 1 if dst.get_num_records() else 0
+    dst.shutdown()
+    return dst
+
+
 class TubWriter(Tub):
-    def __init__(self, *args, **kwargs):
+    """
+    Part that saves its inputs as records of a tub.
+
+    By default each record is encoded and written inside the drive loop.
+    With asynchronous=True the part only copies the values into a bounded
+    queue and a pool of background threads encodes and writes them. When
+    the queue is full because the disk can't keep up, records are dropped
+    and counted in `dropped`, or the drive loop waits for room if
+    block=True.
+    """
+    def __init__(self, *args, asynchronous=False, queue_size=100, workers=2,
+                 block=False, **kwargs):
         super(TubWriter, self).__init__(*args, **kwargs)
+        self.asynchronous = asynchronous
+        self.block = block
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.queue = None
+        self.workers = []
+
+        if asynchronous:
+            self.queue = queue.Queue(maxsize=queue_size)
+            for _ in range(workers):
+                t = threading.Thread(target=self.write_loop)
+                t.daemon = True
+                t.start()
+                self.workers.append(t)
 
     def run(self, *args):
         '''
@@ -290,7 +500,50 @@ class TubWriter(Tub):
 
         self.record_time = int(time.time() - self.start_time)
         record = dict(zip(self.inputs, args))
-        self.put_record(record)
+
+        if not self.asynchronous:
+            self.put_record(record)
+            return
+
+        #the drive loop may reuse the arrays, keep a copy until written
+        for key, typ in zip(self.inputs, self.types):
+            if typ == 'image_array' and record[key] is not None:
+                record[key] = np.array(record[key])
+
+        try:
+            self.queue.put((self.current_ix, record), block=self.block)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self.current_ix += 1
+
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self.write_record(*item)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                print('TubWriter could not write record {}: {}'.format(item[0], e))
+            finally:
+                self.queue.task_done()
+
+    def shutdown(self):
+        if not self.asynchronous:
+            super(TubWriter, self).shutdown()
+            return
+        print('TubWriter flushing {} queued records.'.format(self.queue.qsize()))
+        for _ in self.workers:
+            self.queue.put(None)
+        for t in self.workers:
+            t.join()
+        self.workers = []
+        print('TubWriter wrote {} records, dropped {}, {} errors.'.format(
+            self.written, self.dropped, self.errors))
+        super(TubWriter, self).shutdown()
 
 
 class TubReader(Tub):
@@ -338,9 +591,9 @@ class TubHandler():
         tub_path = os.path.join(self.path, name)
         return tub_path
 
-    def new_tub_writer(self, inputs, types):
+    def new_tub_writer(self, inputs, types, **kwargs):
         tub_path = self.create_tub_path()
-        tw = TubWriter(path=tub_path, inputs=inputs, types=types)
+        tw = TubWriter(path=tub_path, inputs=inputs, types=types, **kwargs)
         return tw
 
 
@@ -402,30 +655,87 @@ class TubImageStacker(Tub):
 class TubChain:
     '''
     Multiple tubs chained together to generate data in one single training session
+
+    With image_cache set to a folder, images are read from an ImageCache
+    there, which is built from the tubs first if it doesn't exist yet or
+    no longer matches them. Records missing from the cache are decoded
+    from the tubs.
+
+    With cache=True the train and validation generators share a
+    RecordCache of decoded records of up to cache_bytes, see
+    record_cache.py, and the training records are shuffled every epoch.
+    The cache isn't used with workers.
+
+    With workers set, train_val_gen returns BatchLoader generators that
+    load the batches in that many processes each, see loader.py.
+
+    With augment=True the training batches are augmented a whole batch at
+    a time by a BatchAugmenter, before the record transform.
     '''
 
-    def __init__(self, tub_paths, X_keys, Y_keys, cache=True, batch_size=32, record_transform=None, train_split=.8):
+    def __init__(self, tub_paths, X_keys, Y_keys, cache=True, batch_size=32, record_transform=None, train_split=.8,
+                 image_cache=None, workers=0, prefetch=4, seed=0, cache_bytes=2 ** 30,
+                 augment=False):
         self.X_keys = X_keys
         self.Y_keys = Y_keys
         self.cache = cache
         self.batch_size = batch_size
         self.record_transform = record_transform
+        self.workers = workers
+        self.prefetch = prefetch
+        self.seed = seed
+        self.augmenter = BatchAugmenter(seed=seed) if augment else None
+
+        tubs = [Tub(p) for p in tub_paths]
+        self.image_cache = None
+        if image_cache is not None:
+            self.image_cache = ImageCache.open(image_cache, tubs)
+
+        #each worker process would fill a cache of its own
+        self.record_cache = RecordCache(cache_bytes) if cache and not workers else None
 
         self.tub_dataset_splits = []
 
-        for p in tub_paths:
-            tub = Tub(p)
+        for tub in tubs:
+            tub.image_cache = self.image_cache
+            tub.record_cache = self.record_cache
             index = tub.get_index(shuffled=True)
             train_cutoff = int(len(index)*train_split)
             train_index = index[:train_cutoff]
             val_index = index[train_cutoff:]
             self.tub_dataset_splits.append((tub, train_index, val_index))
     
+    def cached_gen(self, split, shuffle=True, augmenter=None):
+        '''
+        Batches of the records of a split, 1 for train and 2 for validation,
+        read through the record cache and reshuffled every epoch. The last
+        batch of an epoch holds the records left over, so a split smaller
+        than a batch still gives one.
+        '''
+        records = [(tub_ds[0], ix) for tub_ds in self.tub_dataset_splits
+                   for ix in tub_ds[split]]
+        if not records:
+            raise ValueError('No {} records in {}'.format(
+                'training' if split == 1 else 'validation',
+                [tub_ds[0].path for tub_ds in self.tub_dataset_splits]))
+        return self.cached_batches(records, shuffle, augmenter)
+
+    def cached_batches(self, records, shuffle, augmenter):
+        keys = self.X_keys + self.Y_keys
+        while True:
+            if shuffle:
+                random.shuffle(records)
+            for start in range(0, len(records), self.batch_size):
+                batch = [tub.get_record(ix) for tub, ix in records[start:start + self.batch_size]]
+                if augmenter is not None:
+                    augmenter.augment_records(batch)
+                if self.record_transform:
+                    batch = [self.record_transform(r) for r in batch]
+                arrays = {k: np.array([r[k] for r in batch]) for k in keys}
+                yield [arrays[k] for k in self.X_keys], [arrays[k] for k in self.Y_keys]
+
     def cached_train_gen(self):
-        gens = [tub_ds[0].train_gen(X_keys=self.X_keys, Y_keys=self.Y_keys, index=tub_ds[1],
-                batch_size=self.batch_size, record_transform=self.record_transform)
-                for tub_ds in self.tub_dataset_splits]
-        return itertools.cycle(itertools.chain(*gens))
+        return self.cached_gen(1, augmenter=self.augmenter)
 
     def train_gen(self):
         while True:
@@ -437,11 +747,7 @@ class TubChain:
                 yield batch
 
     def cached_val_gen(self):
-        gens = [tub_ds[0].train_gen(X_keys=self.X_keys, Y_keys=self.Y_keys, index=tub_ds[2],
-            batch_size=self.batch_size, record_transform=self.record_transform)
-            for tub_ds in self.tub_dataset_splits]
-
-        return itertools.cycle(itertools.chain(*gens))
+        return self.cached_gen(2, shuffle=False)
 
     def val_gen(self):
         while True:
@@ -452,7 +758,22 @@ class TubChain:
             for batch in itertools.chain(*gens):
                 yield batch
 
+    def loader_train_val_gen(self):
+        tubs = [tub_ds[0] for tub_ds in self.tub_dataset_splits]
+        train_records = [(i, ix) for i, tub_ds in enumerate(self.tub_dataset_splits)
+                         for ix in tub_ds[1]]
+        val_records = [(i, ix) for i, tub_ds in enumerate(self.tub_dataset_splits)
+                       for ix in tub_ds[2]]
+        kwargs = dict(batch_size=self.batch_size, record_transform=self.record_transform,
+                      workers=self.workers, prefetch=self.prefetch, seed=self.seed)
+        train = BatchLoader(tubs, train_records, self.X_keys, self.Y_keys,
+                            augmenter=self.augmenter, **kwargs)
+        val = BatchLoader(tubs, val_records, self.X_keys, self.Y_keys, shuffle=False, **kwargs)
+        return train, val
+
     def train_val_gen(self):
+        if self.workers:
+            return self.loader_train_val_gen()
         if self.cache:
             return self.cached_train_gen(), self.cached_val_gen()
         else:
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..cv.cv import Undistort
+from ...tools import fisheye_undistort
+
+
+class TestUndistort(unittest.TestCase):
+    def test_maps_are_cached(self):
+        img = np.zeros((120, 160, 3), dtype=np.uint8)
+        first = fisheye_undistort.undistort_maps(img, 0.55)
+        assert fisheye_undistort.undistort_maps(img, 0.55) is first
+        assert fisheye_undistort.undistort_maps(img, 0.3) is not first
+        big = np.zeros((240, 320, 3), dtype=np.uint8)
+        assert fisheye_undistort.undistort_maps(big, 0.55) is not first
+
+    def test_part(self):
+        img = np.random.randint(0, 256, (120, 160, 3)).astype(np.uint8)
+        part = Undistort(balance=0.55)
+        out = part.run(img)
+        assert out.shape == img.shape
+        assert np.array_equal(out, fisheye_undistort.undistort(img, balance=0.55))
+        assert part.run(None) is None
+
+    def test_crop_and_resize(self):
+        img = np.random.randint(0, 256, (120, 160, 3)).astype(np.uint8)
+        full = Undistort(balance=0.55).run(img)[9:79]
+        cropped = Undistort(balance=0.55, crop=(9, 79)).run(img)
+        assert cropped.shape == (70, 160, 3)
+        diff = np.abs(full.astype(int) - cropped)
+        assert (diff > 1).mean() < 0.01
+        small = Undistort(balance=0.55, crop=(9, 79), size=(80, 35)).run(img)
+        assert small.shape == (35, 80, 3)
+
+
+class TestCalibrationProfile(unittest.TestCase):
+    def setUp(self):
+        self.tempfolder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempfolder.name, 'calibration.npz')
+        self.k = fisheye_undistort.K * 1.01
+        fisheye_undistort.save_profile(self.path, (1600, 1200), self.k, fisheye_undistort.D,
+                                       [(160, 120, 0.55, (9, 79), None)])
+
+    def tearDown(self):
+        self.tempfolder.cleanup()
+
+    def test_load_profile(self):
+        dim, k, d = fisheye_undistort.load_profile(self.path, activate=False)
+        assert dim == (1600, 1200)
+        assert np.array_equal(k, self.k)
+        assert fisheye_undistort.K is not k
+
+    def test_precomputed_maps(self):
+        part = Undistort(balance=0.55, crop=(9, 79), profile=self.path)
+        img = np.zeros((120, 160, 3), dtype=np.uint8)
+        key = fisheye_undistort.maps_key(160, 120, 0.55, part.dim, part.k, part.d, (9, 79))
+        maps = fisheye_undistort._maps[key]
+        assert fisheye_undistort.undistort_maps(img, 0.55, part.dim, part.k, part.d, (9, 79)) is maps
+        assert part.run(img).shape == (70, 160, 3)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+process.py
+
+Run a part in its own process so it doesn't compete with the drive loop
+for the GIL. Arrays such as camera frames are passed through shared
+memory, everything else through a pipe.
+"""
+
+import multiprocessing as mp
+import threading
+import traceback
+
+import numpy as np
+
+
+class SharedRing:
+    """
+    A ring of fixed shape arrays in shared memory with one writer.
+
+    The writer copies each array into the next slot and then publishes its
+    sequence number. Readers get a numpy view of a slot without copying,
+    which stays valid until the writer has wrapped around the ring, so
+    `slots` should be larger than the number of arrays a reader holds on to.
+
+    Writing the same object again copies it again, as it may have been
+    updated in place, but into the same slot and under the same sequence
+    number. Readers then get the same view back, like they get the same
+    object from memory.
+    """
+    def __init__(self, shape, dtype='uint8', slots=4):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        size = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.buffer = mp.RawArray('b', size * slots)
+        self.seq = mp.RawValue('q', -1)
+        self._arrays = None
+        self._last = None
+        self._views = [None] * slots
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        state['_last'] = None
+        state['_views'] = [None] * self.slots
+        return state
+
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            arr = np.frombuffer(self.buffer, dtype=self.dtype)
+            self._arrays = arr.reshape((self.slots,) + self.shape)
+        return self._arrays
+
+    def write(self, arr):
+        """
+        Copy arr into the next slot, or into the current one when it is the
+        object written last, and return its sequence number.
+        """
+        seq = self.seq.value
+        if seq < 0 or arr is not self._last:
+            seq += 1
+        np.copyto(self.arrays[seq % self.slots], arr, casting='unsafe')
+        self.seq.value = seq
+        self._last = arr
+        return seq
+
+    def read(self, seq=None):
+        """
+        Return a view of the array written with sequence number seq, or of
+        the latest one. None until something has been written.
+
+        Reading the same sequence number again returns the same view, so
+        memory sees an unchanged frame as unchanged.
+        """
+        if seq is None:
+            seq = self.seq.value
+        if seq < 0:
+            return None
+        slot = seq % self.slots
+        cached = self._views[slot]
+        if cached is not None and cached[0] == seq:
+            return cached[1]
+        view = self.arrays[slot]
+        self._views[slot] = (seq, view)
+        return view
+
+
+class RingRef:
+    """
+    Sent through the pipe in place of an array that was written to a ring.
+    """
+    __slots__ = ('seq',)
+
+    def __init__(self, seq):
+        self.seq = seq
+
+    def __getstate__(self):
+        return self.seq
+
+    def __setstate__(self, seq):
+        self.seq = seq
+
+
+def pack(values, rings):
+    packed = []
+    for value, ring in zip(values, rings):
+        if ring is not None and value is not None:
+            value = RingRef(ring.write(value))
+        packed.append(value)
+    return packed
+
+
+def unpack(values, rings):
+    return [ring.read(v.seq) if isinstance(v, RingRef) else v
+            for v, ring in zip(values, rings)]
+
+
+def parse_shapes(channels, shapes, slots):
+    """
+    Create a ring for each channel that has a shape, None for the others.
+    A shape is either a tuple or a (tuple, dtype) pair.
+    """
+    rings = []
+    for ch in channels:
+        spec = shapes.get(ch)
+        if spec is None:
+            rings.append(None)
+        elif len(spec) == 2 and isinstance(spec[0], (tuple, list)):
+            rings.append(SharedRing(spec[0], spec[1], slots=slots))
+        else:
+            rings.append(SharedRing(spec, slots=slots))
+    return rings
+
+
+def serve(part, conn, threaded, in_rings, out_rings):
+    """
+    Main function of the child process. Answers run requests from the
+    drive loop until it receives None.
+    """
+    if threaded:
+        t = threading.Thread(target=part.update, args=())
+        t.daemon = True
+        t.start()
+
+    run = part.run_threaded if threaded else part.run
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        try:
+            outputs = run(*unpack(msg, in_rings))
+            if not out_rings:
+                outputs = None
+            elif outputs is not None:
+                if len(out_rings) == 1:
+                    outputs = pack([outputs], out_rings)[0]
+                else:
+                    outputs = pack(outputs, out_rings)
+            conn.send((True, outputs, getattr(part, 'frame_time', None)))
+        except Exception as e:
+            conn.send((False, '{}\n{}'.format(e, traceback.format_exc()), None))
+
+    try:
+        part.shutdown()
+    except Exception as e:
+        print(e)
+    conn.send((True, None, None))
+
+
+class ProcessPart:
+    """
+    Proxy that runs a part in a child process.
+
+    The drive loop calls run or run_threaded on the proxy as usual. The
+    call is forwarded to the child which calls the same method on the part
+    and sends back its outputs. Threaded parts have their update loop run
+    in a thread of the child process.
+
+    Parameters
+    ----------
+        part : object
+            The part to run in the child process.
+        inputs, outputs : list
+            Channel names, as given to Vehicle.add.
+        threaded : boolean
+            If the part has an update loop.
+        shapes : dict
+            Maps channel names to array shapes, or (shape, dtype) pairs.
+            Those channels are passed through shared memory.
+        slots : int
+            Number of arrays kept in each shared memory ring.
+    """
+    def __init__(self, part, inputs=[], outputs=[], threaded=False,
+                 shapes=None, slots=4):
+        shapes = shapes or {}
+        self.part = part
+        self.threaded = threaded
+        self.in_rings = parse_shapes(inputs, shapes, slots)
+        self.out_rings = parse_shapes(outputs, shapes, slots)
+        self.process = None
+        self.conn = None
+        self.lock = threading.Lock()
+        #cameras report when their frame was captured, pass that on
+        if hasattr(part, 'frame_time'):
+            self.frame_time = None
+
+    def start(self):
+        ctx = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() \
+            else mp.get_context()
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=serve,
+                                   args=(self.part, child_conn, self.threaded,
+                                         self.in_rings, self.out_rings))
+        self.process.daemon = True
+        self.process.start()
+        print('Started {} in process {}.'.format(
+            self.part.__class__.__name__, self.process.pid))
+
+    def call(self, *args):
+        if self.process is None:
+            self.start()
+        with self.lock:
+            self.conn.send(pack(args, self.in_rings))
+            ok, outputs, frame_time = self.conn.recv()
+        if frame_time is not None:
+            self.frame_time = frame_time
+        if not ok:
+            raise RuntimeError('{} failed in its process: {}'.format(
+                self.part.__class__.__name__, outputs))
+        if outputs is None:
+            return None
+        if len(self.out_rings) == 1:
+            return unpack([outputs], self.out_rings)[0]
+        return unpack(outputs, self.out_rings)
+
+    def run(self, *args):
+        return self.call(*args)
+
+    def run_threaded(self, *args):
+        return self.call(*args)
+
+    def shutdown(self):
+        if self.process is None:
+            return
+        with self.lock:
+            try:
+                self.conn.send(None)
+                if self.conn.poll(5):
+                    self.conn.recv()
+            except (EOFError, OSError, BrokenPipeError):
+                pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process = None
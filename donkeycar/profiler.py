@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+profiler.py
+
+Latency histograms used to profile the parts of a vehicle.
+"""
+
+import threading
+
+
+class Histogram:
+    """
+    HDR style histogram of durations.
+
+    Values are counted in log-linear buckets: every power of two range is
+    split into `2 ** precision_bits` sub buckets, so any recorded value can
+    be recovered within a relative error of 2 ** (1 - precision_bits) no
+    matter how large it is, while memory stays proportional to the number
+    of distinct buckets hit.
+
+    Parameters
+    ----------
+        unit : float
+            Resolution of the histogram in seconds, 1 microsecond by default.
+        precision_bits : int
+            Number of bits used for the sub buckets.
+    """
+    def __init__(self, unit=1e-6, precision_bits=7):
+        self.unit = unit
+        self.precision_bits = precision_bits
+        self.reset()
+
+    def reset(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        ticks = int(value / self.unit) if value > 0 else 0
+        shift = ticks.bit_length() - self.precision_bits
+        if shift > 0:
+            #the lowest value of a bucket also tells its width
+            ticks = (ticks >> shift) << shift
+        counts = self.counts
+        counts[ticks] = counts.get(ticks, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def percentile(self, pct):
+        """
+        Return the value below which `pct` percent of the samples fall.
+        """
+        if not self.count:
+            return None
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for low in sorted(self.counts):
+            seen += self.counts[low]
+            if seen >= rank:
+                shift = max(0, low.bit_length() - self.precision_bits)
+                #report the middle of the bucket
+                value = (low + ((1 << shift) - 1) / 2.0) * self.unit
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.min,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class Profiler:
+    """
+    A named collection of histograms that can be read while the drive loop
+    is recording into it.
+    """
+    def __init__(self, **histogram_kwargs):
+        self.histogram_kwargs = histogram_kwargs
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name):
+        hist = self.histograms.get(name)
+        if hist is None:
+            with self.lock:
+                hist = self.histograms.setdefault(name, Histogram(**self.histogram_kwargs))
+        return hist
+
+    def record(self, name, value):
+        self.histogram(name).add(value)
+
+    def reset(self):
+        with self.lock:
+            for hist in self.histograms.values():
+                hist.reset()
+
+    def summary(self):
+        with self.lock:
+            items = list(self.histograms.items())
+        return {name: hist.summary() for name, hist in items}
+
+    def report(self):
+        """
+        Format the summary as a table with times in milliseconds.
+        """
+        header = '{:<32} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9}'
+        row = '{:<32} {:>8d} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}'
+        lines = [header.format('name', 'count', 'mean ms', 'p50 ms',
+                               'p95 ms', 'p99 ms', 'max ms')]
+        for name, s in sorted(self.summary().items()):
+            if not s['count']:
+                continue
+            lines.append(row.format(name[:32], s['count'],
+                                    *[s[k] * 1000 for k in
+                                      ('mean', 'p50', 'p95', 'p99', 'max')]))
+        return '\n'.join(lines)
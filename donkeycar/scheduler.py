@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+scheduler.py
+
+Fixed-rate tick scheduling for the vehicle drive loop.
+"""
+
+import math
+import time
+
+
+class JitterStats:
+    """
+    Running statistics of how late each tick started relative to its
+    deadline and of the measured loop period.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter_max = 0.0
+        self._jitter_mean = 0.0
+        self._jitter_m2 = 0.0
+        self.period_min = None
+        self.period_max = None
+        self._period_sum = 0.0
+        self._last_start = None
+
+    def add(self, start, jitter):
+        self.ticks += 1
+
+        #Welford's running mean and variance
+        delta = jitter - self._jitter_mean
+        self._jitter_mean += delta / self.ticks
+        self._jitter_m2 += delta * (jitter - self._jitter_mean)
+        self.jitter_max = max(self.jitter_max, jitter)
+
+        if self._last_start is not None:
+            period = start - self._last_start
+            self._period_sum += period
+            if self.period_min is None or period < self.period_min:
+                self.period_min = period
+            if self.period_max is None or period > self.period_max:
+                self.period_max = period
+        self._last_start = start
+
+    @property
+    def jitter_mean(self):
+        return self._jitter_mean
+
+    @property
+    def jitter_std(self):
+        if self.ticks < 2:
+            return 0.0
+        return math.sqrt(self._jitter_m2 / (self.ticks - 1))
+
+    @property
+    def period_mean(self):
+        if self.ticks < 2:
+            return None
+        return self._period_sum / (self.ticks - 1)
+
+    def summary(self):
+        period = self.period_mean
+        return {
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'jitter_mean': self.jitter_mean,
+            'jitter_std': self.jitter_std,
+            'jitter_max': self.jitter_max,
+            'period_mean': period,
+            'period_min': self.period_min,
+            'period_max': self.period_max,
+            'rate_hz': 1.0 / period if period else None,
+        }
+
+
+class LoopScheduler:
+    """
+    Paces a loop at a fixed period using deadlines on the monotonic clock.
+
+    Tick k is due at start + k * period. When a tick overruns its slot the
+    scheduler applies one of two policies:
+
+    skip
+        Drop the missed deadlines and start the next tick immediately,
+        re-anchoring the schedule on the current time.
+    catch_up
+        Keep the original schedule and run the late ticks back to back
+        until the loop is on time again. If more than `max_backlog` ticks
+        are owed the backlog is dropped as with `skip`.
+
+    Parameters
+    ----------
+        rate_hz : float
+            Target number of ticks per second.
+        overrun : str
+            Policy to apply when a tick overruns, 'skip' or 'catch_up'.
+        max_backlog : int
+            Maximum number of late ticks the catch_up policy will replay.
+    """
+    SKIP = 'skip'
+    CATCH_UP = 'catch_up'
+
+    def __init__(self, rate_hz, overrun=SKIP, max_backlog=5, clock=time.monotonic,
+                 sleep=time.sleep):
+        if rate_hz <= 0:
+            raise ValueError('rate_hz must be positive, got {}'.format(rate_hz))
+        if overrun not in (self.SKIP, self.CATCH_UP):
+            raise ValueError('Unknown overrun policy {}'.format(overrun))
+
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self.overrun = overrun
+        self.max_backlog = max_backlog
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = JitterStats()
+        self.deadline = None
+
+    def divisor(self, rate_hz):
+        """
+        Number of ticks between runs of a task that should run at rate_hz,
+        1 when it should run every tick.
+        """
+        if rate_hz is None or rate_hz >= self.rate_hz:
+            return 1
+        if rate_hz <= 0:
+            raise ValueError('rate_hz must be positive, got {}'.format(rate_hz))
+        return max(1, int(round(self.rate_hz / rate_hz)))
+
+    def start(self):
+        """
+        Anchor the schedule on the current time. The first tick is due now.
+        """
+        self.stats.reset()
+        self.deadline = self.clock()
+        self.tick_start = self.deadline
+        self.stats.add(self.deadline, 0.0)
+        return self.deadline
+
+    def wait(self):
+        """
+        Block until the next tick is due and return the time it started.
+        """
+        if self.deadline is None:
+            return self.start()
+
+        self.deadline += self.period
+        now = self.clock()
+
+        if now < self.deadline:
+            self.sleep(self.deadline - now)
+            now = self.clock()
+            jitter = now - self.deadline
+        else:
+            #the previous tick ran past this deadline
+            jitter = now - self.deadline
+            self.stats.overruns += 1
+            late = int(jitter // self.period)
+            if late and (self.overrun == self.SKIP or late > self.max_backlog):
+                self.stats.skipped += late
+                self.deadline = now
+
+        self.tick_start = now
+        self.stats.add(now, jitter)
+        return now
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+stages.py
+
+Split the parts of a vehicle into stages of parts that don't depend on
+each other so each stage can be run concurrently.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+def entry_channels(entry):
+    """
+    Return the sets of channels a part entry reads and writes.
+    """
+    reads = set(entry['inputs'])
+    if entry.get('run_condition'):
+        reads.add(entry['run_condition'])
+    if entry.get('on_change') and entry['on_change'] is not True:
+        reads.update(entry['on_change'])
+    writes = set(entry['outputs'])
+    if entry.get('timestamp'):
+        writes.add(entry['timestamp'])
+    return reads, writes
+
+
+def build_stages(entries):
+    """
+    Group part entries into a list of stages.
+
+    A part depends on every part added before it that writes a channel it
+    reads, reads a channel it writes or writes the same channel. Each part
+    is placed in the stage after the last part it depends on, so running
+    the stages in order and the parts of a stage in any order gives the
+    same memory as running the parts one after another in the order they
+    were added.
+    """
+    channels = [entry_channels(e) for e in entries]
+    levels = []
+    stages = []
+
+    for j, entry in enumerate(entries):
+        reads, writes = channels[j]
+        level = 0
+        for i in range(j):
+            r, w = channels[i]
+            if reads & w or writes & r or writes & w:
+                level = max(level, levels[i] + 1)
+        levels.append(level)
+
+        if level == len(stages):
+            stages.append([])
+        stages[level].append(entry)
+
+    return stages
+
+
+class StageExecutor:
+    """
+    Runs the entries of each stage on a pool of worker threads and waits
+    for all of them to finish before starting the next stage.
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def run(self, stages, fn):
+        for stage in stages:
+            if len(stage) == 1:
+                fn(stage[0])
+                continue
+
+            #run the first entry on this thread while the pool runs the others
+            futures = [self.pool.submit(fn, entry) for entry in stage[1:]]
+            fn(stage[0])
+            for f in futures:
+                f.result()
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
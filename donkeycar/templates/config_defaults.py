@@ -23,10 +23,18 @@ MODELS_PATH = os.path.join(CAR_PATH, 'models')
 #VEHICLE
 DRIVE_LOOP_HZ = 20
 MAX_LOOPS = 100000
+DRIVE_LOOP_WORKERS = 0          #threads to run independent parts concurrently, 0 runs them in order
+
+#RECORDING
+RECORD_HZ = DRIVE_LOOP_HZ       #lower this to save tub records less often than the drive loop runs
+RECORD_ASYNC = True             #encode and write records in background threads
+RECORD_QUEUE_SIZE = 100         #records waiting to be written before new ones are dropped
+TUB_FORMAT = 'json'             #'segment' appends records to a few large files, see `donkey converttub`
 
 #CAMERA
 CAMERA_RESOLUTION = (160, 120)
 CAMERA_FRAMERATE = DRIVE_LOOP_HZ
+CAMERA_CALIBRATION = None       #profile written by donkeycar/tools/fisheye_calibrate.py, None uses the built in one
 
 #STEERING
 STEERING_CHANNEL = 1
@@ -39,9 +47,17 @@ THROTTLE_FORWARD_PWM = 400
 THROTTLE_STOPPED_PWM = 360
 THROTTLE_REVERSE_PWM = 310
 
+#PILOT
+PILOT_ASYNC = False             #infer in a thread on the newest frame so slow inference doesn't stall the drive loop
+PILOT_NUMPY = False             #run keras models with numpy only, without loading keras and tensorflow
+
 #TRAINING
 BATCH_SIZE = 128
 TRAIN_TEST_SPLIT = 0.8
+TRAIN_WORKERS = 0               #processes loading each of the train and validation batches, 0 loads them in the training process
+TRAIN_PREFETCH = 4              #batches loaded ahead by the workers
+TRAIN_CACHE_MB = 1024           #memory kept for decoded records when training with --cache
+TRAIN_AUGMENT = False           #augment the training batches when training with --cache
 
 
 #JOYSTICK
@@ -4,7 +4,7 @@ Scripts to drive a donkey 2 car and train a model for it.
 
 Usage:
     manage.py (drive) [--model=<model>] [--js]
-    manage.py (train) [--tub=<tub1,tub2,..tubn>] (--model=<model>) [--cache]
+    manage.py (train) [--tub=<tub1,tub2,..tubn>] (--model=<model>) [--cache] [--image_cache=<dir>]
     manage.py (calibrate)
     manage.py (check) [--tub=<tub1,tub2,..tubn>] [--fix]
     manage.py (analyze) [--tub=<tub1,tub2,..tubn>] (--op=<histogram>) (--rec=<"user/angle">)
@@ -14,12 +14,12 @@ Options:
     -h --help     Show this screen.
     --js          Use physical joystick.
     --fix         Remove records which cause problems.
+    --image_cache=<dir>  Folder of preprocessed images, built on first use.
 
 """
 import os
 from docopt import docopt
 import donkeycar as dk 
-from donkeycar.visualization import visualize
 
 
 def drive(cfg, model_path=None, use_joystick=False):
@@ -33,10 +33,13 @@ def drive(cfg, model_path=None, use_joystick=False):
     to parts requesting the same named input.
     '''
 
+    load_calibration(cfg)
+
     #Initialize car
     V = dk.vehicle.Vehicle()
     cam = dk.parts.PiCamera(resolution=cfg.CAMERA_RESOLUTION)
-    V.add(cam, outputs=['cam/image_array'], threaded=True)
+    V.add(cam, outputs=['cam/image_array'], threaded=True,
+          timestamp='cam/timestamp')
     
     if use_joystick or cfg.USE_JOYSTICK_AS_DEFAULT:
         #modify max_throttle closer to 1.0 to have more power
@@ -75,13 +78,28 @@ def drive(cfg, model_path=None, use_joystick=False):
     V.add(pilot_condition_part, inputs=['user/mode'], outputs=['run_pilot'])
     
     #Run the pilot if the mode is not user.
-    kl = dk.parts.KerasCategorical()
-    if model_path:
-        kl.load(model_path)
+    if model_path and model_path.endswith('.tflite'):
+        #a model exported by scripts/export_tflite.py
+        kl = dk.parts.TFLitePilot(model_path)
+    elif model_path and getattr(cfg, 'PILOT_NUMPY', False):
+        kl = dk.parts.NumpyPilot(model_path)
+    else:
+        kl = dk.parts.KerasCategorical()
+        if model_path:
+            kl.load(model_path)
     
-    V.add(kl, inputs=['cam/image_array'], 
-          outputs=['pilot/angle', 'pilot/throttle'],
-          run_condition='run_pilot')
+    if getattr(cfg, 'PILOT_ASYNC', False):
+        #infer in a thread on the newest frame, the loop drives on the last result
+        V.add(dk.parts.AsyncPilot(kl),
+              inputs=['cam/image_array', 'cam/timestamp'],
+              outputs=['pilot/angle', 'pilot/throttle', 'pilot/timestamp'],
+              threaded=True,
+              run_condition='run_pilot')
+    else:
+        V.add(kl, inputs=['cam/image_array'], 
+              outputs=['pilot/angle', 'pilot/throttle'],
+              run_condition='run_pilot',
+              on_change=['cam/image_array'])
     
     
     #Choose what inputs should change the car.
@@ -108,20 +126,26 @@ def drive(cfg, model_path=None, use_joystick=False):
     V.add(steering, inputs=['angle'])
     
     #add tub to save data
-    inputs=['cam/image_array',
+    inputs=['cam/image_array', 'cam/timestamp',
             'user/angle', 'user/throttle', 
             'user/mode']
-    types=['image_array',
+    types=['image_array', 'float',
            'float', 'float',  
            'str']
     
     th = dk.parts.TubHandler(path=cfg.DATA_PATH)
-    tub = th.new_tub_writer(inputs=inputs, types=types)
-    V.add(tub, inputs=inputs, run_condition='recording')
+    tub = th.new_tub_writer(inputs=inputs, types=types,
+                            asynchronous=getattr(cfg, 'RECORD_ASYNC', False),
+                            queue_size=getattr(cfg, 'RECORD_QUEUE_SIZE', 100),
+                            format=getattr(cfg, 'TUB_FORMAT', 'json'))
+    V.add(tub, inputs=inputs, run_condition='recording',
+          rate_hz=getattr(cfg, 'RECORD_HZ', None),
+          on_change=['cam/image_array'])
     
     #run the vehicle for 20 seconds
     V.start(rate_hz=cfg.DRIVE_LOOP_HZ, 
-            max_loop_count=cfg.MAX_LOOPS)
+            max_loop_count=cfg.MAX_LOOPS,
+            workers=getattr(cfg, 'DRIVE_LOOP_WORKERS', 0))
     
     print("You can now go to <your pi ip address>:8887 to drive your car.")
 
@@ -143,6 +167,19 @@ def expand_path_masks(paths):
     return expanded_paths
 
 
+def load_calibration(cfg):
+    '''
+    use the camera calibration profile given in the config, if any, instead
+    of the calibration built into fisheye_undistort.py
+    '''
+    path = getattr(cfg, 'CAMERA_CALIBRATION', None)
+    if path:
+        from donkeycar.tools.fisheye_undistort import load_profile
+        path = os.path.join(cfg.CAR_PATH, os.path.expanduser(path))
+        print('loading camera calibration', path)
+        load_profile(path)
+
+
 def gather_tubs(cfg, tub_names):
     
     if tub_names:
@@ -152,13 +189,16 @@ def gather_tubs(cfg, tub_names):
         return [os.path.join(cfg.DATA_PATH, n) for n in os.listdir(cfg.DATA_PATH)]
 
 
-def train(cfg, tub_names, model_name, cache):
+def train(cfg, tub_names, model_name, cache, image_cache=None):
     '''
     use the specified data in tub_names to train an artifical neural network
     saves the output trained model as model_name
+    image_cache is a folder where the preprocessed images are kept between runs
     '''
     X_keys = ['cam/image_array']
     y_keys = ['user/angle', 'user/throttle']
+
+    load_calibration(cfg)
     
     def rt(record):
         record['user/angle'] = dk.utils.linear_bin(record['user/angle'])
@@ -168,7 +208,12 @@ def train(cfg, tub_names, model_name, cache):
     
     tub_paths = gather_tubs(cfg, tub_names)
 
-    tub_chain = dk.parts.TubChain(tub_paths, X_keys, y_keys, cache=cache, record_transform=rt, batch_size=cfg.BATCH_SIZE, train_split=cfg.TRAIN_TEST_SPLIT)
+    tub_chain = dk.parts.TubChain(tub_paths, X_keys, y_keys, cache=cache, record_transform=rt, batch_size=cfg.BATCH_SIZE, train_split=cfg.TRAIN_TEST_SPLIT,
+                                  image_cache=image_cache,
+                                  workers=getattr(cfg, 'TRAIN_WORKERS', 0),
+                                  prefetch=getattr(cfg, 'TRAIN_PREFETCH', 4),
+                                  cache_bytes=getattr(cfg, 'TRAIN_CACHE_MB', 1024) * 2 ** 20,
+                                  augment=getattr(cfg, 'TRAIN_AUGMENT', False))
     train_gens, val_gens = tub_chain.train_val_gen()
 
     model_path = os.path.expanduser(model_name)
@@ -209,17 +254,13 @@ def anaylze(cfg, tub_names, op, record):
     '''
     look at the tub data and produce some analysis
     '''
-    tubs = gather_tubs(cfg, tub_names)
+    tubs = [dk.parts.Tub(p) for p in gather_tubs(cfg, tub_names)]
 
     if op == 'histogram':
+        import numpy as np
         import matplotlib.pyplot as plt
-        samples = []
-        for tub in tubs:
-            num_records = tub.get_num_records()
-            for iRec in range(0, num_records):
-                json_data = tub.get_json_record(iRec)
-                sample = json_data[record]
-                samples.append(float(sample))
+        samples = np.concatenate([tub.column(record) for tub in tubs]).astype(float)
+        samples = samples[~np.isnan(samples)]
 
         plt.hist(samples, 50)
         plt.xlabel(record)
@@ -240,7 +281,8 @@ if __name__ == '__main__':
         tub = args['--tub']
         model = args['--model']
         cache = args['--cache']
-        train(cfg, tub, model, cache)
+        image_cache = args['--image_cache']
+        train(cfg, tub, model, cache, image_cache)
 
     elif args['check']:
         tub = args['--tub']
@@ -258,6 +300,8 @@ if __name__ == '__main__':
         model = args['--model']
         out = args['--out']
         gradcam = args['--grad-cam']
+        #keras and opencv are only loaded for this command
+        from donkeycar.visualization import visualize
         visualize(cfg, tub, model, out, gradcam)
 
 
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import subprocess
+
+import donkeycar as dk
+
+
+HEAVY = ('keras', 'tensorflow', 'cv2', 'tornado', 'requests')
+
+IMPORT = '''
+import sys, json, time
+before = set(sys.modules)
+start = time.perf_counter()
+import donkeycar as dk
+{}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': sorted(set(sys.modules) - before)}}))
+'''
+
+
+def import_donkeycar(code=''):
+    '''
+    Import donkeycar, then run code, in a new interpreter. Return the time
+    it took and the modules it loaded.
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    out = subprocess.check_output([sys.executable, '-c', IMPORT.format(code)],
+                                  cwd=root)
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+
+def heavy(modules):
+    return [m for m in modules if m.split('.')[0] in HEAVY]
+
+
+def test_import_is_light():
+    result = import_donkeycar()
+    print('import donkeycar took {:.3f}s'.format(result['seconds']))
+    assert heavy(result['loaded']) == []
+    assert 'donkeycar.parts.ml.keras' not in result['loaded']
+
+def test_parts_load_on_use():
+    result = import_donkeycar('dk.parts.Lambda, dk.parts.MockCamera, dk.parts.AsyncPilot')
+    assert 'donkeycar.parts.transforms' in result['loaded']
+    assert 'donkeycar.parts.sensors.cameras' in result['loaded']
+    assert heavy(result['loaded']) == []
+
+def test_lazy_parts():
+    from donkeycar.parts.transforms import Lambda
+    from donkeycar.parts.actuators import actuators
+    assert dk.parts.Lambda is Lambda
+    assert dk.parts.actuators.actuators is actuators
+    assert 'TubChain' in dir(dk.parts)
+    assert set(dk.parts.__all__) == set(dk.parts.PARTS)
+    try:
+        dk.parts.NoSuchPart
+    except AttributeError:
+        pass
+    else:
+        assert False, 'unknown parts should raise AttributeError'
+
+def test_light_pilots_skip_keras():
+    result = import_donkeycar('dk.parts.NumpyPilot, dk.parts.TFLitePilot')
+    assert 'donkeycar.parts.ml.pilot' in result['loaded']
+    assert not [m for m in result['loaded'] if m.split('.')[0] in ('keras', 'tensorflow')]
+    assert 'donkeycar.parts.ml.keras' not in result['loaded']
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import unittest
+import numpy as np
+from ..memory import Memory, SlotMemory
+
+
+class TestSlotMemory(unittest.TestCase):
+    def setUp(self):
+        self.mem = SlotMemory({'img': (2, 2, 3), 'angle': 'float',
+                               'count': 'int', 'recording': 'boolean'})
+
+    def test_unset_is_none(self):
+        assert self.mem.get(['img', 'angle', 'other']) == [None, None, None]
+
+    def test_scalars(self):
+        self.mem.put(['angle', 'count', 'recording'], (0.5, 3, True))
+        assert self.mem.get(['angle', 'count', 'recording']) == [0.5, 3, True]
+        assert type(self.mem['count']) is int
+
+    def test_arrays_are_views(self):
+        frame = np.ones((2, 2, 3), dtype=np.uint8)
+        self.mem.put(['img'], frame)
+        first = self.mem.get(['img'])[0]
+        self.mem.put(['img'], frame * 2)
+        second = self.mem.get(['img'])[0]
+        assert first is second
+        assert (second == 2).all()
+
+    def test_in_place_frames(self):
+        #a part updating one array and returning it on every call
+        frame = np.zeros((2, 2, 3), dtype=np.uint8)
+        put = self.mem.setter(['img'])
+        seen = []
+        for i in range(1, 4):
+            frame[:] = i
+            put(frame)
+            seen.append(int(self.mem['img'][0, 0, 0]))
+            frame[:] = i + 10
+            self.mem.put(['img'], frame)
+            seen.append(int(self.mem['img'][0, 0, 0]))
+        assert seen == [1, 11, 2, 12, 3, 13]
+        assert self.mem.version('img') == 6
+
+    def test_undeclared_channels(self):
+        self.mem.put(['user/mode'], 'user')
+        assert self.mem['user/mode'] == 'user'
+        assert 'user/mode' in self.mem.keys()
+
+    def test_same_as_memory(self):
+        plain = Memory()
+        for m in (plain, self.mem):
+            m.put(['angle', 'user/mode'], (0.25, 'local'))
+        assert plain.get(['angle', 'user/mode']) == self.mem.get(['angle', 'user/mode'])
+
+
+class TestBindings(unittest.TestCase):
+    def check(self, mem):
+        put = mem.setter(['angle', 'user/mode'])
+        get = mem.getter(['angle', 'user/mode', 'missing'])
+        read = mem.reader('angle')
+        put((0.5, 'user'))
+        assert list(get()) == [0.5, 'user', None]
+        assert read() == 0.5
+        with self.assertRaises(IndexError):
+            put((0.5,))
+
+    def test_memory(self):
+        self.check(Memory())
+
+    def test_slot_memory(self):
+        self.check(SlotMemory({'angle': 'float'}))
+
+
+class TestVersions(unittest.TestCase):
+    def check(self, mem):
+        frame = np.zeros((2, 2, 3), dtype=np.uint8)
+        assert mem.version('img') == 0
+        mem.put(['img'], frame)
+        assert mem.version('img') == 1
+        mem.put(['img'], frame)
+        assert mem.version('img') == 1
+        mem.put(['img'], frame.copy())
+        assert mem.version('img') == 2
+        assert mem.changed_at('img') is not None
+
+        changed = mem.change_detector(['img'])
+        assert not changed()
+        mem.setter(['img'])(frame)
+        assert changed()
+        assert not changed()
+
+    def test_memory(self):
+        self.check(Memory())
+
+    def test_slot_memory_undeclared(self):
+        self.check(SlotMemory({'angle': 'float'}))
+
+    def test_slot_memory_scalars(self):
+        mem = SlotMemory({'angle': 'float'})
+        angle = 0.5
+        mem.put(['angle'], angle)
+        mem.setter(['angle'])(angle)
+        assert mem.version('angle') == 1
+        mem.put(['angle'], 0.25)
+        assert mem.version('angle') == 2
+
+    def test_slot_memory_arrays(self):
+        mem = SlotMemory({'img': (2, 2, 3)})
+        frame = np.zeros((2, 2, 3), dtype=np.uint8)
+        changed = mem.change_detector(['img'])
+        mem.put(['img'], frame)
+        mem.setter(['img'])(frame)
+        assert mem.version('img') == 2
+        assert changed()
+        #writing the buffer itself back counts too
+        mem.put(['img'], mem['img'])
+        assert mem.version('img') == 3
+
+    def test_in_place(self):
+        for mem in (Memory(), SlotMemory({'angle': 'float'})):
+            frame, angle = np.zeros(2), 0.5
+            put = mem.setter(['frame', 'angle'], in_place=True)
+            put((frame, angle))
+            put((frame, angle))
+            assert [mem.version('frame'), mem.version('angle')] == [2, 2]
+            mem.touch('frame')
+            assert mem.version('frame') == 3
+
+    def test_wait(self):
+        import threading
+        mem = Memory()
+        t = threading.Timer(0.05, mem.put, args=(['x'], 1))
+        t.start()
+        value, version = mem.wait('x', 0, timeout=5)
+        assert (value, version) == (1, 1)
+        assert mem.wait('x', 1, timeout=0.01) == (1, 1)
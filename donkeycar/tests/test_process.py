@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+import numpy as np
+from ..process import SharedRing, ProcessPart
+from ..parts.transforms import Lambda
+from ..memory import Memory, SlotMemory
+from ..vehicle import Vehicle
+
+
+class TestSharedRing(unittest.TestCase):
+    def test_views_slots(self):
+        ring = SharedRing((2, 3), slots=2)
+        assert ring.read() is None
+        a = np.ones((2, 3), dtype=np.uint8)
+        seq = ring.write(a)
+        view = ring.read(seq)
+        assert (view == 1).all()
+        assert view.base is not None
+        #writing the same object again doesn't take a new slot
+        assert ring.write(a) == seq
+
+    def test_same_sequence_same_view(self):
+        ring = SharedRing((2, 3), slots=2)
+        a = np.ones((2, 3), dtype=np.uint8)
+        seq = ring.write(a)
+        assert ring.read(seq) is ring.read(seq)
+        seq2 = ring.write(a.copy())
+        assert ring.read(seq2) is not ring.read(seq)
+
+    def test_in_place(self):
+        ring = SharedRing((2, 3), slots=2)
+        buf = np.ones((2, 3), dtype=np.uint8)
+        seq = ring.write(buf)
+        view = ring.read(seq)
+        buf[:] = 2
+        #the same object updated in place, as SlotMemory passes frames
+        assert ring.write(buf) == seq
+        assert ring.read(seq) is view
+        assert (view == 2).all()
+
+
+class TestProcessPart(unittest.TestCase):
+    def test_round_trip(self):
+        part = ProcessPart(Lambda(lambda img, x: (img * 2, x + 1, os.getpid())),
+                           inputs=['img', 'x'], outputs=['img2', 'y', 'pid'],
+                           shapes={'img': (4, 4), 'img2': (4, 4)})
+        try:
+            img2, y, pid = part.run(np.ones((4, 4), dtype=np.uint8), 1)
+        finally:
+            part.shutdown()
+        assert (img2 == 2).all()
+        assert y == 2
+        assert pid != os.getpid()
+
+    def test_slot_memory_inputs(self):
+        v = Vehicle(mem=SlotMemory({'img': (4, 4)}))
+        frames = iter(range(1, 7))
+        seen = []
+        v.add(Lambda(lambda: np.full((4, 4), next(frames), dtype=np.uint8)),
+              outputs=['img'])
+        v.add(Lambda(lambda img: int(img[0, 0])), inputs=['img'],
+              outputs=['seen'], process=True, shapes={'img': (4, 4)})
+        v.add(Lambda(seen.append), inputs=['seen'])
+        v.start(rate_hz=100, max_loop_count=6)
+        assert seen == [1, 2, 3, 4, 5, 6]
+
+    def test_in_place_inputs(self):
+        for mem in (Memory(), SlotMemory({'img': (4, 4)})):
+            v = Vehicle(mem=mem)
+            frame = np.zeros((4, 4), dtype=np.uint8)
+            def camera():
+                frame[:] += 1
+                return frame
+            seen = []
+            v.add(Lambda(camera), outputs=['img'])
+            v.add(Lambda(lambda img: int(img[0, 0])), inputs=['img'],
+                  outputs=['seen'], process=True, shapes={'img': (4, 4)})
+            v.add(Lambda(seen.append), inputs=['seen'])
+            v.start(rate_hz=100, max_loop_count=5)
+            assert seen == [1, 2, 3, 4, 5]
+
+    def test_in_place_outputs(self):
+        frame = np.zeros((4, 4), dtype=np.uint8)
+        def camera():
+            frame[:] += 1
+            return frame
+        part = ProcessPart(Lambda(camera), outputs=['img'], shapes={'img': (4, 4)})
+        try:
+            seen = [int(part.run()[0, 0]) for _ in range(3)]
+        finally:
+            part.shutdown()
+        assert seen == [1, 2, 3]
+
+    def test_on_change_across_process(self):
+        v = Vehicle()
+        frame = np.ones((4, 4), dtype=np.uint8)
+        runs = []
+        #a camera in a process returning the same frame every loop
+        v.add(Lambda(lambda: frame), outputs=['img'],
+              process=True, shapes={'img': (4, 4)})
+        v.add(Lambda(lambda img: runs.append(1)), inputs=['img'],
+              on_change=True)
+        v.start(rate_hz=100, max_loop_count=10)
+        assert len(runs) == 1
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import unittest
+from ..profiler import Histogram, Profiler
+
+
+class TestHistogram(unittest.TestCase):
+    def setUp(self):
+        self.hist = Histogram()
+        for ms in range(1, 101):
+            self.hist.add(ms / 1000.0)
+
+    def test_percentiles(self):
+        s = self.hist.summary()
+        assert s['count'] == 100
+        assert abs(s['p50'] - 0.050) < 0.050 * 0.02
+        assert abs(s['p99'] - 0.099) < 0.099 * 0.02
+        assert s['max'] == 0.1
+
+    def test_empty(self):
+        assert Histogram().percentile(50) is None
+
+
+class TestProfiler(unittest.TestCase):
+    def test_report(self):
+        p = Profiler()
+        p.record('Lambda', 0.002)
+        assert 'Lambda' in p.summary()
+        assert 'Lambda' in p.report()
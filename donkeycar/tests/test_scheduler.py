@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import unittest
+from ..scheduler import LoopScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, secs):
+        self.now += secs
+
+    def work(self, secs):
+        self.now += secs
+
+
+class TestLoopScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def make(self, **kwargs):
+        return LoopScheduler(10, clock=self.clock, sleep=self.clock.sleep, **kwargs)
+
+    def test_keeps_fixed_period(self):
+        s = self.make()
+        starts = [s.start()]
+        for _ in range(5):
+            self.clock.work(0.03)
+            starts.append(s.wait())
+        periods = [round(b - a, 6) for a, b in zip(starts, starts[1:])]
+        assert periods == [0.1] * 5
+        assert s.stats.overruns == 0
+
+    def test_skip_reanchors(self):
+        s = self.make(overrun='skip')
+        s.start()
+        self.clock.work(0.35)
+        late = s.wait()
+        assert s.stats.overruns == 1
+        assert s.stats.skipped == 2
+        self.clock.work(0.01)
+        assert round(s.wait() - late, 6) == 0.1
+
+    def test_catch_up_replays_ticks(self):
+        s = self.make(overrun='catch_up')
+        start = s.start()
+        self.clock.work(0.25)
+        s.wait()
+        s.wait()
+        assert s.stats.skipped == 0
+        assert round(s.wait() - start, 6) == 0.3
+
+    def test_bad_policy(self):
+        with self.assertRaises(ValueError):
+            self.make(overrun='nope')
+
+    def test_divisor(self):
+        s = LoopScheduler(20)
+        assert s.divisor(None) == 1
+        assert s.divisor(40) == 1
+        assert s.divisor(10) == 2
+        assert s.divisor(2) == 10
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import unittest
+from ..stages import build_stages
+
+
+def entry(name, inputs=[], outputs=[], run_condition=None):
+    return {'name': name, 'inputs': inputs, 'outputs': outputs,
+            'run_condition': run_condition}
+
+
+class TestBuildStages(unittest.TestCase):
+    def names(self, stages):
+        return [[e['name'] for e in stage] for stage in stages]
+
+    def test_independent_readers_share_a_stage(self):
+        entries = [entry('cam', outputs=['img']),
+                   entry('pilot', inputs=['img'], outputs=['angle']),
+                   entry('tub', inputs=['img']),
+                   entry('steering', inputs=['angle'])]
+        assert self.names(build_stages(entries)) == [['cam'], ['pilot', 'tub'], ['steering']]
+
+    def test_write_after_read_keeps_order(self):
+        entries = [entry('reader', inputs=['x']),
+                   entry('writer', outputs=['x'])]
+        assert self.names(build_stages(entries)) == [['reader'], ['writer']]
+
+    def test_run_condition_is_a_dependency(self):
+        entries = [entry('cond', outputs=['run']),
+                   entry('pilot', run_condition='run')]
+        assert self.names(build_stages(entries)) == [['cond'], ['pilot']]
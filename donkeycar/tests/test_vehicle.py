@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import unittest
+import numpy as np
+from ..vehicle import Vehicle
+from ..memory import Memory, SlotMemory
+from ..parts.transforms import Lambda
+
+
+class TestVehicle(unittest.TestCase):
+    def setUp(self):
+        self.v = Vehicle()
+        self.v.mem.put(['count'], 0)
+        self.v.add(Lambda(lambda x: x + 1), inputs=['count'], outputs=['count'])
+        self.v.add(Lambda(lambda x: x * 2), inputs=['count'], outputs=['double'])
+
+    def test_runs_parts_in_order(self):
+        self.v.start(rate_hz=100, max_loop_count=5)
+        assert self.v.mem.get(['count', 'double']) == [5, 10]
+
+    def test_profile(self):
+        self.v.start(rate_hz=100, max_loop_count=5)
+        profile = self.v.profile()
+        assert profile['Lambda']['count'] == 5
+        assert profile['Lambda_2']['count'] == 5
+        assert self.v.loop_stats()['ticks'] == 5
+
+    def test_workers(self):
+        self.v.add(Lambda(lambda x: x * 3), inputs=['count'], outputs=['triple'])
+        self.v.start(rate_hz=100, max_loop_count=5, workers=2)
+        assert self.v.mem.get(['count', 'double', 'triple']) == [5, 10, 15]
+        assert len(self.v.stages) == 2
+
+    def test_every(self):
+        calls = []
+        self.v.add(Lambda(lambda: calls.append(1)), every=2)
+        self.v.add(Lambda(lambda: calls.append(2)), every=2)
+        self.v.add(Lambda(lambda: calls.append(4)), rate_hz=25)
+        self.v.start(rate_hz=100, max_loop_count=8)
+        assert calls.count(1) == 4
+        assert calls.count(2) == 4
+        assert calls.count(4) == 2
+        #parts with the same divisor run on alternate loops
+        assert calls[:3] == [1, 4, 2]
+
+    def test_on_change(self):
+        calls = []
+        self.v.add(Lambda(lambda: 'frame'), outputs=['img'], every=2)
+        self.v.add(Lambda(lambda img: calls.append(img)), inputs=['img'],
+                   on_change=True)
+        self.v.start(rate_hz=100, max_loop_count=6)
+        assert len(calls) == 1
+
+    def test_in_place_producer(self):
+        for mem in (Memory(), SlotMemory({'buf': (2,)})):
+            v = Vehicle(mem=mem)
+            buf = np.zeros(2, dtype=np.uint8)
+            def produce():
+                buf[:] += 1
+                return buf
+            seen = []
+            v.add(Lambda(produce), outputs=['buf'])
+            v.add(Lambda(lambda b: seen.append(int(b[0]))), inputs=['buf'])
+            v.start(rate_hz=100, max_loop_count=5)
+            assert seen == [1, 2, 3, 4, 5]
+
+    def test_on_change_in_place(self):
+        for in_place, expected in ((False, 1), (True, 5)):
+            v = Vehicle()
+            buf = np.zeros(2, dtype=np.uint8)
+            def produce():
+                buf[:] += 1
+                return buf
+            calls = []
+            v.add(Lambda(produce), outputs=['buf'], in_place=in_place)
+            v.add(Lambda(lambda b: calls.append(int(b[0]))), inputs=['buf'],
+                  on_change=True)
+            v.start(rate_hz=100, max_loop_count=5)
+            assert len(calls) == expected
+            assert v.mem.version('buf') == expected
+
+    def test_latency(self):
+        import time
+        from ..parts.sensors.cameras import MockCamera
+
+        class OldFrameCamera(MockCamera):
+            def run_threaded(self):
+                self.frame_time = time.time() - 0.5
+                return self.frame
+
+        self.v.add(OldFrameCamera(image=1), outputs=['img'], threaded=True,
+                   timestamp='cam/timestamp')
+        self.v.add(Lambda(lambda img: img), inputs=['img'], outputs=['angle'])
+        self.v.add(Lambda(lambda angle: None), inputs=['angle'])
+        self.v.start(rate_hz=100, max_loop_count=3)
+
+        latency = self.v.latency()
+        assert list(latency) == ['Lambda_4']
+        assert latency['Lambda_4']['min'] >= 0.5
+        assert self.v.mem.origin(['angle']) == self.v.mem['cam/timestamp']
@@ -1,61 +1,97 @@
-import sys
+"""
+Calibrate a fisheye camera from photos of a 6x9 checkerboard and save the
+calibration as a profile that fisheye_undistort.load_profile reads.
+
+Usage:
+    fisheye_calibrate.py [--out=<profile.npz>] [--resolution=<160x120>] [--balance=<0.55>] <images>...
+
+Options:
+    --out=<profile.npz>       Profile to write. [default: calibration.npz]
+    --resolution=<160x120>    Camera resolutions to precompute the maps for, comma separated. [default: 160x120]
+    --balance=<0.55>          Balance of the precomputed maps. [default: 0.55]
+"""
+from docopt import docopt
 import cv2
-assert cv2.__version__[0] == '3', 'The fisheye module requires opencv version >= 3.0.0'
+assert int(cv2.__version__.split('.')[0]) >= 3, 'The fisheye module requires opencv version >= 3.0.0'
 import numpy as np
 import os
 
+from donkeycar.tools.fisheye_undistort import save_profile
+
 CHECKERBOARD = (6,9)
 
+#rows of the undistorted 120 row image given to the pilots
+CROP = (9, 79)
+
 subpix_criteria = (cv2.TERM_CRITERIA_EPS+cv2.TERM_CRITERIA_MAX_ITER, 30, 0.1)
 calibration_flags = cv2.fisheye.CALIB_RECOMPUTE_EXTRINSIC+cv2.fisheye.CALIB_CHECK_COND+cv2.fisheye.CALIB_FIX_SKEW
 
-objp = np.zeros((1, CHECKERBOARD[0]*CHECKERBOARD[1], 3), np.float32)
-objp[0,:,:2] = np.mgrid[0:CHECKERBOARD[0], 0:CHECKERBOARD[1]].T.reshape(-1, 2)
-
-_img_shape = None
-objpoints = [] # 3d point in real world space
-imgpoints = [] # 2d points in image plane.
-
-images = sys.argv[1:]
-
-for fname in images:
-    img = cv2.imread(fname)
-    if _img_shape == None:
-        _img_shape = img.shape[:2]
-    else:
-        assert _img_shape == img.shape[:2], "All images must share the same size."
-
-    gray = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
-    # Find the chess board corners
-    ret, corners = cv2.findChessboardCorners(gray, CHECKERBOARD, cv2.CALIB_CB_ADAPTIVE_THRESH+cv2.CALIB_CB_FAST_CHECK+cv2.CALIB_CB_NORMALIZE_IMAGE)
-    # If found, add object points, image points (after refining them)
-    if ret == True:
-        objpoints.append(objp)
-        cv2.cornerSubPix(gray,corners,(3,3),(-1,-1),subpix_criteria)
-        imgpoints.append(corners)
-
-        # Draw and display the corners
-        #cv2.drawChessboardCorners(img, (6,9), corners,ret)
-        #cv2.imwrite(fname + "marked.jpg" ,img)
-
-N_OK = len(objpoints)
-K = np.zeros((3, 3))
-D = np.zeros((4, 1))
-rvecs = [np.zeros((1, 1, 3), dtype=np.float64) for i in range(N_OK)]
-tvecs = [np.zeros((1, 1, 3), dtype=np.float64) for i in range(N_OK)]
-rms, _, _, _, _ = \
-    cv2.fisheye.calibrate(
-        objpoints,
-        imgpoints,
-        gray.shape[::-1],
-        K,
-        D,
-        rvecs,
-        tvecs,
-        calibration_flags,
-        (cv2.TERM_CRITERIA_EPS+cv2.TERM_CRITERIA_MAX_ITER, 30, 1e-6)
-    )
-print("Found " + str(N_OK) + "images for calibration")
-print("DIM=" + str(_img_shape[::-1]))
-print("K=np.array(" + str(K.tolist()) + ")")
-print("D=np.array(" + str(D.tolist()) + ")")
+
+def calibrate(images):
+    objp = np.zeros((1, CHECKERBOARD[0]*CHECKERBOARD[1], 3), np.float32)
+    objp[0,:,:2] = np.mgrid[0:CHECKERBOARD[0], 0:CHECKERBOARD[1]].T.reshape(-1, 2)
+
+    _img_shape = None
+    objpoints = [] # 3d point in real world space
+    imgpoints = [] # 2d points in image plane.
+
+    for fname in images:
+        img = cv2.imread(fname)
+        if _img_shape == None:
+            _img_shape = img.shape[:2]
+        else:
+            assert _img_shape == img.shape[:2], "All images must share the same size."
+
+        gray = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
+        # Find the chess board corners
+        ret, corners = cv2.findChessboardCorners(gray, CHECKERBOARD, cv2.CALIB_CB_ADAPTIVE_THRESH+cv2.CALIB_CB_FAST_CHECK+cv2.CALIB_CB_NORMALIZE_IMAGE)
+        # If found, add object points, image points (after refining them)
+        if ret == True:
+            objpoints.append(objp)
+            cv2.cornerSubPix(gray,corners,(3,3),(-1,-1),subpix_criteria)
+            imgpoints.append(corners)
+
+            # Draw and display the corners
+            #cv2.drawChessboardCorners(img, (6,9), corners,ret)
+            #cv2.imwrite(fname + "marked.jpg" ,img)
+
+    N_OK = len(objpoints)
+    K = np.zeros((3, 3))
+    D = np.zeros((4, 1))
+    rvecs = [np.zeros((1, 1, 3), dtype=np.float64) for i in range(N_OK)]
+    tvecs = [np.zeros((1, 1, 3), dtype=np.float64) for i in range(N_OK)]
+    rms, _, _, _, _ = \
+        cv2.fisheye.calibrate(
+            objpoints,
+            imgpoints,
+            gray.shape[::-1],
+            K,
+            D,
+            rvecs,
+            tvecs,
+            calibration_flags,
+            (cv2.TERM_CRITERIA_EPS+cv2.TERM_CRITERIA_MAX_ITER, 30, 1e-6)
+        )
+    print("Found " + str(N_OK) + "images for calibration")
+    return _img_shape[::-1], K, D
+
+
+def parse_resolutions(text):
+    return [tuple(int(v) for v in r.split('x')) for r in text.split(',')]
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    DIM, K, D = calibrate(args['<images>'])
+    print("DIM=" + str(DIM))
+    print("K=np.array(" + str(K.tolist()) + ")")
+    print("D=np.array(" + str(D.tolist()) + ")")
+
+    balance = float(args['--balance'])
+    maps = []
+    for w, h in parse_resolutions(args['--resolution']):
+        maps.append((w, h, balance, None, None))
+        if h == 120:
+            maps.append((w, h, balance, CROP, None))
+    save_profile(args['--out'], DIM, K, D, maps)
+    print("saved calibration profile", args['--out'])
@@ -3,26 +3,107 @@ import os
 import glob
 import sys
 import cv2
+import json
 
 
+# Calibration used when none is given. load_profile replaces it.
 DIM=(1600, 1200)
 K=np.array([[781.3524863867165, 0.0, 794.7118000552183], [0.0, 779.5071163774452, 561.3314451453386], [0.0, 0.0, 1.0]])
 D=np.array([[-0.042595202508066574], [0.031307765215775184], [-0.04104704724832258], [0.015343014605793324]])
 
-def undistort_maps(img, balance):
+# Maps already computed, by resolution, balance, calibration and region.
+_maps = {}
+
+def undistort_maps(img, balance, dim=None, k=None, d=None, crop=None, size=None):
+    dim, k, d = calibration(dim, k, d)
     h,w = img.shape[:2]
+    key = maps_key(w, h, balance, dim, k, d, crop, size)
+    maps = _maps.get(key)
+    if maps is None:
+        maps = compute_undistort_maps(w, h, balance, dim, k, d, crop, size)
+        _maps[key] = maps
+    return maps
+
+def calibration(dim=None, k=None, d=None):
+    """
+    Fill in the current calibration for the parts not given.
+    """
+    return (DIM if dim is None else dim,
+            K if k is None else k,
+            D if d is None else d)
+
+def maps_key(w, h, balance, dim, k, d, crop=None, size=None):
+    crop = tuple(crop) if crop is not None else None
+    size = tuple(size) if size is not None else None
+    return (w, h, balance, tuple(dim), np.asarray(k, dtype=np.float64).tobytes(),
+            np.asarray(d, dtype=np.float64).tobytes(), crop, size)
+
+def compute_undistort_maps(w, h, balance, dim=None, k=None, d=None, crop=None, size=None):
+    """
+    Compute the maps to undistort images of w x h pixels.
 
-    assert w/h == DIM[0]/DIM[1], "Image to undistort needs to have same aspect ratio as the ones used in calibration"
+    crop is a (top, bottom) range of rows of the undistorted image, and
+    size the (width, height) to resize it to. The maps then only produce
+    that region, so a single cv2.remap crops and resizes too.
+    """
+    dim, k, d = calibration(dim, k, d)
+    assert w/h == dim[0]/dim[1], "Image to undistort needs to have same aspect ratio as the ones used in calibration"
 
-    scaled_K = K * w / DIM[0]
+    scaled_K = k * w / dim[0]
     scaled_K[2][2] = 1 # K[2][2] is always 1
-    newmtx = cv2.fisheye.estimateNewCameraMatrixForUndistortRectify(scaled_K, D, (w,h), np.eye(3), balance=balance)
-    return cv2.fisheye.initUndistortRectifyMap(scaled_K, D, np.eye(3), newmtx, (w,h), cv2.CV_16SC2)
+    newmtx = cv2.fisheye.estimateNewCameraMatrixForUndistortRectify(scaled_K, d, (w,h), np.eye(3), balance=balance)
+    if crop is None and size is None:
+        return cv2.fisheye.initUndistortRectifyMap(scaled_K, d, np.eye(3), newmtx, (w,h), cv2.CV_16SC2)
 
-def undistort(img, balance=0.0):
-    map1, map2 = undistort_maps(img, balance)
+    map_x, map_y = cv2.fisheye.initUndistortRectifyMap(scaled_K, d, np.eye(3), newmtx, (w,h), cv2.CV_32FC1)
+    if crop is not None:
+        top, bottom = crop
+        map_x, map_y = map_x[top:bottom], map_y[top:bottom]
+    if size is not None:
+        map_x = cv2.resize(map_x, tuple(size), interpolation=cv2.INTER_LINEAR)
+        map_y = cv2.resize(map_y, tuple(size), interpolation=cv2.INTER_LINEAR)
+    return cv2.convertMaps(np.ascontiguousarray(map_x), np.ascontiguousarray(map_y), cv2.CV_16SC2)
+
+def undistort(img, balance=0.0, dim=None, k=None, d=None, crop=None, size=None):
+    map1, map2 = undistort_maps(img, balance, dim, k, d, crop, size)
     return cv2.remap(img, map1, map2, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
 
+def save_profile(path, dim, k, d, maps=()):
+    """
+    Save a calibration to a .npz profile, with the undistortion maps
+    precomputed for each (width, height, balance, crop, size) in maps.
+    """
+    k = np.asarray(k, dtype=np.float64)
+    d = np.asarray(d, dtype=np.float64)
+    arrays = {'dim': np.array(dim), 'K': k, 'D': d}
+    specs = []
+    for i, (w, h, balance, crop, size) in enumerate(maps):
+        map1, map2 = compute_undistort_maps(w, h, balance, dim, k, d, crop, size)
+        arrays['map1_%d' % i] = map1
+        arrays['map2_%d' % i] = map2
+        specs.append([w, h, balance, crop, size])
+    arrays['maps'] = np.array(json.dumps(specs))
+    np.savez(path, **arrays)
+
+def load_profile(path, activate=True):
+    """
+    Load a calibration profile saved by save_profile and return its
+    (DIM, K, D). The maps it holds are added to the cache, and with
+    activate the calibration becomes the one used by default.
+    """
+    global DIM, K, D
+    with np.load(os.path.expanduser(path)) as profile:
+        dim = tuple(int(v) for v in profile['dim'])
+        k = profile['K']
+        d = profile['D']
+        specs = json.loads(str(profile['maps']))
+        for i, (w, h, balance, crop, size) in enumerate(specs):
+            key = maps_key(w, h, balance, dim, k, d, crop, size)
+            _maps[key] = (profile['map1_%d' % i], profile['map2_%d' % i])
+    if activate:
+        DIM, K, D = dim, k, d
+    return dim, k, d
+
 if __name__ == '__main__':
     for p in sys.argv[1:]:
         cv2.imshow('undistorted', undistort(cv2.imread(p), balance=0.5))
@@ -7,8 +7,13 @@ Created on Sun Jun 25 10:44:24 2017
 """
 
 import time
+from functools import partial
 from threading import Thread
 from .memory import Memory
+from .scheduler import LoopScheduler
+from .profiler import Profiler
+from .stages import build_stages, StageExecutor
+from .process import ProcessPart
 
 
 class Vehicle():
@@ -20,10 +25,19 @@ class Vehicle():
         self.parts = []
         self.on = True
         self.threads = []
+        self.scheduler = None
+        self.profiler = Profiler()
+        self.stages = None
+        self.executor = None
+        self.loop_count = 0
+        self.plan = []
+        self.stage_plan = None
 
 
     def add(self, part, inputs=[], outputs=[], 
-            threaded=False, run_condition=None):
+            threaded=False, run_condition=None, rate_hz=None, every=None,
+            process=False, shapes=None, on_change=None, timestamp=None,
+            in_place=False):
         """
         Method to add a part to the vehicle drive loop.
 
@@ -35,25 +49,83 @@ class Vehicle():
                 Channel names to save to memory.
             threaded : boolean
                 If a part should be run in a separate thread.
+            rate_hz : float
+                Frequency to run the part at when it should run less often
+                than the drive loop. Rounded to a whole number of loops.
+            every : int
+                Run the part only every `every` loops. Overrides rate_hz.
+            process : boolean
+                Run the part, and its update loop if it is threaded, in a
+                separate process so it isn't held back by the GIL.
+            shapes : dict
+                For parts run in a process, the shape, or (shape, dtype),
+                of array channels such as images. These are passed through
+                shared memory instead of being pickled.
+            on_change : list or boolean
+                Only run the part when one of these channels has changed
+                since it last ran, or any of its inputs when True. Useful to
+                skip inference when the camera hasn't produced a new frame.
+                A channel changes when its part outputs a different object
+                than last time. Parts that update an array in place and
+                return it every time, like ImgFIFO, need in_place=True.
+            timestamp : str
+                Channel to publish the capture time of the frame the
+                part's outputs were derived from, e.g. 'cam/timestamp'.
+            in_place : boolean
+                The part updates its outputs in place and returns the same
+                objects every time, like ImgFIFO or RPLidar. Its outputs then
+                count as changed every time it runs.
         """
 
         p = part
         print('Adding part {}.'.format(p.__class__.__name__))
         entry={}
         entry['part'] = p
+        entry['name'] = self.part_name(p)
         entry['inputs'] = inputs
         entry['outputs'] = outputs
         entry['run_condition'] = run_condition
+        entry['rate_hz'] = rate_hz
+        entry['every'] = every
+        entry['divisor'] = 1
+        entry['phase'] = 0
+        entry['on_change'] = on_change
+        entry['timestamp'] = timestamp
+        entry['in_place'] = in_place
 
-        if threaded:
+        if process:
+            entry['part'] = ProcessPart(part, inputs, outputs,
+                                        threaded=threaded, shapes=shapes)
+            entry['process'] = True
+
+        if threaded and not process:
             t = Thread(target=part.update, args=())
             t.daemon = True
             entry['thread'] = t
+        elif threaded:
+            #the process runs the update loop, the drive loop only needs
+            #to know to call run_threaded
+            entry['thread'] = None
+            entry['threaded'] = True
 
         self.parts.append(entry)
 
+    def part_name(self, part):
+        """
+        Unique name used to report on a part, the class name with a
+        counter appended when the same class is added more than once.
+        """
+        name = part.__class__.__name__
+        names = [entry['name'] for entry in self.parts]
+        if name not in names:
+            return name
+        i = 2
+        while '{}_{}'.format(name, i) in names:
+            i += 1
+        return '{}_{}'.format(name, i)
+
 
-    def start(self, rate_hz=10, max_loop_count=None):
+    def start(self, rate_hz=10, max_loop_count=None, overrun='skip', workers=0):
         """
         Start vehicle's main drive loop.
 
@@ -70,12 +142,24 @@ class Vehicle():
         max_loop_count : int
             Maxiumum number of loops the drive loop should execute. This is
             used for testing the all the parts of the vehicle work.
+        overrun : str
+            What to do when a loop takes longer than its period. 'skip'
+            drops the missed ticks, 'catch_up' runs them back to back.
+        workers : int
+            Number of threads used to run parts that don't share any
+            channels at the same time. With 0 parts run one after another.
+            Only use this when parts don't share state outside of memory.
         """
 
         try:
 
             self.on = True
 
+            #fork the process parts before any thread is started
+            for entry in self.parts:
+                if entry.get('process'):
+                    entry['part'].start()
+
             for entry in self.parts:
                 if entry.get('thread'):
                     #start the update thread
@@ -85,52 +169,221 @@ class Vehicle():
             print('Starting vehicle...')
             time.sleep(1)
 
-            loop_count = 0
+            if workers:
+                self.stages = build_stages(self.parts)
+                self.executor = StageExecutor(workers)
+                print('Running {} parts in {} stages on {} workers.'.format(
+                    len(self.parts), len(self.stages), workers))
+
+            self.scheduler = LoopScheduler(rate_hz, overrun=overrun)
+            self.schedule_parts()
+            self.compile()
+            self.scheduler.start()
+
+            self.loop_count = 0
+            last_start = self.scheduler.tick_start
             while self.on:
-                start_time = time.time()
-                loop_count += 1
-
-                for entry in self.parts:
-                    #don't run if there is a run condition that is False
-                    run = True
-                    if entry.get('run_condition'):
-                        run_condition = entry.get('run_condition')
-                        run = self.mem.get([run_condition])[0]
-                        #print('run_condition', entry['part'], entry.get('run_condition'), run)
-                    
-                    if run:
-                        p = entry['part']
-                        #get inputs from memory
-                        inputs = self.mem.get(entry['inputs'])
-    
-                        #run the part
-                        if entry.get('thread'):
-                            outputs = p.run_threaded(*inputs)
-                        else:
-                            outputs = p.run(*inputs)
-    
-                        #save the output to memory
-                        if outputs is not None:
-                            self.mem.put(entry['outputs'], outputs)
-    
-                    #stop drive loop if loop_count exceeds max_loopcount
-                    if max_loop_count and loop_count > max_loop_count:
-                        self.on = False
-    
-                    sleep_time = 1.0 / rate_hz - (time.time() - start_time)
-                    if sleep_time > 0.0:
-                        time.sleep(sleep_time)
+                self.loop_count += 1
+
+                self.update_parts()
+                self.profiler.record('loop/busy',
+                                     time.monotonic() - self.scheduler.tick_start)
+
+                #stop drive loop if loop_count exceeds max_loopcount
+                if max_loop_count and self.loop_count >= max_loop_count:
+                    self.on = False
+                else:
+                    tick_start = self.scheduler.wait()
+                    self.profiler.record('loop/period', tick_start - last_start)
+                    last_start = tick_start
 
         except KeyboardInterrupt:
             pass
         finally:
             self.stop()
 
+    def schedule_parts(self):
+        """
+        Work out which loops each part runs on. Parts running every n loops
+        are given different phases so they don't all run on the same loop.
+        """
+        phases = {}
+        for entry in self.parts:
+            every = entry['every']
+            if every is None:
+                every = self.scheduler.divisor(entry['rate_hz'])
+            elif every < 1:
+                raise ValueError('every must be at least 1, got {}'.format(every))
+            entry['divisor'] = every
+            entry['phase'] = phases.get(every, 0) % every
+            phases[every] = entry['phase'] + 1
+
+    def compile(self):
+        """
+        Build the execution plan of the drive loop. Each part becomes a
+        tuple holding its bound run method, functions that read its inputs
+        and save its outputs with the channels already resolved, and its
+        schedule, so running a part doesn't have to look anything up.
+        """
+        self.plan = []
+        #only trace frame latency when a part reports capture times
+        tracing = any(hasattr(e['part'], 'frame_time') for e in self.parts)
+        for entry in self.parts:
+            part = entry['part']
+            if entry.get('thread') or entry.get('threaded'):
+                call = part.run_threaded
+            else:
+                call = part.run
+
+            get = self.mem.getter(entry['inputs'])
+            put = None
+            if entry['outputs']:
+                put = self.mem.setter(entry['outputs'], entry['in_place'])
+            cond = None
+            if entry['run_condition']:
+                cond = self.mem.reader(entry['run_condition'])
+            record = self.profiler.histogram(entry['name']).add
+            changed = None
+            if entry['on_change']:
+                keys = entry['on_change']
+                if keys is True:
+                    keys = entry['inputs']
+                changed = self.mem.change_detector(keys)
+
+            trace = self.tracer(entry) if tracing else None
+
+            entry['step'] = (call, get, put, cond, changed,
+                             entry['divisor'], entry['phase'], record, trace)
+            self.plan.append(entry['step'])
+
+        if self.stages is not None:
+            self.stage_plan = [[e['step'] for e in stage] for stage in self.stages]
+
+    def update_parts(self):
+        """
+        Run every part once, in the order they were added or stage by
+        stage when the vehicle was started with workers.
+        """
+        if self.executor is not None:
+            self.executor.run(self.stage_plan, self.run_step)
+            return
+
+        tick = self.loop_count - 1
+        clock = time.perf_counter
+        for call, get, put, cond, changed, divisor, phase, record, trace in self.plan:
+            #don't run parts with a lower rate on the loops they skip
+            if divisor > 1 and tick % divisor != phase:
+                continue
+            #don't run if there is a run condition that is False
+            if cond is not None and not cond():
+                continue
+            #don't run if the part's trigger channels haven't changed
+            if changed is not None and not changed():
+                continue
+
+            start = clock()
+            outputs = call(*get())
+            record(clock() - start)
+
+            if outputs is not None and put is not None:
+                put(outputs)
+            if trace is not None:
+                trace(outputs)
+
+    def run_step(self, step):
+        """
+        Run a single part of the execution plan.
+        """
+        call, get, put, cond, changed, divisor, phase, record, trace = step
+        if divisor > 1 and (self.loop_count - 1) % divisor != phase:
+            return
+        if cond is not None and not cond():
+            return
+        if changed is not None and not changed():
+            return
+
+        start = time.perf_counter()
+        outputs = call(*get())
+        record(time.perf_counter() - start)
+
+        if outputs is not None and put is not None:
+            put(outputs)
+        if trace is not None:
+            trace(outputs)
+
+    def tracer(self, entry):
+        """
+        Return a function run after a part that passes the capture time of
+        the frame its inputs came from on to its outputs. Parts with a
+        frame_time, like cameras, are where frames originate. For parts
+        without outputs, such as actuators and tub writers, the age of the
+        frame they acted on is recorded as 'latency/<part name>'.
+        """
+        part = entry['part']
+        inputs, outputs = entry['inputs'], entry['outputs']
+        origins = self.mem.origins
+        publish = None
+        if entry['timestamp']:
+            publish = self.mem.setter([entry['timestamp']])
+
+        if hasattr(part, 'frame_time'):
+            origin = lambda: part.frame_time
+        elif inputs:
+            origin = partial(self.mem.origin, inputs)
+        else:
+            return None
+
+        if outputs:
+            def trace(values):
+                if values is None:
+                    return
+                t = origin()
+                if t is not None:
+                    for k in outputs:
+                        origins[k] = t
+                    if publish is not None:
+                        publish(t)
+        else:
+            record = self.profiler.histogram('latency/' + entry['name']).add
+            def trace(values):
+                t = origin()
+                if t is not None:
+                    record(time.time() - t)
+        return trace
+
+    def latency(self):
+        """
+        Percentiles of the age in seconds of the camera frame each part
+        without outputs acted on, keyed by part name.
+        """
+        return {name[len('latency/'):]: s for name, s in self.profile().items()
+                if name.startswith('latency/')}
+
+    def loop_stats(self):
+        """
+        Timing statistics of the drive loop: tick jitter against the
+        scheduled deadlines, overruns, skipped ticks and the measured rate.
+        """
+        if self.scheduler is None:
+            return {}
+        return self.scheduler.stats.summary()
+
+    def profile(self):
+        """
+        Latency percentiles in seconds of each part's run or run_threaded
+        call, keyed by part name, plus the drive loop period ('loop/period')
+        and the time spent running parts each loop ('loop/busy').
+        """
+        return self.profiler.summary()
+
     def stop(self):
         print('Shutting down vehicle and its parts...')
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
         for entry in self.parts:
             try:
                 entry['part'].shutdown()
             except Exception as e:
                 print(e)
-        print(self.mem.d)
+        print(self.profiler.report())
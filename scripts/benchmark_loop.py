@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Measure the overhead the drive loop adds to each part it runs.
+
+Usage:
+    benchmark_loop.py [--parts=<n>] [--loops=<n>] [--slots] [--frames]
+
+Options:
+    --parts=<n>   Number of parts in the vehicle. [default: 8]
+    --loops=<n>   Number of loops to time. [default: 20000]
+    --slots       Use SlotMemory instead of Memory.
+    --frames      Add a camera giving a new 120x160 frame every other loop
+                  and a part reading it.
+"""
+import time
+import numpy as np
+from docopt import docopt
+
+from donkeycar.vehicle import Vehicle
+from donkeycar.memory import Memory, SlotMemory
+from donkeycar.scheduler import LoopScheduler
+
+
+class Noop:
+    def run(self, *args):
+        return 0.0, 0.0
+
+
+class FrameSource:
+    '''
+    A camera slower than the drive loop, returning the same frame on every
+    other loop.
+    '''
+    def __init__(self):
+        self.frames = [np.zeros((120, 160, 3), dtype=np.uint8) for _ in range(2)]
+        self.calls = 0
+
+    def run(self):
+        self.calls += 1
+        return self.frames[(self.calls // 2) % 2]
+
+
+class FrameSink:
+    def run(self, img):
+        return None
+
+
+def interpreted_loop(v):
+    '''
+    The drive loop as it was before parts were compiled into a plan,
+    kept here as the baseline.
+    '''
+    for entry in v.parts:
+        if entry['divisor'] > 1 and (v.loop_count - 1) % entry['divisor'] != entry['phase']:
+            continue
+        run = True
+        if entry.get('run_condition'):
+            run = v.mem.get([entry.get('run_condition')])[0]
+        if run:
+            p = entry['part']
+            inputs = v.mem.get(entry['inputs'])
+            start = time.perf_counter()
+            if entry.get('thread') or entry.get('threaded'):
+                outputs = p.run_threaded(*inputs)
+            else:
+                outputs = p.run(*inputs)
+            v.profiler.record(entry['name'], time.perf_counter() - start)
+            if outputs is not None:
+                v.mem.put(entry['outputs'], outputs)
+
+
+def make_vehicle(n_parts, slots, frames=False):
+    if slots:
+        channels = {'ch{}'.format(i): 'float' for i in range(2 * n_parts + 2)}
+        channels['run'] = 'boolean'
+        channels['img'] = (120, 160, 3)
+        mem = SlotMemory(channels)
+    else:
+        mem = Memory()
+    v = Vehicle(mem=mem)
+    v.mem.put(['run', 'ch0', 'ch1'], (True, 0.0, 0.0))
+    for i in range(n_parts):
+        v.add(Noop(),
+              inputs=['ch{}'.format(2 * i), 'ch{}'.format(2 * i + 1)],
+              outputs=['ch{}'.format(2 * i + 2), 'ch{}'.format(2 * i + 3)],
+              run_condition='run' if i % 2 else None)
+    if frames:
+        v.add(FrameSource(), outputs=['img'])
+        v.add(FrameSink(), inputs=['img'])
+    v.scheduler = LoopScheduler(20)
+    v.schedule_parts()
+    v.compile()
+    return v
+
+
+def time_loop(v, loop, loops):
+    start = time.perf_counter()
+    for i in range(loops):
+        v.loop_count = i + 1
+        loop()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    n_parts = int(args['--parts'])
+    loops = int(args['--loops'])
+    v = make_vehicle(n_parts, args['--slots'], args['--frames'])
+
+    #time an empty run to subtract the cost of the parts themselves
+    calls = [(e['part'].run, (0.0,) * len(e['inputs'])) for e in v.parts]
+    start = time.perf_counter()
+    for _ in range(loops):
+        for run, inputs in calls:
+            run(*inputs)
+    bare = time.perf_counter() - start
+
+    before = time_loop(v, lambda: interpreted_loop(v), loops)
+    after = time_loop(v, v.update_parts, loops)
+
+    per_part = lambda t: (t - bare) / (loops * len(calls)) * 1e6
+    print('{} parts, {} loops, {}'.format(len(calls), loops, type(v.mem).__name__))
+    print('interpreted loop: {:.2f} us overhead per part'.format(per_part(before)))
+    print('compiled plan:    {:.2f} us overhead per part'.format(per_part(after)))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Measure the inference latency per frame of a keras pilot on the CPU, through
+model.predict as the pilots used to and through the compiled function they
+use now, one frame per call and a batch of frames per call.
+
+Usage:
+    benchmark_pilot.py [--model=<path>] [--linear] [--frames=<n>] [--batch=<n>]
+
+Options:
+    --model=<path>  Model to load, else an untrained default model.
+    --linear        Use KerasLinear instead of KerasCategorical.
+    --frames=<n>    Number of frames to time. [default: 500]
+    --batch=<n>     Frames per call when batching, like one per camera. [default: 2]
+"""
+import os
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '')
+
+import time
+import numpy as np
+from docopt import docopt
+
+from donkeycar.parts.ml.keras import KerasCategorical, KerasLinear
+
+
+def time_predict(pilot, frames, batch_size):
+    '''
+    Return the mean and 99th percentile latency per frame, in ms.
+    '''
+    times = []
+    for start in range(0, len(frames) - batch_size + 1, batch_size):
+        batch = frames[start:start + batch_size]
+        t = time.perf_counter()
+        pilot.predict(batch)
+        times.append((time.perf_counter() - t) / batch_size)
+    times = np.array(times) * 1000
+    return times.mean(), np.percentile(times, 99)
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    n = int(args['--frames'])
+    batch_size = int(args['--batch'])
+
+    cls = KerasLinear if args['--linear'] else KerasCategorical
+    pilot = cls()
+    if args['--model']:
+        pilot.load(args['--model'])
+
+    shape = tuple(pilot.model.inputs[0].shape.as_list()[1:])
+    frames = np.random.randint(0, 255, size=(n,) + shape).astype(np.uint8)
+
+    print('{:<28} {:>10} {:>10}'.format('', 'mean ms', 'p99 ms'))
+    for compiled in (False, True):
+        pilot.compiled = compiled
+        name = 'compiled' if compiled else 'model.predict'
+        for size in (1, batch_size):
+            #warm up, the first calls build the graph functions
+            time_predict(pilot, frames[:size * 10], size)
+            mean, p99 = time_predict(pilot, frames, size)
+            label = '{}, {} per call'.format(name, size)
+            print('{:<28} {:>10.2f} {:>10.2f}'.format(label, mean, p99))
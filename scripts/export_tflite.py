@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Export a trained keras pilot to a quantized TensorFlow Lite model and report
+how its accuracy and inference latency compare to the keras model on the
+records of some tubs.
+
+Usage:
+    export_tflite.py <model> [--out=<path>] [--quantize=<int8>] [--tub=<tub1,tub2,..tubn>] [--records=<n>] [--threads=<n>]
+
+Options:
+    --out=<path>          Model to write, the keras model path with a .tflite extension by default.
+    --quantize=<int8>     int8, float16 or none. int8 needs --tub. [default: int8]
+    --tub=<tub1,tub2>     Tubs to calibrate int8 ranges on and to report against.
+    --records=<n>         Records of the tubs used for the report. [default: 500]
+    --threads=<n>         Threads the TensorFlow Lite interpreter uses. [default: 1]
+"""
+import os
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '')
+
+import glob
+import time
+import numpy as np
+from docopt import docopt
+
+from donkeycar.parts.ml.pilot import interpret
+from donkeycar.parts.ml.tflite import (export_tflite, representative_images,
+                                       spread_records, TFLitePilot)
+
+
+def tub_paths(tubs):
+    paths = []
+    for path in tubs.split(','):
+        paths += sorted(glob.glob(os.path.expanduser(path)))
+    return paths
+
+
+def evaluate(predict, images, angles, throttles):
+    '''
+    Run predict on each image, one frame per call as when driving, and
+    return the mean absolute errors and the latency per frame in ms.
+    '''
+    times = []
+    predicted = []
+    for img in images:
+        start = time.perf_counter()
+        outputs = predict(img[None].astype(np.float32))
+        times.append(time.perf_counter() - start)
+        predicted.append(interpret(outputs, 0))
+    predicted = np.array(predicted, dtype=float)
+    times = np.array(times) * 1000
+    return {
+        'angle_mae': np.abs(predicted[:, 0] - angles).mean(),
+        'throttle_mae': np.abs(predicted[:, 1] - throttles).mean(),
+        'ms': times.mean(),
+        'p99_ms': np.percentile(times, 99),
+        'angles': predicted[:, 0],
+    }
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    model_path = os.path.expanduser(args['<model>'])
+    out_path = args['--out'] or os.path.splitext(model_path)[0] + '.tflite'
+    paths = tub_paths(args['--tub']) if args['--tub'] else []
+
+    representative = representative_images(paths) if paths else None
+    export_tflite(model_path, out_path, args['--quantize'], representative)
+    print('saved', out_path)
+    if not paths:
+        raise SystemExit
+
+    spread = spread_records(paths, int(args['--records']))
+    records = [tub.get_record(ix) for tub, ix in spread]
+    images = [r['cam/image_array'] for r in records]
+    angles = np.array([r['user/angle'] for r in records], dtype=float)
+    throttles = np.array([r['user/throttle'] for r in records], dtype=float)
+
+    import keras
+    model = keras.models.load_model(model_path)
+    pilot = TFLitePilot(out_path, num_threads=int(args['--threads']))
+
+    results = [('keras', os.path.getsize(model_path),
+                evaluate(lambda x: model.predict(x), images, angles, throttles)),
+               ('tflite ' + args['--quantize'], os.path.getsize(out_path),
+                evaluate(pilot.predict, images, angles, throttles))]
+
+    print('{} records'.format(len(records)))
+    print('{:<14} {:>9} {:>10} {:>13} {:>8} {:>8} {:>7}'.format(
+        'model', 'size KB', 'angle MAE', 'throttle MAE', 'ms', 'p99 ms', 'Hz'))
+    for name, size, r in results:
+        print('{:<14} {:>9.0f} {:>10.4f} {:>13.4f} {:>8.2f} {:>8.2f} {:>7.1f}'.format(
+            name, size / 1024, r['angle_mae'], r['throttle_mae'],
+            r['ms'], r['p99_ms'], 1000 / r['ms']))
+    agree = np.abs(results[0][2]['angles'] - results[1][2]['angles']).mean()
+    print('mean angle difference between the models: {:.4f}'.format(agree))